@@ -6,7 +6,15 @@ Author = {"name": "Thomas Moore", "affiliation": "CSIRO", "email": "thomas.moore
 """
 # Standard library imports
 import os
+import re
+import json
+import time
+import inspect
+import functools
 import datetime
+import pathlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 
 # Third-party imports
@@ -14,29 +22,354 @@ import datetime
 import intake_esm
 import xarray as xr
 import numpy as np
+import pandas as pd
 from tabulate import tabulate
+from xarray.backends import NetCDF4BackendEntrypoint
 
 # Local application imports (if needed)
-#from .my_local_module import my_function
+from .make_data import ZARR_MANIFEST_SUFFIX
 
-def load_ACCESS_ESM_ensemble(catalog_search,use_cftime=False,chunking_settings=None,chunking_key=None,drop_extra_variables=True,drop_list=['vertices_longitude', 'vertices_latitude', 'time_bnds']):
+def _time_token(value, end=False):
     """
-    Load the ACCESS-ESM ensemble data from an esm_datastore.
+    Sortable 14-digit YYYYMMDDhhmmss form of a CMIP time_range token ('1850', '185001', '18500116', '185001161200')
+    or a date string ('2050-01-01'), padded to the first instant - or with end=True the last instant - it covers.
+    Comparing these strings needs no calendar, so it works for any cftime calendar.
+    """
+    digits = re.sub(r'\D', '', str(value))
+    if not 4 <= len(digits) <= 14:
+        raise ValueError(f"Cannot read the time '{value}'!!!")
+    # day 31 sorts after every day of a month, so an end month needs no calendar
+    padding = '1231235959' if end else '0101000000'
+    return digits + padding[len(digits) - 4:]
+
+@functools.lru_cache(maxsize=4096)
+def _file_time_extent(path):
+    """
+    First and last time of a file as _time_token strings, read from its time coordinate (cached per path).
+    """
+    with xr.open_dataset(path, use_cftime=True, chunks=None) as ds:
+        times = ds['time'].values
+        return _time_token(times[0].strftime('%Y%m%d%H%M%S')), _time_token(times[-1].strftime('%Y%m%d%H%M%S'), end=True)
+
+def trim_catalog_time(catalog_search, start=None, end=None):
+    """
+    Drop the files of an esm_datastore that lie entirely outside a time window, before anything is opened.
+
+    The time extent of each file comes from the 'time_range' column (e.g. '201501-210012'), or, where that is
+    missing, from the time coordinate of the file (read once and cached). Files without a time axis are kept.
+
+    Parameters
+    ----------
+    catalog_search : intake_esm.core.esm_datastore object -  This will come from filtering an intake catalog.
+    start : str - Start of the window, e.g. '2050' or '2050-01-01'. The default is None, no start.
+    end : str - End of the window (inclusive), e.g. '2100-12-31'. The default is None, no end.
+
+    Returns
+    -------
+    catalog_trimmed : intake_esm.core.esm_datastore object - The catalog search without the files outside the window.
+
+    """
+    if not isinstance(catalog_search, intake_esm.core.esm_datastore):
+        raise TypeError("catalog_search must be an instance of intake_esm.core.esm_datastore!!! Did catalog_search come from filtering an intake catalog?")
+    window_start = _time_token(start) if start else '0' * 14
+    window_end = _time_token(end, end=True) if end else '9' * 14
+    df = catalog_search.df
+    keep = np.ones(len(df), dtype=bool)
+    for row, (path, time_range) in enumerate(zip(df['path'], df['time_range'] if 'time_range' in df else [None] * len(df))):
+        if isinstance(time_range, str) and '-' in time_range:
+            file_start, file_end = time_range.split('-', 1)
+            file_start, file_end = _time_token(file_start), _time_token(file_end, end=True)
+        else:
+            try:
+                file_start, file_end = _file_time_extent(path)
+            except (KeyError, OSError, ValueError):
+                continue  # no time axis to trim
+        keep[row] = file_start <= window_end and file_end >= window_start
+    catalog_trimmed = catalog_search.__class__({'esmcat': catalog_search.esmcat.model_dump(), 'df': df[keep].reset_index(drop=True)})
+    catalog_trimmed.esmcat.catalog_file = None
+    print(f"Time window {start} to {end}: kept {keep.sum()} of {len(keep)} files")
+    return catalog_trimmed
+
+def _trim_time(ds, start=None, end=None):
+    """
+    Per-file preprocess for to_dataset_dict: the fine-grained time slice.
+    """
+    return ds.sel(time=slice(start, end)) if 'time' in ds.dims else ds
+
+def _time_trim_window(time_trim):
+    """
+    (start, end) of a job_config.yaml time_trim block {'enabled': ..., 'start': ..., 'end': ...}, or None.
+    """
+    if not time_trim or not time_trim.get('enabled', True):
+        return None
+    start, end = time_trim.get('start') or None, time_trim.get('end') or None
+    return None if start is None and end is None else (start, end)
+
+def _variable_paths(df):
+    """
+    (variable_id, paths in time order) for each variable of the files of one dataset.
+    """
+    order = ['time_range', 'path'] if 'time_range' in df.columns else ['path']
+    return [(variable_id, list(variable_df.sort_values(order)['path'])) for variable_id, variable_df in df.groupby('variable_id', sort=False)]
+
+# netCDF-C/HDF5 are not thread safe, and xarray locks only the file handle, not the header read that follows
+_NETCDF_OPEN_LOCK = threading.Lock()
+
+class _LockedNetCDF4BackendEntrypoint(NetCDF4BackendEntrypoint):
+    """
+    The netCDF4 engine with each file open, header read and decode serialised by _NETCDF_OPEN_LOCK, so members can be
+    opened from several threads. Data reads are still locked by xarray itself.
+    """
+    open_dataset_parameters = tuple(inspect.signature(NetCDF4BackendEntrypoint.open_dataset).parameters)[1:]
+
+    def open_dataset(self, filename_or_obj, **kwargs):
+        with _NETCDF_OPEN_LOCK:
+            return super().open_dataset(filename_or_obj, **kwargs)
+
+def _open_member(catalog_search, member_df, xarray_open_kwargs, preprocess=None):
+    """
+    Open the files of one member into one dataset with intake-esm, returning the dataset and the seconds taken.
+    """
+    start = time.perf_counter()
+    member_search = catalog_search.__class__({'esmcat': catalog_search.esmcat.model_dump(), 'df': member_df.reset_index(drop=True)})
+    dataset_dict = member_search.to_dataset_dict(progressbar=False, xarray_open_kwargs=dict(xarray_open_kwargs),
+                                                 preprocess=preprocess, threaded=False)
+    if len(dataset_dict) != 1:
+        raise ValueError(f"Expected one dataset for member {member_df['member_id'].iloc[0]}, got {len(dataset_dict)}!!!")
+    return next(iter(dataset_dict.values())), time.perf_counter() - start
+
+# CMIP6 variant labels r<realization>i<initialization>p<physics>f<forcing>
+MEMBER_ID_RE = re.compile(r'^r(\d+)i(\d+)p(\d+)f(\d+)$')
+MEMBER_LEVELS = ('realization', 'initialization', 'physics', 'forcing')
+
+def member_index(member_ids):
+    """
+    Parse CMIP6 member ids ('r10i1p1f1') into a DataFrame of integer realization, initialization, physics and
+    forcing levels, indexed by member id and sorted by (realization, initialization, physics, forcing).
+    """
+    parsed = []
+    for member_id in member_ids:
+        match = MEMBER_ID_RE.match(str(member_id))
+        if match is None:
+            raise ValueError("The member names are not in the format 'r[integer 1-99]i[integer 1-99]p[integer 1-99]f[integer 1-99]'!!!")
+        parsed.append([str(member_id)] + [int(level) for level in match.groups()])
+    index = pd.DataFrame(parsed, columns=['member_id'] + list(MEMBER_LEVELS)).set_index('member_id')
+    return index.sort_values(list(MEMBER_LEVELS), kind='stable')
+
+def _member_mask(levels, selection):
+    """
+    Boolean mask of the members whose levels match a selection {level: value, list of values or inclusive slice}.
+    """
+    unknown = [level for level in selection if level not in MEMBER_LEVELS]
+    if unknown:
+        raise ValueError(f"The member levels {unknown} are not in {MEMBER_LEVELS}!!!")
+    mask = np.ones(len(levels), dtype=bool)
+    for level, value in selection.items():
+        values = np.asarray(levels[level])
+        if isinstance(value, slice):
+            if value.step not in (None, 1):
+                raise ValueError("Member slices do not take a step!!!")
+            mask &= (values >= (value.start if value.start is not None else values.min())) & \
+                    (values <= (value.stop if value.stop is not None else values.max()))
+        elif isinstance(value, (list, tuple, np.ndarray)):
+            mask &= np.isin(values, value)
+        else:
+            mask &= values == value
+    return mask
+
+def select_members(ds, **selection):
+    """
+    Select ensemble members by label on the integer realization, initialization, physics and forcing coordinates
+    added by load_ACCESS_ESM_ensemble, with inclusive slices as in .sel.  A contiguous run of members is taken with a
+    slice, so no fancy-indexing layer is added to a dask-backed dataset.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset - An ensemble from load_ACCESS_ESM_ensemble.
+    **selection : level=value, level=[values] or level=slice(start, stop), e.g. realization=slice(1, 10).
+
+    Returns
+    -------
+    ds_selected : xarray.Dataset - The selected members.
+
+    """
+    if all(level in ds.coords for level in MEMBER_LEVELS):
+        levels = pd.DataFrame({level: ds[level].values for level in MEMBER_LEVELS})
+    else:
+        levels = member_index(ds['member'].values).loc[ds['member'].values]
+    positions = np.flatnonzero(_member_mask(levels, selection))
+    if len(positions) and positions[-1] - positions[0] + 1 == len(positions):
+        return ds.isel(member=slice(positions[0], positions[-1] + 1))
+    return ds.isel(member=positions)
+
+# kerchunk-style virtual reference indexes of the raw NetCDF4/HDF5 files
+REFERENCE_INDEX_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'ACDtools', 'references')
+
+def _file_stat(path):
+    """
+    The mtime and size of a file, which invalidate its references when they change.
+    """
+    stat = os.stat(path)
+    return {'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+
+def _translate_file(path):
+    """
+    (stat, references) of one NetCDF4/HDF5 file - the byte offset and length of every chunk of every variable.
+    """
+    from kerchunk.hdf import SingleHdf5ToZarr
+    stat = _file_stat(path)
+    return stat, SingleHdf5ToZarr(path, inline_threshold=500).translate()
+
+def _reference_dims(refs):
+    """
+    {variable: dimensions} of a set of references.
+    """
+    return {key.split('/')[0]: tuple(json.loads(value).get('_ARRAY_DIMENSIONS', []))
+            for key, value in refs['refs'].items() if key.count('/') == 1 and key.endswith('/.zattrs')}
+
+def _drop_references(refs, drop_variables):
+    """
+    The references without the variables in drop_variables, so they are never opened.
+    """
+    if not drop_variables:
+        return refs
+    return {**refs, 'refs': {key: value for key, value in refs['refs'].items() if key.split('/')[0] not in drop_variables}}
+
+def _combine_references(member_names, member_paths, file_refs):
+    """
+    Join the references of each member along time, merge its variables and stack the members along a new member
+    dimension. Variables without a time dimension, and every variable that is not requested (bounds, grid), are
+    taken from the first file as they are the same for all files and members. MultiZarrToZarr stores the members
+    sorted as strings (r1, r10, r11, r2, ...), not in the order of member_names.
+    """
+    from kerchunk.combine import MultiZarrToZarr
+    combined = []
+    for paths in member_paths:
+        merged = {'version': 1, 'refs': {}}
+        for _, variable_paths in paths:
+            dims = _reference_dims(file_refs[variable_paths[0]])
+            static = [name for name, name_dims in dims.items() if 'time' not in name_dims]
+            joined = MultiZarrToZarr([file_refs[path] for path in variable_paths], concat_dims=['time'], coo_map={'time': 'cf:time'},
+                                     identical_dims=static, remote_protocol='file').translate()
+            for key, value in joined['refs'].items():
+                merged['refs'].setdefault(key, value)
+        combined.append(merged)
+    variable_ids = {variable_id for paths in member_paths for variable_id, _ in paths}
+    shared = [name for name in _reference_dims(combined[0]) if name not in variable_ids]
+    return MultiZarrToZarr(combined, concat_dims=['member'], coo_map={'member': list(member_names)}, identical_dims=shared,
+                           remote_protocol='file').translate()
+
+def _build_reference_index(df, member_names, drop_variables=None, index_dir=None, max_workers=16, executor='thread', refresh=False):
+    """
+    Build, or read from the cache, the ensemble references of the files of df for the members in member_names.
+    """
+    import hashlib
+    index_dir = index_dir or REFERENCE_INDEX_DIR
+    member_paths = [_variable_paths(df[df['member_id'] == member_name]) for member_name in member_names]
+    paths = [path for member in member_paths for _, variable_paths in member for path in variable_paths]
+    key = hashlib.sha256(json.dumps([list(member_names), member_paths, sorted(drop_variables or [])]).encode()).hexdigest()[:16]
+    index_file = os.path.join(index_dir, f"{key}.refs.json")
+    cache = {}
+    if os.path.exists(index_file) and not refresh:
+        with open(index_file) as f:
+            cache = json.load(f)
+    stats = {path: _file_stat(path) for path in paths}
+    cached = cache.get('files', {})
+    stale = [path for path in paths if cached.get(path, {}).get('stat') != stats[path]]
+    if not stale and 'refs' in cache:
+        print(f"Read the reference index {index_file}")
+        return cache['refs']
+    pool = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+    with pool(max_workers=max_workers) as workers:
+        for path, (stat, refs) in zip(stale, workers.map(_translate_file, stale)):
+            cached[path] = {'stat': stat, 'refs': _drop_references(refs, drop_variables)}
+    print(f"Indexed {len(stale)} of {len(paths)} files")
+    refs = _combine_references(member_names, member_paths, {path: cached[path]['refs'] for path in paths})
+    os.makedirs(index_dir, exist_ok=True)
+    tmp_file = f"{index_file}.{os.getpid()}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump({'files': {path: cached[path] for path in paths}, 'refs': refs}, f)
+    os.replace(tmp_file, index_file)
+    print(f"Wrote the reference index {index_file}")
+    return refs
+
+def build_reference_index(catalog_search, drop_list=['vertices_longitude', 'vertices_latitude', 'time_bnds'], index_dir=None, max_workers=16,
+                          executor='thread', refresh=False):
+    """
+    Build and cache a kerchunk-style virtual Zarr reference index of an ACCESS-ESM ensemble: the byte offset and length
+    of every chunk of every file, joined along time and stacked along member, so the whole ensemble opens with
+    open_reference_index from a single metadata read instead of one header read per file.
+
+    The files are indexed in parallel. Each file's references are stored with its mtime and size, and only files that
+    are new or whose mtime or size has changed are indexed again.
+
+    Parameters
+    ----------
+    catalog_search : intake_esm.core.esm_datastore object -  This will come from filtering an intake catalog that contains the ACCESS-ESM ensemble data.
+    drop_list : list - Variables left out of the index. The default is ['vertices_longitude', 'vertices_latitude', 'time_bnds'].
+    index_dir : str - The cache directory of the indexes. The default is None, REFERENCE_INDEX_DIR (~/.cache/ACDtools/references).
+    max_workers : int - The number of files indexed at once. The default is 16.
+    executor : str - 'thread' or 'process'. The default is 'thread'.
+    refresh : bool - Index every file again. The default is False.
+
+    Returns
+    -------
+    refs : dict - The kerchunk (version 1) references of the ensemble.
+
+    """
+    if not isinstance(catalog_search, intake_esm.core.esm_datastore):
+        raise TypeError("catalog_search must be an instance of intake_esm.core.esm_datastore!!! Did catalog_search come from filtering an intake catalog?")
+    df = catalog_search.df
+    member_names = list(member_index(df['member_id'].unique()).index)
+    return _build_reference_index(df, member_names, drop_variables=drop_list, index_dir=index_dir, max_workers=max_workers,
+                                  executor=executor, refresh=refresh)
+
+def open_reference_index(refs, **xarray_open_kwargs):
+    """
+    Open kerchunk references, e.g. from build_reference_index, lazily as one Zarr-backed dataset. xarray_open_kwargs
+    go to xarray.open_dataset; the default chunks={} follows the storage chunks of the files. The members are sorted
+    as strings; select them with .sel(member=...) to put them in another order.
+    """
+    xarray_open_kwargs = {'chunks': {}, **xarray_open_kwargs}
+    return xr.open_dataset('reference://', engine='zarr', backend_kwargs={'consolidated': False, 'storage_options': {'fo': refs, 'remote_protocol': 'file'}},
+                           **xarray_open_kwargs)
+
+def load_ACCESS_ESM_ensemble(catalog_search,use_cftime=False,chunking_settings=None,chunking_key=None,drop_extra_variables=True,drop_list=['vertices_longitude', 'vertices_latitude', 'time_bnds'],access_pattern='time-series',memory_budget='1GB',time_trim=None,max_workers=8,members=None,reference_index=False,index_dir=None):
+    """
+    Load the ACCESS-ESM ensemble data from an esm_datastore.  The variables in drop_list are dropped as each file is
+    opened, so they are never decoded or put in the graph. The members are opened max_workers at a time in a thread pool;
+    netCDF4/HDF5 is not thread safe, so the file opens themselves take turns while the decoding, dask graph building
+    and combining of each member run concurrently.
 
     Parameters
     ----------
     catalog_search : intake_esm.core.esm_datastore object -  This will come from filtering an intake catalog that contains the ACCESS-ESM ensemble data.
     chunking_settings : dict - A dictionary containing the chunking settings for the dataset. The default is None.
+    chunking_key : str - A key of the chunking settings in config.yaml, or 'auto' to plan the chunks from the storage chunking of the files with plan_chunks. The default is None.
     drop_extra_variables : bool - A flag to drop extra variables that are not the primary variable. The default is True.
+    access_pattern : str - The access pattern used by chunking_key='auto': 'time-series', 'map' or 'profile'. The default is 'time-series'.
+    memory_budget : int or str - The per-worker memory budget used by chunking_key='auto'. The default is '1GB'.
+    time_trim : dict - The time_trim block of job_config.yaml, {'enabled': True, 'start': ..., 'end': ...}. Files outside the window are dropped before opening (trim_catalog_time) and the rest are sliced as they are opened. The default is None, no trimming.
+    max_workers : int - The number of members opened at once, or of files indexed at once when reference_index=True. The default is 8.
+    members : dict - Open only these members, selected by level as in select_members, e.g. {'realization': slice(1, 10)}. The default is None, all members.
+    reference_index : bool - Open the ensemble from a cached virtual Zarr reference index (see build_reference_index), built or updated first where files are new or have changed. The default is False.
+    index_dir : str - The cache directory of the reference indexes. The default is None, REFERENCE_INDEX_DIR.
 
     Returns
     -------
-    ds_sorted : xarray.Dataset - The concatenated dataset with the ACCESS-ESM ensemble data labelled and sorted based on the member names.
+    ds_sorted : xarray.Dataset - The concatenated dataset with the ACCESS-ESM ensemble data labelled and sorted based on the member names,
+        with integer realization, initialization, physics and forcing coordinates along member.
 
     """
     # check if the catalog_search is an esm_datastore object, specifically intake_esm.core.esm_datastore
     if not isinstance(catalog_search, intake_esm.core.esm_datastore):
         raise TypeError("catalog_search must be an instance of intake_esm.core.esm_datastore!!! Did catalog_search come from filtering an intake catalog?")
+    # push the time window down to the file selection
+    time_window = _time_trim_window(time_trim)
+    preprocess = None
+    if time_window is not None:
+        catalog_search = trim_catalog_time(catalog_search, *time_window)
+        preprocess = functools.partial(_trim_time, start=time_window[0], end=time_window[1])
     # check if the catalog_search contains ACCESS-ESM ensemble data
     # is there one and only one source_id in the catalog_search?
     if len(catalog_search.df['source_id'].unique()) != 1:
@@ -49,14 +382,17 @@ def load_ACCESS_ESM_ensemble(catalog_search,use_cftime=False,chunking_settings=N
         raise ValueError("The catalog_search must contain at least 2 ensembles!!!")
     # Get the dictionary of datasets and the corresponding keys (member names)
     # if chunking_key is provided, use it to load the dataset
-    if chunking_key:
+    if chunking_key == 'auto':
+        xarray_open_kwargs = plan_chunks(catalog_search, access_pattern=access_pattern, memory_budget=memory_budget)
+        print(f"Loading the dataset using the planned chunking settings: {xarray_open_kwargs}")
+    elif chunking_key:
         from .util import load_config
         config = load_config() # Load the configuration file from yaml
-        xarray_open_kwargs = config['chunking'][chunking_key]
+        xarray_open_kwargs = dict(config['chunking'][chunking_key])
         print(f"Loading the dataset using the chunking settings for '{chunking_key}' from the configuration file: {xarray_open_kwargs}")
     # if chunking_settings is provided, use it to load the dataset
     elif chunking_settings:
-        xarray_open_kwargs = chunking_settings
+        xarray_open_kwargs = dict(chunking_settings)
         print(f"Loading the dataset using the provided chunking settings: {xarray_open_kwargs}")
     else:
         xarray_open_kwargs = {}
@@ -64,37 +400,63 @@ def load_ACCESS_ESM_ensemble(catalog_search,use_cftime=False,chunking_settings=N
     if use_cftime:
         xarray_open_kwargs['use_cftime'] = use_cftime
         print("Loading the dataset with cftime = {}".format(use_cftime))
-    dataset_dict = catalog_search.to_dataset_dict(progressbar=False,xarray_open_kwargs=xarray_open_kwargs)
-    # Drop extra variables that are not the primary variable if condition is True
-    if drop_extra_variables:
-        dataset_dict_clean = {key: ds.drop_vars(drop_list, errors='ignore') 
-            for key, ds in dataset_dict.items()}
-        dataset_dict = dataset_dict_clean
-    # check that the member names are unique
-    if len(dataset_dict.keys()) != len(set([key.split('.')[5] for key in dataset_dict.keys()])):
+    df = catalog_search.df
+    # check that the member names are unique - one dataset per member
+    groupby_attrs = catalog_search.esmcat.aggregation_control.groupby_attrs if catalog_search.esmcat.aggregation_control else ['member_id']
+    dataset_attrs = [attr for attr in groupby_attrs if attr in df.columns and attr != 'variable_id']
+    if df.groupby(dataset_attrs, sort=False).ngroups != df['member_id'].nunique():
         raise ValueError("The member names are not unique!!!")
-    # Extract the member names from the keys
-    member_names = [key.split('.')[5] for key in dataset_dict.keys()]  # Extract 'r9i1p1f1' as the member name from each key
-    # check that the member names are in the format 'r[integer 1-99]i[integer 1-99]p[integer 1-99]f[integer 1-99]'
-    if not all(member_name.startswith('r') and \
-               member_name[1:].split('i')[0].isdigit() and \
-               member_name[1:].split('i')[1].split('p')[0].isdigit() and \
-               member_name[1:].split('i')[1].split('p')[1].split('f')[0].isdigit() and \
-               member_name[1:].split('i')[1].split('p')[1].split('f')[1].isdigit() \
-               for member_name in member_names):
-        raise ValueError("The member names are not in the format 'r[integer 1-99]i[integer 1-99]p[integer 1-99]f[integer 1-99]'!!!")
-    # Concatenate the datasets along the 'member' dimension and retain the member names
-    ds = xr.concat(
-    dataset_dict.values(), 
-    dim=xr.DataArray(member_names, dims="member", name="member"))
-    # Extract the numeric part from each member name and sort based on it
-    sorted_member_indices = np.argsort([int(member[1:].split('i')[0]) for member in ds['member'].values])
-    # Reorder the dataset based on the sorted member indices
-    ds_sorted = ds.isel(member=sorted_member_indices)
+    # parse r<realization>i<initialization>p<physics>f<forcing> once, sorted so no reorder is needed after concat
+    members_df = member_index(df['member_id'].unique())
+    if members:
+        members_df = members_df[_member_mask(members_df, members)]
+        if len(members_df) == 0:
+            raise ValueError(f"No members match the selection {members}!!!")
+        df = df[df['member_id'].isin(members_df.index)]
+    member_names = list(members_df.index)
+    start = time.perf_counter()
+    if reference_index:
+        # one metadata read of the cached virtual references instead of a header read per file
+        drop_variables = drop_list if drop_extra_variables else None
+        refs = _build_reference_index(df, member_names, drop_variables=drop_variables, index_dir=index_dir, max_workers=max_workers)
+        # MultiZarrToZarr sorts the members as strings (r1, r10, r11, r2, ...) - put them back in the parsed order
+        ds = open_reference_index(refs, **xarray_open_kwargs).sel(member=member_names)
+        variable_ids = [variable_id for variable_id, _ in _variable_paths(df[df['member_id'] == member_names[0]])]
+        ds = ds.set_coords([name for name in ds.data_vars if name not in variable_ids])
+        if time_window is not None:
+            ds = _trim_time(ds, *time_window)
+        # the dataset attributes intake-esm adds
+        first = df[df['member_id'] == member_names[0]].iloc[0]
+        ds.attrs.update({f"intake_esm_attrs:{attr}": first[attr] for attr in dataset_attrs + ['variable_id']})
+        ds.attrs['intake_esm_dataset_key'] = '.'.join(str(first[attr]) for attr in groupby_attrs if attr in df.columns)
+        ds.attrs['intake_esm_vars'] = variable_ids
+        print(f"Opened {len(member_names)} members from the reference index in {time.perf_counter() - start:.2f} s")
+    else:
+        if drop_extra_variables:
+            xarray_open_kwargs['drop_variables'] = drop_list
+        assets = catalog_search.esmcat.assets
+        data_formats = {assets.format.value} if assets.format else set(df[assets.format_column_name])
+        if data_formats == {'netcdf'}:
+            xarray_open_kwargs.setdefault('engine', _LockedNetCDF4BackendEntrypoint)
+        # open the members in a bounded pool, max_workers at a time
+        with ThreadPoolExecutor(max_workers=max_workers) as workers:
+            member_dfs = dict(tuple(df.groupby('member_id', sort=False)))
+            futures = {member_name: workers.submit(_open_member, catalog_search, member_dfs[member_name], xarray_open_kwargs, preprocess)
+                       for member_name in member_names}
+            dataset_dict = {}
+            for member_name, future in futures.items():
+                dataset_dict[member_name], seconds = future.result()
+                print(f"Opened {member_name} in {seconds:.2f} s")
+        print(f"Opened {len(member_names)} members in {time.perf_counter() - start:.2f} s")
+        # Concatenate the datasets along the 'member' dimension and retain the member names
+        ds = xr.concat(
+        [dataset_dict[member_name] for member_name in member_names],
+        dim=xr.DataArray(member_names, dims="member", name="member"))
+    ds_sorted = ds.assign_coords({level: ('member', members_df[level].to_numpy()) for level in MEMBER_LEVELS})
     return ds_sorted
 
 
-def load_ACCESS_ESM(catalog_search,use_cftime=False,chunking_settings=None,chunking_key=None,drop_extra_variables=True,drop_list=['vertices_longitude', 'vertices_latitude', 'time_bnds']):
+def load_ACCESS_ESM(catalog_search,use_cftime=False,chunking_settings=None,chunking_key=None,drop_extra_variables=True,drop_list=['vertices_longitude', 'vertices_latitude', 'time_bnds'],access_pattern='time-series',memory_budget='1GB',time_trim=None):
     """
     Load single ensemble ACCESS-ESM data from an esm_datastore.
 
@@ -102,7 +464,11 @@ def load_ACCESS_ESM(catalog_search,use_cftime=False,chunking_settings=None,chunk
     ----------
     catalog_search : intake_esm.core.esm_datastore object -  This will come from filtering an intake catalog that contains the ACCESS-ESM ensemble data.
     chunking_settings : dict - A dictionary containing the chunking settings for the dataset. The default is None.
+    chunking_key : str - A key of the chunking settings in config.yaml, or 'auto' to plan the chunks from the storage chunking of the files with plan_chunks. The default is None.
     drop_extra_variables : bool - A flag to drop extra variables that are not the primary variable. The default is True.
+    access_pattern : str - The access pattern used by chunking_key='auto': 'time-series', 'map' or 'profile'. The default is 'time-series'.
+    memory_budget : int or str - The per-worker memory budget used by chunking_key='auto'. The default is '1GB'.
+    time_trim : dict - The time_trim block of job_config.yaml, {'enabled': True, 'start': ..., 'end': ...}. Files outside the window are dropped before opening (trim_catalog_time) and the rest are sliced as they are opened. The default is None, no trimming.
 
     Returns
     -------
@@ -112,6 +478,12 @@ def load_ACCESS_ESM(catalog_search,use_cftime=False,chunking_settings=None,chunk
     # check if the catalog_search is an esm_datastore object, specifically intake_esm.core.esm_datastore
     if not isinstance(catalog_search, intake_esm.core.esm_datastore):
         raise TypeError("catalog_search must be an instance of intake_esm.core.esm_datastore!!! Did catalog_search come from filtering an intake catalog?")
+    # push the time window down to the file selection
+    time_window = _time_trim_window(time_trim)
+    preprocess = None
+    if time_window is not None:
+        catalog_search = trim_catalog_time(catalog_search, *time_window)
+        preprocess = functools.partial(_trim_time, start=time_window[0], end=time_window[1])
     # check if the catalog_search contains ACCESS-ESM ensemble data
     # is there one and only one source_id in the catalog_search?
     if len(catalog_search.df['source_id'].unique()) != 1:
@@ -124,14 +496,17 @@ def load_ACCESS_ESM(catalog_search,use_cftime=False,chunking_settings=None,chunk
         raise ValueError("The catalog_search must contain only one ensemble!!!")
     # Get the dictionary of datasets and the corresponding keys (member names)
     # if chunking_key is provided, use it to load the dataset
-    if chunking_key:
+    if chunking_key == 'auto':
+        xarray_open_kwargs = plan_chunks(catalog_search, access_pattern=access_pattern, memory_budget=memory_budget)
+        print(f"Loading the dataset using the planned chunking settings: {xarray_open_kwargs}")
+    elif chunking_key:
         from .util import load_config
         config = load_config() # Load the configuration file from yaml
-        xarray_open_kwargs = config['chunking'][chunking_key]
+        xarray_open_kwargs = dict(config['chunking'][chunking_key])
         print(f"Loading the dataset using the chunking settings for '{chunking_key}' from the configuration file: {xarray_open_kwargs}")
     # if chunking_settings is provided, use it to load the dataset
     elif chunking_settings:
-        xarray_open_kwargs = chunking_settings
+        xarray_open_kwargs = dict(chunking_settings)
         print(f"Loading the dataset using the provided chunking settings: {xarray_open_kwargs}")
     else:
         xarray_open_kwargs = {}
@@ -139,141 +514,469 @@ def load_ACCESS_ESM(catalog_search,use_cftime=False,chunking_settings=None,chunk
     if use_cftime:
         xarray_open_kwargs['use_cftime'] = use_cftime
         print("Loading the dataset with cftime = {}".format(use_cftime))
-    ds = catalog_search.to_dask(progressbar=False,xarray_open_kwargs=xarray_open_kwargs)
-    # Drop extra variables that are not the primary variable if condition is True
+    # Drop extra variables that are not the primary variable if condition is True - as each file is opened
     if drop_extra_variables:
-        ds.drop_vars(drop_list, errors='ignore') 
+        xarray_open_kwargs['drop_variables'] = drop_list
+    ds = catalog_search.to_dask(progressbar=False,xarray_open_kwargs=xarray_open_kwargs,preprocess=preprocess)
+    if drop_extra_variables:
+        ds = ds.drop_vars(drop_list, errors='ignore')
     return ds
 
-def find_chunking_info(catalog_search, var_name, return_results=False):
+def _read_chunk_layout_netcdf4(path):
+    """
+    Read the storage layout of every variable in a NetCDF4 file with netCDF4.Variable.chunking and filters - the
+    fallback of _read_chunk_layout when h5py is not installed.
+    """
+    import netCDF4
+    records = []
+    def visit(group, prefix):
+        for name, variable in group.variables.items():
+            filters = variable.filters() or {}
+            chunking = variable.chunking()
+            # gzip is netCDF-C's zlib, as h5py names it; the other filters have no level
+            compression = 'gzip' if filters.get('zlib') else next(
+                (key for key in ('szip', 'zstd', 'bzip2', 'blosc') if filters.get(key)), None)
+            records.append({
+                "path": path,
+                "variable": prefix + name,
+                "dimensions": tuple(variable.dimensions),
+                "dtype": str(variable.dtype),
+                "shape": tuple(variable.shape),
+                "chunk_sizes": tuple(chunking) if isinstance(chunking, list) else None,
+                "compression": compression,
+                "compression_level": filters.get('complevel') if compression == 'gzip' else None,
+                "shuffle": bool(filters.get('shuffle', False)),
+            })
+        for group_name, subgroup in group.groups.items():
+            visit(subgroup, f"{prefix}{group_name}/")
+    with netCDF4.Dataset(path, 'r') as file:
+        visit(file, '')
+    return records
+
+def _read_chunk_layout(path):
+    """
+    Read the storage layout (dtype, shape, chunk sizes and compression filters) of every variable in a NetCDF4/HDF5
+    file directly from its header with h5py - no data are read and no subprocess is spawned. Falls back to netCDF4
+    when h5py is not installed.
+    """
+    try:
+        import h5py
+    except ImportError:
+        return _read_chunk_layout_netcdf4(path)
+    records = []
+    def visit(name, obj):
+        if not isinstance(obj, h5py.Dataset):
+            return
+        # netCDF4 dimensions without a coordinate variable are stored as placeholder datasets
+        if obj.attrs.get('NAME', b'').startswith(b'This is a netCDF dimension but not a netCDF variable'):
+            return
+        # dimension names from the attached dimension scales - a coordinate variable is its own scale
+        dimensions = tuple(scales[0].name.lstrip('/') if len(scales) else (name if obj.is_scale else f"phony_dim_{axis}")
+                           for axis, scales in enumerate(obj.dims))
+        records.append({
+            "path": path,
+            "variable": name,
+            "dimensions": dimensions,
+            "dtype": str(obj.dtype),
+            "shape": tuple(obj.shape),
+            "chunk_sizes": tuple(obj.chunks) if obj.chunks else None,
+            "compression": obj.compression,
+            "compression_level": obj.compression_opts if obj.compression == 'gzip' else None,
+            "shuffle": obj.shuffle,
+        })
+    with h5py.File(path, 'r') as file:
+        file.visititems(visit)
+    return records
+
+def find_chunking_info(catalog_search, var_name=None, return_results=False, max_workers=16, executor='thread'):
     """
-    Find the chunking information for a dataset in an esm_datastore.  This takes a simple approach to the possibility of different 
-    chunking information between file paths in the catalog search by comparing the first and the last files in the list of paths.
+    Find the chunking information for a dataset in an esm_datastore.  The storage layout of every variable in every
+    file of the catalog search is read directly from the NetCDF4/HDF5 headers, concurrently, and variables whose
+    chunking differs between files (e.g. a layout change part way through a run) are flagged.
 
     Parameters
     ----------
     catalog_search : intake_esm.core.esm_datastore object -  This will come from filtering an intake catalog.
+    var_name : str - Only report this variable. The default is None, all variables.
+    return_results : bool - Return the layout table. The default is False.
+    max_workers : int - Number of files read at once. The default is 16.
+    executor : str - 'thread' (default) reads headers in a thread pool; h5py serialises HDF5 calls, so on filesystems
+        with slow metadata (e.g. Lustre) 'process' reads them in a process pool for full concurrency.
 
     Returns
     -------
-    chunking_info : dict - A dictionary containing the chunking information for each variable in the dataset.
+    layout : pandas.DataFrame - One row per file and variable with the dimensions, dtype, shape, chunk sizes, compression filters
+        and a 'heterogeneous' flag that is True when the chunk sizes of the variable differ between files
+        (returned only if return_results=True).
 
     """
     # check if the catalog_search is an esm_datastore object, specifically intake_esm.core.esm_datastore
     if not isinstance(catalog_search, intake_esm.core.esm_datastore):
         raise TypeError("catalog_search must be an instance of intake_esm.core.esm_datastore!!! Did catalog_search come from filtering an intake catalog?")
-    # get the first and the last paths in the catalog_search
-    first_path = catalog_search.df['path'].iloc[0]
-    last_path = catalog_search.df['path'].iloc[-1]
-    # Construct the command to run ncdump on the first file path
-    command = f"ncdump -hs {first_path}"
-    # Run the command and capture the output
-    output = os.popen(command).read()
-    # Parse the output to extract the chunking information
-    chunking_info_first = {}
-    lines = output.split("\n")
-    for line in lines:
-        if "_ChunkSizes" in line:
-            chunk_sizes = line.split("=")[1].strip()
-            chunking_info_first[var_name] = {
-                "chunk_sizes": chunk_sizes,
-                "file_path": first_path
-            }
-    # Construct the command to run ncdump on the last file path
-    command = f"ncdump -hs {last_path}"
-    # Run the command and capture the output
-    output = os.popen(command).read()
-    # Parse the output to extract the chunking information
-    chunking_info_last = {}
-    lines = output.split("\n")
-    for line in lines:
-        if "_ChunkSizes" in line:
-            chunk_sizes = line.split("=")[1].strip()
-            chunking_info_last[var_name] = {
-                "chunk_sizes": chunk_sizes,
-                "file_path": last_path
-            }
-    #compare the chunking information from the first and the last files - if the chunking information isn't the same, raise a warning
-    if chunking_info_first[var_name]['chunk_sizes'] != chunking_info_last[var_name]['chunk_sizes']:
-        print(f"WARNING: The chunking information for the variable '{var_name}' is different between the first and the last files in the list of paths!!!")
-    # Create a table with the chunking information
-    max_chars_per_line = 50  # Maximum number of characters per line
-    max_words_per_line = 10  # Maximum number of words per line
-    table_data_formatted = []
-    # use the tabulate function to format the table
-    table_data = [
-        ["Variable", var_name],
-        ["Chunk sizes (first file)", chunking_info_first[var_name]['chunk_sizes']],
-        ["File path (first file)", chunking_info_first[var_name]['file_path']],
-        ["Chunk sizes (last file)", chunking_info_last[var_name]['chunk_sizes']],
-        ["File path (last file)", chunking_info_last[var_name]['file_path']]
-    ]
-    for key, value in table_data:
-        if isinstance(value, str):
-            # Split the value into words
-            words = value.split()
-            # Create a new list to store the formatted lines
-            lines = []
-            current_line = ""
-            for word in words:
-                # Check if adding the current word exceeds the maximum characters or words per line
-                if len(current_line) + len(word) + 1 <= max_chars_per_line and len(lines) < max_words_per_line:
-                    current_line += word + " "
-                else:
-                    # Add the current line to the lines list and start a new line with the current word
-                    lines.append(current_line.strip())
-                    current_line = word + " "
-            # Add the last line to the lines list
-            lines.append(current_line.strip())
-            # Break up long lines over max_chars_per_line on forward slashes
-            lines_formatted = []
-            for line in lines:
-                if len(line) > max_chars_per_line:
-                    line_parts = line.split("/")
-                    new_line = ""
-                    current_line = ""
-                    for part in line_parts:
-                        if len(current_line) + len(part) + 1 <= max_chars_per_line:
-                            current_line += part + "/"
-                        else:
-                            lines_formatted.append(current_line.strip())
-                            current_line = part + "/"
-                    lines_formatted.append(current_line.strip())
-                else:
-                    lines_formatted.append(line)
-            table_data_formatted.append([key, "\n".join(lines_formatted)])
-        else:
-            table_data_formatted.append([key, value])
-    print(tabulate(table_data_formatted, tablefmt="fancy_grid"))
+    if executor not in ('thread', 'process'):
+        raise ValueError("executor must be 'thread' or 'process'!!!")
+    paths = list(catalog_search.df['path'].unique())
+    pool = ThreadPoolExecutor if executor == 'thread' else ProcessPoolExecutor
+    with pool(max_workers=max_workers) as workers:
+        records = [record for file_records in workers.map(_read_chunk_layout, paths) for record in file_records]
+    layout = pd.DataFrame.from_records(records, columns=["path", "variable", "dimensions", "dtype", "shape", "chunk_sizes",
+                                                         "compression", "compression_level", "shuffle"])
+    if var_name is not None:
+        if var_name not in set(layout['variable']):
+            raise ValueError(f"The variable '{var_name}' was not found in the files of the catalog_search!!!")
+        layout = layout[layout['variable'] == var_name].reset_index(drop=True)
+    layout['heterogeneous'] = layout.groupby('variable')['chunk_sizes'].transform(lambda chunks: chunks.map(str).nunique() > 1)
+    # summarise the distinct layouts of each variable
+    table_data = []
+    for variable, variable_layout in layout.groupby('variable', sort=False):
+        if variable_layout['heterogeneous'].iloc[0]:
+            print(f"WARNING: The chunking information for the variable '{variable}' is different between files in the list of paths!!!")
+        for chunk_sizes, files in variable_layout.groupby(variable_layout['chunk_sizes'].map(str), sort=False):
+            first = files.iloc[0]
+            if pd.isna(first['compression']):
+                filters = "none"
+            elif pd.notna(first['compression_level']):
+                filters = f"{first['compression']} (level {int(first['compression_level'])})"
+            else:
+                # only gzip has a level, e.g. lzf or szip
+                filters = f"{first['compression']}"
+            if first['shuffle']:
+                filters += " + shuffle"
+            table_data.append([variable, first['dtype'], chunk_sizes, filters, f"{len(files)} of {len(paths)}"])
+    print(tabulate(table_data, headers=["Variable", "dtype", "Chunk sizes", "Filters", "Files"], tablefmt="fancy_grid"))
     
     # Conditionally return results based on the flag
     if return_results:
-        # Combine the chunking information from the first and the last files
-        chunking_info = {
-            var_name: {
-                "chunk_sizes_first": chunking_info_first[var_name]['chunk_sizes'],
-                "file_path_first": chunking_info_first[var_name]['file_path'],
-                "chunk_sizes_last": chunking_info_last[var_name]['chunk_sizes'],
-                "file_path_last": chunking_info_last[var_name]['file_path']
-            }
-        }
-        return chunking_info
+        return layout
     else:
         return None
 
+# dimensions grown first for each access pattern - any dimension not named here is grown last, in file order
+ACCESS_PATTERNS = {
+    'time-series': ['time', 'lev', 'j', 'i'],
+    'map': ['j', 'i', 'lev', 'time'],
+    'profile': ['lev', 'j', 'i', 'time'],
+}
+
+def plan_chunks(catalog_search, var_name=None, access_pattern='time-series', memory_budget='1GB', chunks_in_memory=4,
+                max_workers=16, executor='thread'):
+    """
+    Plan dask chunks for opening the files of an esm_datastore from their storage chunking.  Every dask chunk is a
+    whole multiple of the on-disk chunks (or the full dimension), so no storage chunk is decompressed by more than one
+    task.  Starting from the storage chunks, the dimensions are grown in the order set by the access pattern until a
+    chunk fills its share of the per-worker memory budget.
+
+    Parameters
+    ----------
+    catalog_search : intake_esm.core.esm_datastore object -  This will come from filtering an intake catalog.
+    var_name : str - The variable to plan for. The default is None, the single variable_id of the catalog_search.
+    access_pattern : str - 'time-series' (long time axis per chunk), 'map' (whole horizontal fields) or 'profile'
+        (whole water columns). The default is 'time-series'.
+    memory_budget : int or str - Memory per dask worker in bytes or as a string such as '4GB'. The default is '1GB'.
+    chunks_in_memory : int - Number of chunks a worker is expected to hold at once, the chunk size target is
+        memory_budget / chunks_in_memory. The default is 4.
+    max_workers : int - Number of file headers read at once. The default is 16.
+    executor : str - 'thread' (default) or 'process', see find_chunking_info.
+
+    Returns
+    -------
+    xarray_open_kwargs : dict - {'chunks': {dim: size}} in the form of the config.yaml chunking entries.
+
+    """
+    from dask.utils import parse_bytes
+    # check if the catalog_search is an esm_datastore object, specifically intake_esm.core.esm_datastore
+    if not isinstance(catalog_search, intake_esm.core.esm_datastore):
+        raise TypeError("catalog_search must be an instance of intake_esm.core.esm_datastore!!! Did catalog_search come from filtering an intake catalog?")
+    if access_pattern not in ACCESS_PATTERNS:
+        raise ValueError(f"access_pattern must be one of {list(ACCESS_PATTERNS)}!!!")
+    if executor not in ('thread', 'process'):
+        raise ValueError("executor must be 'thread' or 'process'!!!")
+    if var_name is None:
+        variable_ids = catalog_search.df['variable_id'].unique()
+        if len(variable_ids) != 1:
+            raise ValueError("The catalog_search contains more than one variable_id, please provide var_name!!!")
+        var_name = variable_ids[0]
+    paths = list(catalog_search.df['path'].unique())
+    pool = ThreadPoolExecutor if executor == 'thread' else ProcessPoolExecutor
+    with pool(max_workers=max_workers) as workers:
+        records = [record for file_records in workers.map(_read_chunk_layout, paths) for record in file_records
+                   if record['variable'] == var_name]
+    if not records:
+        raise ValueError(f"The variable '{var_name}' was not found in the files of the catalog_search!!!")
+    dimensions = records[0]['dimensions']
+    if any(record['dimensions'] != dimensions for record in records):
+        raise ValueError(f"The dimensions of the variable '{var_name}' differ between files!!!")
+    # largest extent of each dimension over the files - the time chunk is applied per file by xarray
+    shape = np.max([record['shape'] for record in records], axis=0)
+    # a chunk that is a multiple of every storage layout in use (contiguous storage is one chunk)
+    storage = np.lcm.reduce([record['chunk_sizes'] if record['chunk_sizes'] else record['shape'] for record in records], axis=0)
+    storage = np.maximum(np.minimum(storage, shape), 1)
+    itemsize = np.dtype(records[0]['dtype']).itemsize
+    target_bytes = parse_bytes(memory_budget) // chunks_in_memory if isinstance(memory_budget, str) else memory_budget // chunks_in_memory
+    chunks = storage.copy()
+    if np.prod(chunks) * itemsize > target_bytes:
+        print(f"WARNING: The storage chunks of '{var_name}' ({np.prod(chunks) * itemsize} bytes) exceed the chunk size target of {target_bytes} bytes!!!")
+    order = [dim for dim in ACCESS_PATTERNS[access_pattern] if dim in dimensions] + \
+            [dim for dim in dimensions if dim not in ACCESS_PATTERNS[access_pattern]]
+    for dim in order:
+        axis = dimensions.index(dim)
+        other_bytes = np.prod(np.delete(chunks, axis)) * itemsize
+        # number of storage chunks along this dimension that fit in the target and are needed to cover it
+        n_fit = max(int(target_bytes // (other_bytes * storage[axis])), 1)
+        n_cover = int(np.ceil(shape[axis] / storage[axis]))
+        chunks[axis] = min(n_fit, n_cover) * storage[axis]
+        if n_fit < n_cover:
+            break
+    chunks = np.minimum(chunks, shape)
+    xarray_open_kwargs = {'chunks': {dim: int(size) for dim, size in zip(dimensions, chunks)}}
+    print(f"Planned '{access_pattern}' chunks for '{var_name}' from storage chunks {dict(zip(dimensions, storage.tolist()))}: {xarray_open_kwargs['chunks']} "
+          f"({int(np.prod(chunks)) * itemsize / 1e6:.1f} MB per chunk)")
+    return xarray_open_kwargs
+
+def grid_id(coords):
+    """
+    Content hash of a grid: the first 16 hex digits of the SHA-256 of the names, dims, dtypes, shapes and values of
+    the variables in coords, so identical grids get the same ID whatever variable or run they come from.
+    """
+    import hashlib
+    digest = hashlib.sha256()
+    for name in sorted(coords.variables):
+        variable = coords.variables[name]
+        digest.update(f"{name}|{','.join(variable.dims)}|{variable.dtype.str}|{variable.shape}|".encode())
+        digest.update(np.ascontiguousarray(variable.values).tobytes())
+    return digest.hexdigest()[:16]
+
 def save_n_drop_multidim_lat_lon(ds, save_coords_dir, coords_name='ACCESS-ESM1.5', variable_name='var_name_unknown', drop_list=['latitude', 'longitude','vertices_latitude','vertices_longitude']):
+    """
+    Save the multidimensional grid coordinates of a dataset to a content-addressed coords store and drop them.
+
+    Each distinct grid is written once, as '<coords_name>_grid_<grid_id>.nc' in save_coords_dir, and reused by every
+    later variable or run on the same grid. The grid ID is stored in ds.attrs['grid_id'] so attach_grid can put the
+    coordinates back.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset - The dataset with the grid coordinates.
+    save_coords_dir : str - The coords store directory.
+    coords_name : str - Prefix of the grid file names. The default is 'ACCESS-ESM1.5'.
+    variable_name : str - Kept for backward compatibility, the grid files are shared between variables.
+    drop_list : list - The grid coordinates to save and drop.
+
+    Returns
+    -------
+    ds_dropped : xarray.Dataset - The dataset without the grid coordinates and with 'grid_id' and 'coords_filename' attrs.
+
+    """
     # check if the objects in drop_list are in the dataset
     final_drop_list = []
     for item in drop_list:
         if item in ds:
             print(f"The item '{item}' was found in the dataset and will be dropped!!!")
             final_drop_list.append(item)
-    coords = ds[final_drop_list]
-    current_datetime = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{coords_name}_{variable_name}_coords_{current_datetime}.nc"
-    coords.to_netcdf(save_coords_dir + filename)
-    ds_dropped = ds.drop(final_drop_list)
-    ds_dropped.attrs['coords_filename'] = save_coords_dir + filename
+    coords = ds[final_drop_list].reset_coords()
+    coords = coords.drop_vars([name for name in coords.variables if name not in final_drop_list])
+    coords.attrs, coords.encoding = {}, {}
+    grid = grid_id(coords)
+    filename = os.path.join(save_coords_dir, f"{coords_name}_grid_{grid}.nc")
+    if os.path.exists(filename):
+        print(f"The grid '{grid}' is already in the coords store: {filename}")
+    else:
+        # NetCDF3 (uncompressed) so attach_grid can memory-map it, written under a temporary name and renamed so a
+        # partly written grid is never picked up
+        coords.attrs['grid_id'] = grid
+        tmp_filename = f"{filename}.{os.getpid()}.tmp"
+        coords.to_netcdf(tmp_filename, format='NETCDF3_64BIT')
+        os.replace(tmp_filename, filename)
+        print(f"Saved the grid '{grid}' to the coords store: {filename}")
+    ds_dropped = ds.drop_vars(final_drop_list)
+    ds_dropped.attrs['grid_id'] = grid
+    ds_dropped.attrs['coords_filename'] = filename
     ds_dropped.attrs['NOTE on coordinates'] = 'the multidimensional latitude and longitude coordinates have been saved as a separate NetCDF file'
     return ds_dropped
 
+@functools.lru_cache(maxsize=8)
+def _open_grid(filename):
+    """
+    Open a grid file of the coords store once per process, memory-mapped when scipy is available.
+    """
+    try:
+        import scipy  # noqa: F401
+        return xr.open_dataset(filename, engine='scipy')
+    except ImportError:
+        return xr.open_dataset(filename)
+
+def attach_grid(ds, save_coords_dir=None, coords_name='ACCESS-ESM1.5'):
+    """
+    Put back the grid coordinates saved by save_n_drop_multidim_lat_lon, looked up by ds.attrs['grid_id'].  The grid
+    file is memory-mapped and cached per process, so the values are only paged in when used and every dataset on the
+    same grid shares them.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset - A dataset with a 'grid_id' attr.
+    save_coords_dir : str - The coords store directory. The default is None, the directory of ds.attrs['coords_filename'].
+    coords_name : str - Prefix of the grid file names. The default is 'ACCESS-ESM1.5'.
+
+    Returns
+    -------
+    ds : xarray.Dataset - The dataset with the grid coordinates.
+
+    """
+    if 'grid_id' not in ds.attrs:
+        raise ValueError("The dataset has no 'grid_id' attribute!!! Was it written with save_n_drop_multidim_lat_lon?")
+    if save_coords_dir is None:
+        if 'coords_filename' not in ds.attrs:
+            raise ValueError("The dataset has no 'coords_filename' attribute, please provide save_coords_dir!!!")
+        filename = ds.attrs['coords_filename']
+    else:
+        filename = os.path.join(save_coords_dir, f"{coords_name}_grid_{ds.attrs['grid_id']}.nc")
+    grid = _open_grid(filename)
+    if grid.attrs.get('grid_id') != ds.attrs['grid_id']:
+        raise ValueError(f"The grid file {filename} does not hold the grid '{ds.attrs['grid_id']}'!!!")
+    return ds.assign_coords({name: grid[name] for name in grid.data_vars})
+
+# SQLite registry of the completed ARD Zarr stores, kept in the write directory (paths.write_dir in job_config.yaml)
+ARD_REGISTRY_NAME = 'ard_registry.sqlite'
+# ARD Zarr store names: <source_id>.<experiment_id>.<variable_id>.<layout>.vYYYYMMDD_HHMMSS.zarr
+ARD_STORE_NAME_RE = re.compile(r"^(?P<source_id>[^.]+)\.(?P<experiment_id>[^.]+)\.(?P<variable_id>[^.]+)\."
+                               r"(?P<layout>[^.]+)\.(?P<version>v\d{8}_\d{6})\.zarr$")
+
+def ard_store_name(source_id, experiment_id, variable_id, layout='base', version=None):
+    """
+    Name of an ARD Zarr store, e.g. 'ACCESS-ESM1-5.historical.o2.base.v20250101_120000.zarr'. The default version
+    is a new token from the current time.
+    """
+    version = version or datetime.datetime.now().strftime("v%Y%m%d_%H%M%S")
+    return f"{source_id}.{experiment_id}.{variable_id}.{layout}.{version}.zarr"
+
+def _connect_ard_registry(write_dir, read_only=False):
+    """
+    Open (creating if needed) the registry of write_dir, or with read_only=True open an existing registry for
+    lookups only (None if there is none). The rollback journal is used rather than WAL because WAL needs shared
+    memory that network filesystems such as Lustre do not provide.
+    """
+    import sqlite3
+    path = os.path.abspath(os.path.join(write_dir, ARD_REGISTRY_NAME))
+    if read_only:
+        if not os.path.exists(path):
+            return None
+        return sqlite3.connect(f"{pathlib.Path(path).as_uri()}?mode=ro", uri=True, timeout=60)
+    connection = sqlite3.connect(path, timeout=60)
+    connection.executescript("""
+        CREATE TABLE IF NOT EXISTS stores (
+            source_id TEXT, experiment_id TEXT, variable_id TEXT, layout TEXT, version TEXT,
+            path TEXT NOT NULL, registered TEXT NOT NULL,
+            PRIMARY KEY (source_id, experiment_id, variable_id, layout, version));
+        CREATE TABLE IF NOT EXISTS latest (
+            source_id TEXT, experiment_id TEXT, variable_id TEXT, layout TEXT, version TEXT NOT NULL,
+            path TEXT NOT NULL,
+            PRIMARY KEY (source_id, experiment_id, variable_id, layout));
+    """)
+    return connection
+
+def register_ard_store(write_dir, store):
+    """
+    Record a completed ARD Zarr store in the registry of write_dir. Call this only once the store is fully written -
+    the writers in make_data do so when given registry_dir - so that lookups never return an incomplete store.
+
+    Parameters
+    ----------
+    write_dir : str - Directory holding the registry, usually paths.write_dir of job_config.yaml.
+    store : str - Path of the store, named as ard_store_name.
+
+    Returns
+    -------
+    key : dict - The source_id, experiment_id, variable_id, layout and version of the store.
+
+    """
+    name = os.path.basename(store.rstrip('/'))
+    match = ARD_STORE_NAME_RE.match(name)
+    if match is None:
+        raise ValueError(f"The store name '{name}' is not <source_id>.<experiment_id>.<variable_id>.<layout>.vYYYYMMDD_HHMMSS.zarr!!!")
+    key = match.groupdict()
+    row = dict(key, path=os.path.abspath(store.rstrip('/')), registered=datetime.datetime.now().isoformat(timespec='seconds'))
+    connection = _connect_ard_registry(write_dir)
+    try:
+        # both tables are updated in one transaction
+        with connection:
+            connection.execute("INSERT OR REPLACE INTO stores VALUES (:source_id, :experiment_id, :variable_id, :layout, :version, :path, :registered)", row)
+            connection.execute("""
+                INSERT INTO latest VALUES (:source_id, :experiment_id, :variable_id, :layout, :version, :path)
+                ON CONFLICT (source_id, experiment_id, variable_id, layout)
+                DO UPDATE SET version = excluded.version, path = excluded.path WHERE excluded.version >= latest.version
+            """, row)
+    finally:
+        connection.close()
+    return key
+
+def find_ard_store(write_dir, source_id, experiment_id, variable_id, layout='base', version='latest'):
+    """
+    Look up a registered ARD Zarr store by primary-key lookup in the registry of write_dir, without listing the
+    directory. The registry is opened read-only and is never created by a lookup.
+
+    Parameters
+    ----------
+    write_dir : str - Directory holding the registry, usually paths.write_dir of job_config.yaml.
+    source_id, experiment_id, variable_id : str - e.g. 'ACCESS-ESM1-5', 'historical', 'o2'.
+    layout : str - 'base', 'chunk4member', 'chunk4time', 'chunk4time4member', ... The default is 'base'.
+    version : str - A version token 'vYYYYMMDD_HHMMSS' or 'latest'. The default is 'latest'.
+
+    Returns
+    -------
+    path : str - Path of the store, or None if it is not registered or write_dir has no registry.
+
+    """
+    connection = _connect_ard_registry(write_dir, read_only=True)
+    if connection is None:
+        return None
+    try:
+        key = (source_id, experiment_id, variable_id, layout)
+        if version == 'latest':
+            row = connection.execute("SELECT path FROM latest WHERE source_id = ? AND experiment_id = ? AND variable_id = ? AND layout = ?", key).fetchone()
+        else:
+            row = connection.execute("SELECT path FROM stores WHERE source_id = ? AND experiment_id = ? AND variable_id = ? AND layout = ? AND version = ?", key + (version,)).fetchone()
+    finally:
+        connection.close()
+    return None if row is None else row[0]
+
+def _has_consolidated_metadata(store):
+    """
+    True if a Zarr v2 (.zmetadata) or v3 (zarr.json consolidated_metadata) store has consolidated metadata, which the
+    ARD writers add only once all the data are written.
+    """
+    if os.path.exists(os.path.join(store, '.zmetadata')):
+        return True
+    if os.path.exists(os.path.join(store, 'zarr.json')):
+        with open(os.path.join(store, 'zarr.json')) as file:
+            return bool(json.load(file).get('consolidated_metadata'))
+    return False
+
+def rebuild_ard_registry(write_dir):
+    """
+    Register the completed ARD Zarr stores already in write_dir with one directory scan, e.g. for stores written
+    before the registry existed. A store counts as complete when it has consolidated metadata and, if it was written
+    by make_data.write_ard_zarr, its checkpoint manifest is marked complete.
+
+    Returns
+    -------
+    registered : list of str - The stores registered.
+
+    """
+    registered = []
+    for name in sorted(os.listdir(write_dir)):
+        if ARD_STORE_NAME_RE.match(name) is None:
+            continue
+        store = os.path.join(write_dir, name)
+        if not _has_consolidated_metadata(store):
+            print(f"Skipping '{name}': no consolidated metadata, the store may be incomplete!!!")
+            continue
+        manifest_path = store + ZARR_MANIFEST_SUFFIX
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as file:
+                if not json.load(file).get('complete', False):
+                    print(f"Skipping '{name}': the checkpoint manifest is not complete!!!")
+                    continue
+        register_ard_store(write_dir, store)
+        registered.append(store)
+    print(f"Registered {len(registered)} ARD stores in {os.path.join(write_dir, ARD_REGISTRY_NAME)}")
+    return registered
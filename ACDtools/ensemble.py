@@ -0,0 +1,293 @@
+"""
+ensemble.py
+
+This module computes ensemble statistics across the member dimension in one streaming pass:
+- count, mean and variance with the Welford / Chan et al. (1982) parallel merge of (n, mean, M2)
+- minimum and maximum
+- approximate quantiles from a mergeable t-digest style centroid sketch (Dunning & Ertl 2019, https://arxiv.org/abs/1902.04023)
+
+Each member chunk is reduced to a per-cell state, and the states are merged up a dask tree reduction, so any
+member chunking works (no rechunk of member to a single chunk). A state keeps up to n_centroids values per cell
+for the quantiles, so it is about the size of n_centroids members of the data.
+
+Author = {"name": "Thomas Moore", "affiliation": "CSIRO", "email": "thomas.moore@csiro.au", "orcid": "0000-0003-3930-1946"}
+
+"""
+# Standard library imports
+import functools
+
+
+# Third-party imports
+import dask.array as dsa
+import numpy as np
+import xarray as xr
+
+# Local application imports (if needed)
+#from .my_local_module import my_function
+
+STATISTICS = ['count', 'mean', 'var', 'min', 'max']
+# cells processed at once, which bounds the temporaries of every step
+_BLOCK_CELLS = 16384
+
+def _flatten(parts):
+    """
+    The states of a (nested) list of chunk states, as dask passes them to combine and aggregate.
+    """
+    if isinstance(parts, dict):
+        return [parts]
+    return [state for part in parts for state in _flatten(part)]
+
+def _blocks(n_cells):
+    """
+    Slices of _BLOCK_CELLS cells.
+    """
+    return [slice(start, start + _BLOCK_CELLS) for start in range(0, n_cells, _BLOCK_CELLS)]
+
+def _empty_state(shape, size, n_cells, width, dtype, weighted):
+    """
+    An uninitialised state of n_cells cells over size members with a sketch of width centroids; min, max and the
+    centroids are kept in the float dtype of the data (float32 for float32 data), the count, mean and M2 as int32
+    and float64. While no centroid has merged two samples the weights are not stored (None: weight 1, or 0 for the
+    NaN slots); after that they are the smallest unsigned integer that holds size.
+    """
+    return {'shape': shape, 'size': size, 'n': np.empty(n_cells, dtype=np.int32), 'mean': np.empty(n_cells), 'm2': np.empty(n_cells),
+            'min': np.empty(n_cells, dtype=dtype), 'max': np.empty(n_cells, dtype=dtype),
+            'centroids': np.empty((n_cells, width), dtype=dtype),
+            'weights': np.empty((n_cells, width), dtype=np.min_scalar_type(size)) if weighted else None}
+
+def _weights(state, block):
+    """
+    The centroid weights of a block of a state.
+    """
+    if state['weights'] is None:
+        return (~np.isnan(state['centroids'][block])).astype(np.float64)
+    return state['weights'][block].astype(np.float64)
+
+def _sort_sketch(centroids, weights):
+    """
+    Sort centroids (cells, m) along each row, empty (NaN, weight 0) slots last.
+    """
+    order = np.argsort(centroids, axis=-1, kind='stable')
+    return np.take_along_axis(centroids, order, axis=-1), np.take_along_axis(weights, order, axis=-1)
+
+def _compress(centroids, weights, n_centroids):
+    """
+    Merge pooled centroids (cells, m) into at most n_centroids per cell; fewer are kept as they are, unsorted.
+
+    The sorted centroids are merged into groups bounded by equal steps of the arcsine scale of the t-digest, so the
+    groups are small in the tails and larger near the median.
+    """
+    if centroids.shape[-1] <= n_centroids:
+        return centroids, weights
+    centroids, weights = _sort_sketch(centroids, weights)
+    cumulative = np.cumsum(weights, axis=-1, dtype=np.float64)
+    total = cumulative[:, -1:]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        q = np.clip((cumulative - weights / 2) / total, 0, 1)
+    group = np.clip(np.floor(n_centroids * (np.arcsin(2 * q - 1) / np.pi + 0.5)), 0, n_centroids - 1)
+    group = np.where(weights > 0, group, 0).astype(np.int64)
+    index = (np.arange(centroids.shape[0])[:, None] * n_centroids + group).ravel()
+    size = centroids.shape[0] * n_centroids
+    merged_weights = np.bincount(index, weights=weights.ravel(), minlength=size)
+    merged_sums = np.bincount(index, weights=np.where(weights > 0, centroids * weights, 0).ravel(), minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        merged = np.where(merged_weights > 0, merged_sums / merged_weights, np.nan)
+    return merged.reshape(-1, n_centroids), merged_weights.reshape(-1, n_centroids)
+
+def _stats_chunk(x, axis=None, keepdims=None, n_centroids=64, computing_meta=False, **kwargs):
+    """
+    Per-cell state of one member chunk: count, mean, M2, min, max and the quantile sketch.
+    """
+    if computing_meta:
+        return x
+    values = np.moveaxis(np.asarray(x), axis[0], -1)
+    shape = values.shape[:-1]
+    values = values.reshape(-1, values.shape[-1])
+    dtype = np.float32 if np.dtype(x.dtype).itemsize <= 4 else np.float64
+    weighted = values.shape[-1] > n_centroids
+    state = _empty_state(shape, values.shape[-1], values.shape[0], min(values.shape[-1], n_centroids), dtype, weighted)
+    for block in _blocks(values.shape[0]):
+        block_values = values[block].astype(np.float64)
+        valid = ~np.isnan(block_values)
+        n = valid.sum(axis=-1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(n > 0, np.where(valid, block_values, 0).sum(axis=-1) / n, np.nan)
+            state['m2'][block] = np.where(valid, (block_values - mean[:, None]) ** 2, 0).sum(axis=-1)
+        state['n'][block], state['mean'][block] = n, mean
+        state['min'][block] = np.where(n > 0, np.where(valid, block_values, np.inf).min(axis=-1), np.nan)
+        state['max'][block] = np.where(n > 0, np.where(valid, block_values, -np.inf).max(axis=-1), np.nan)
+        if weighted:
+            state['centroids'][block], state['weights'][block] = _compress(block_values, valid.astype(np.float64), n_centroids)
+        else:
+            state['centroids'][block] = block_values
+    return state
+
+def _stats_combine(parts, axis=None, keepdims=None, n_centroids=64, computing_meta=False, **kwargs):
+    """
+    Merge chunk states with the Chan et al. parallel update of (n, mean, M2) and by pooling the centroids.
+    """
+    if computing_meta:
+        return parts
+    states = _flatten(parts)
+    if len(states) == 1:
+        return states[0]
+    n_cells = len(states[0]['n'])
+    pooled = sum(state['centroids'].shape[-1] for state in states)
+    weighted = pooled > n_centroids or any(state['weights'] is not None for state in states)
+    merged = _empty_state(states[0]['shape'], sum(state['size'] for state in states), n_cells, min(pooled, n_centroids),
+                          states[0]['centroids'].dtype, weighted)
+    for block in _blocks(n_cells):
+        ns = np.stack([state['n'][block] for state in states]).astype(np.float64)
+        means = np.stack([np.where(state['n'][block] > 0, state['mean'][block], 0) for state in states])
+        n = ns.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(n > 0, (ns * means).sum(axis=0) / n, np.nan)
+            merged['m2'][block] = sum(state['m2'][block] for state in states) + (ns * (means - np.where(n > 0, mean, 0)) ** 2).sum(axis=0)
+        merged['n'][block], merged['mean'][block] = n, mean
+        merged['min'][block] = np.fmin.reduce([state['min'][block] for state in states])
+        merged['max'][block] = np.fmax.reduce([state['max'][block] for state in states])
+        centroids = np.concatenate([state['centroids'][block] for state in states], axis=-1)
+        if weighted:
+            merged['centroids'][block], merged['weights'][block] = _compress(
+                centroids, np.concatenate([_weights(state, block) for state in states], axis=-1), n_centroids)
+        else:
+            merged['centroids'][block] = centroids
+    return merged
+
+def _sketch_quantiles(centroids, weights, minimum, maximum, quantiles):
+    """
+    Quantiles (cells, q) from centroids, interpolating between the centroid ranks as numpy's 'linear' method does
+    between samples, with the minimum and maximum as end points. While the sketch still holds every sample (no
+    centroid has merged two), this is numpy's 'linear' quantile of the samples, computed directly.
+    """
+    quantiles = np.asarray(quantiles)
+    if np.all((weights == 0) | (weights == 1)):
+        values = np.sort(centroids, axis=-1)  # the empty slots are NaN, which sort last
+        n = weights.sum(axis=-1, dtype=np.int64)[:, None]
+        position = quantiles[None, :] * (n - 1)
+        lower = np.clip(np.floor(position).astype(np.int64), 0, None)
+        upper = np.minimum(lower + 1, np.maximum(n - 1, 0))
+        value_lower, value_upper = np.take_along_axis(values, lower, axis=-1), np.take_along_axis(values, upper, axis=-1)
+        return np.where(n > 0, value_lower + (position - lower) * (value_upper - value_lower), np.nan)
+    centroids, weights = _sort_sketch(centroids, weights)
+    cumulative = np.cumsum(weights, axis=-1, dtype=np.float64)
+    total = cumulative[:, -1:]
+    # the 0-based rank of each centroid centre; empty slots sit on the maximum
+    rank = np.where(weights > 0, cumulative - weights / 2 - 0.5, total - 1)
+    centroids = np.where(weights > 0, centroids, maximum[:, None])
+    ranks = np.concatenate([np.zeros_like(total), rank, total - 1], axis=-1)
+    values = np.concatenate([minimum[:, None], centroids, maximum[:, None]], axis=-1)
+    target = quantiles[None, :] * (total - 1)
+    left = np.clip((ranks[:, None, :] <= target[:, :, None]).sum(axis=-1) - 1, 0, ranks.shape[-1] - 2)
+    rank_left, rank_right = np.take_along_axis(ranks, left, axis=-1), np.take_along_axis(ranks, left + 1, axis=-1)
+    value_left, value_right = np.take_along_axis(values, left, axis=-1), np.take_along_axis(values, left + 1, axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fraction = np.where(rank_right > rank_left, (target - rank_left) / (rank_right - rank_left), 0)
+    return np.where(total > 0, value_left + np.clip(fraction, 0, 1) * (value_right - value_left), np.nan)
+
+def _stats_aggregate(parts, axis=None, keepdims=None, n_centroids=64, quantiles=(), ddof=1, computing_meta=False, **kwargs):
+    """
+    Final statistics, stacked along the reduced axis in the order STATISTICS + quantiles.
+    """
+    if computing_meta:
+        return parts
+    state = _stats_combine(parts, n_centroids=n_centroids)
+    stats = np.empty((len(state['n']), len(STATISTICS) + len(quantiles)), dtype=state['centroids'].dtype)
+    for block in _blocks(len(state['n'])):
+        n = state['n'][block]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var = np.where(n > ddof, state['m2'][block] / (n - ddof), np.nan)
+        stats[block, :len(STATISTICS)] = np.stack([n, state['mean'][block], var, state['min'][block], state['max'][block]], axis=-1)
+        if len(quantiles):
+            stats[block, len(STATISTICS):] = _sketch_quantiles(state['centroids'][block], _weights(state, block),
+                                                               state['min'][block], state['max'][block], quantiles)
+    stats = stats.reshape(state['shape'] + (stats.shape[-1],))
+    return np.moveaxis(stats, -1, axis[0])
+
+def ensemble_statistics(ds, dim='member', quantiles=(0.05, 0.5, 0.95), n_centroids=64, ddof=1, split_every=None):
+    """
+    Count, mean, variance, standard deviation, minimum, maximum and approximate quantiles across the ensemble in
+    one streaming pass over the data.
+
+    Each chunk of `dim` is reduced to a per-cell state (count, mean, M2, min, max and a sketch of at most
+    n_centroids weighted centroids), and the states are merged up a dask tree reduction: the mean and variance with
+    the Welford / Chan et al. parallel update, the sketches by pooling and re-compressing their centroids.  All the
+    statistics share one graph, so the data are read once and `dim` may have any chunking - there is no rechunk of
+    `dim` to a single chunk.  NaNs (e.g. land) are skipped.
+
+    Memory scales with n_centroids times the number of cells: a state holds 28 bytes per cell plus, per centroid, one
+    value in the data dtype and - once centroids have merged - a small integer weight (1 byte for up to 255 members).
+    An ensemble with no more than n_centroids members is held whole, as a rechunk of `dim` to one chunk would hold
+    it (e.g. 188 bytes per cell for 40 float32 members); larger ones take up to 348 bytes per cell for float32 data at
+    the default n_centroids=64, the size of about 87 members.  Each worker holds up to split_every states at a time.
+    Lower n_centroids to save memory at the cost of quantile accuracy.
+
+    The quantiles are exact (numpy's 'linear' method) while the ensemble has no more than n_centroids members;
+    beyond that they are approximate, with rank errors smallest in the tails.
+
+    Parameters
+    ----------
+    ds : xarray.DataArray or xarray.Dataset
+        Ensemble, e.g. from `ard.load_ACCESS_ESM_ensemble`. Data variables without `dim` are left out.
+    dim : str, optional
+        The ensemble dimension reduced over. Default is 'member'.
+    quantiles : sequence of float, optional
+        Quantiles in [0, 1]. Default is (0.05, 0.5, 0.95).
+    n_centroids : int, optional
+        Maximum number of centroids kept per cell by the quantile sketch; the state of a chunk holds up to
+        n_centroids values per cell. Default is 64.
+    ddof : int, optional
+        Delta degrees of freedom of the variance and standard deviation. Default is 1.
+    split_every : int, optional
+        Number of states merged at once in the tree reduction. Default is None, the dask default.
+
+    Returns
+    -------
+    xarray.Dataset
+        For a DataArray: `count` (int32), `mean`, `var`, `std`, `min`, `max` and `quantiles` (along a new `quantile`
+        dimension). For a Dataset: the same, prefixed by the variable name, e.g. `thetao_mean`.
+
+    Examples
+    --------
+    >>> ds = ard.load_ACCESS_ESM_ensemble(catalog_search, chunking_key='auto')
+    >>> stats = ensemble_statistics(ds.thetao, quantiles=[0.1, 0.5, 0.9])
+    >>> spread = stats['quantiles'].sel(quantile=0.9) - stats['quantiles'].sel(quantile=0.1)
+    """
+    if isinstance(ds, xr.Dataset):
+        merged = []
+        for name in ds.data_vars:
+            if dim in ds[name].dims:
+                stats = ensemble_statistics(ds[name], dim=dim, quantiles=quantiles, n_centroids=n_centroids, ddof=ddof, split_every=split_every)
+                merged.append(stats.rename({stat: f"{name}_{stat}" for stat in stats.data_vars}))
+        if not merged:
+            raise ValueError(f"No data variables have the dimension '{dim}'!!!")
+        return xr.merge(merged, combine_attrs='drop_conflicts')
+    if dim not in ds.dims:
+        raise ValueError(f"The DataArray has no dimension '{dim}'!!!")
+    quantiles = np.atleast_1d(np.asarray(quantiles, dtype=np.float64))
+    if np.any((quantiles < 0) | (quantiles > 1)):
+        raise ValueError("The quantiles must be in [0, 1]!!!")
+    axis = ds.get_axis_num(dim)
+    data = ds.data if isinstance(ds.data, dsa.Array) else dsa.from_array(ds.data, chunks=-1)
+    n_stats = len(STATISTICS) + len(quantiles)
+    dtype = np.float32 if data.dtype.itemsize <= 4 else np.float64
+    stats = dsa.reduction(
+        data,
+        functools.partial(_stats_chunk, n_centroids=n_centroids),
+        functools.partial(_stats_aggregate, n_centroids=n_centroids, quantiles=tuple(quantiles), ddof=ddof),
+        combine=functools.partial(_stats_combine, n_centroids=n_centroids),
+        axis=axis, keepdims=True, dtype=dtype, split_every=split_every, name='ensemble-statistics',
+        concatenate=False, output_size=n_stats, meta=np.empty((0,) * data.ndim, dtype=dtype))
+    stats = xr.DataArray(stats, dims=tuple('statistic' if d == dim else d for d in ds.dims),
+                         coords={name: coord for name, coord in ds.coords.items() if dim not in coord.dims})
+    result = xr.Dataset({stat: stats.isel(statistic=i, drop=True) for i, stat in enumerate(STATISTICS)})
+    result['count'] = result['count'].astype(np.int32)
+    result['std'] = np.sqrt(result['var'])
+    if len(quantiles):
+        result['quantiles'] = stats.isel(statistic=slice(len(STATISTICS), None)).rename(statistic='quantile').assign_coords(quantile=quantiles)
+    result.attrs = dict(ds.attrs)
+    result.attrs['ensemble_dim'] = dim
+    result.attrs['ensemble_size'] = ds.sizes[dim]
+    result.attrs['n_centroids'] = n_centroids
+    result.attrs['ddof'] = ddof
+    return result
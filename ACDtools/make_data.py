@@ -3,4 +3,765 @@ make_data.py
 
 This module contains workflows for making ARD collections for specific NCI datasets.
 Author = {"name": "Thomas Moore", "affiliation": "CSIRO", "email": "thomas.moore@csiro.au", "orcid": "0000-0003-3930-1946"}
-"""
\ No newline at end of file
+"""
+# Standard library imports
+import os
+import json
+import datetime
+
+
+# Third-party imports
+import cftime
+import dask.array as dsa
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+# Local application imports (if needed)
+#from .my_local_module import my_function
+
+# CMIP6 metadata of the variables the synthetic ACCESS-ESM1.5 generator can write
+SYNTHETIC_VARIABLES = {
+    'thetao': {'realm': 'ocean', 'units': 'degC', 'three_d': True,
+               'standard_name': 'sea_water_potential_temperature', 'long_name': 'Sea Water Potential Temperature'},
+    'so': {'realm': 'ocean', 'units': '0.001', 'three_d': True,
+           'standard_name': 'sea_water_salinity', 'long_name': 'Sea Water Salinity'},
+    'o2': {'realm': 'ocnBgchem', 'units': 'mol m-3', 'three_d': True,
+           'standard_name': 'mole_concentration_of_dissolved_molecular_oxygen_in_sea_water',
+           'long_name': 'Dissolved Oxygen Concentration'},
+    'chl': {'realm': 'ocnBgchem', 'units': 'kg m-3', 'three_d': True,
+            'standard_name': 'mass_concentration_of_phytoplankton_expressed_as_chlorophyll_in_sea_water',
+            'long_name': 'Mass Concentration of Total Phytoplankton Expressed as Chlorophyll in Sea Water'},
+    'tos': {'realm': 'ocean', 'units': 'degC', 'three_d': False,
+            'standard_name': 'sea_surface_temperature', 'long_name': 'Sea Surface Temperature'},
+}
+
+# intake-esm columns of the NCI CMIP6 (fs38) datastore that the ARD loaders rely on
+CATALOG_COLUMNS = ['path', 'file_type', 'activity_id', 'institution_id', 'source_id', 'experiment_id', 'member_id',
+                   'frequency', 'realm', 'table_id', 'variable_id', 'grid_label', 'version', 'time_range',
+                   'derived_variable_id']
+CATALOG_GROUPBY_ATTRS = ['file_type', 'activity_id', 'institution_id', 'source_id', 'experiment_id', 'member_id',
+                         'frequency', 'realm', 'table_id', 'variable_id', 'grid_label', 'version']
+
+def _synthetic_levels(nlev, max_depth=5500.0):
+    """
+    Stretched MOM-like level centres and bounds from the surface to max_depth.
+    """
+    edges = max_depth * (np.expm1(np.linspace(0, 3, nlev + 1)) / np.expm1(3))
+    lev_bnds = np.column_stack([edges[:-1], edges[1:]])
+    return lev_bnds.mean(axis=1), lev_bnds
+
+def _synthetic_grid(nj, ni):
+    """
+    ACCESS-OM-like curvilinear (j, i) grid: longitude from -279.5 E, latitude from -78 to 90 N, with cell vertices.
+    """
+    lon_edges = np.linspace(-280.0, 80.0, ni + 1)
+    lat_edges = np.linspace(-78.0, 90.0, nj + 1)
+    lon_centre = 0.5 * (lon_edges[:-1] + lon_edges[1:])
+    lat_centre = 0.5 * (lat_edges[:-1] + lat_edges[1:])
+    longitude, latitude = np.meshgrid(lon_centre, lat_centre)
+    # counter-clockwise from the south-west corner, as in the CMIP6 vertices_* variables
+    vertices_longitude = np.stack([np.meshgrid(lon_edges[a:ni + a], lat_centre)[0] for a in (0, 1, 1, 0)], axis=-1)
+    vertices_latitude = np.stack([np.meshgrid(lon_centre, lat_edges[b:nj + b])[1] for b in (0, 0, 1, 1)], axis=-1)
+    return longitude, latitude, vertices_longitude, vertices_latitude
+
+def _synthetic_field(block_info=None, variable_id='thetao', member_index=1, latitude=None, depth=None, ocean=None,
+                     time_index=None, dtype=np.float32):
+    """
+    Generate one (time, [lev,] j, i) block of a synthetic field: a depth / latitude profile plus a seasonal cycle, a
+    warming trend and member-specific noise.  The noise is seeded by member and block so every block is reproducible.
+    """
+    location = block_info[None]['array-location']
+    shape = block_info[None]['chunk-shape']
+    t = time_index[location[0][0]:location[0][1]].reshape((-1,) + (1,) * (len(shape) - 1))
+    rng = np.random.default_rng([member_index, int(t.ravel()[0]), list(SYNTHETIC_VARIABLES).index(variable_id)])
+    if depth is not None:
+        z = depth[location[1][0]:location[1][1]].reshape(1, -1, 1, 1)
+    else:
+        z = np.zeros((1, 1, 1))
+    lat = latitude
+    # time_index is in days since the start of the run
+    season = np.sin(2 * np.pi * t / 365.25) * np.sign(lat)
+    years = t / 365.25
+    if variable_id in ('thetao', 'tos'):
+        surface = 28.0 * np.cos(np.deg2rad(lat)) ** 2 - 1.0
+        field = 1.0 + (surface - 1.0) * np.exp(-z / 700.0) + 1.5 * season * np.exp(-z / 100.0) + 0.01 * years
+        noise = 0.3
+    elif variable_id == 'so':
+        field = 34.7 + 0.8 * np.cos(np.deg2rad(2 * lat)) * np.exp(-z / 500.0) + 0.05 * season
+        noise = 0.05
+    elif variable_id == 'o2':
+        # oxygen minimum zone near 700 m, deepest in the tropics
+        field = 0.25 - 0.18 * np.cos(np.deg2rad(lat)) ** 4 * np.exp(-((z - 700.0) / 500.0) ** 2) + 0.01 * season
+        noise = 0.005
+    else:
+        field = 5e-7 * np.exp(-z / 60.0) * (1.2 + 0.5 * season) * (1.0 + np.sin(np.deg2rad(lat)) ** 2)
+        noise = 5e-8
+    field = np.broadcast_to(field, shape) + noise * rng.standard_normal(shape)
+    land = ~ocean if depth is None else ~ocean[location[1][0]:location[1][1]]
+    return np.where(np.broadcast_to(land, shape), np.nan, field).astype(dtype)
+
+def make_synthetic_ACCESS_ESM(root_dir, variables=('thetao',), experiment_id='historical', n_members=3,
+                              start_year=1850, n_years=2, years_per_file=1, frequency='mon', nj=30, ni=36, nlev=50,
+                              chunk_sizes=None, version='v20191115'):
+    """
+    Write synthetic NetCDF4 files that mimic CMIP6 ACCESS-ESM1.5 ocean output, plus a matching intake-esm catalog, so
+    the ARD loaders, rechunking and ocean kernels can be run and benchmarked on any Linux box without NCI access.
+
+    Files follow the NCI (fs38) CMIP6 directory and file naming, one directory per r<n>i1p1f1 member, with
+    cftime-encoded time and time_bnds (days since 1850-01-01, proleptic_gregorian), `lev` and `lev_bnds`, a
+    curvilinear j/i grid with `latitude`, `longitude` and `vertices_*`, a land mask with bathymetry, and the data
+    variable stored compressed with explicit NetCDF4 chunk sizes (reported as `_ChunkSizes` by `ncdump -hs`).
+
+    Parameters
+    ----------
+    root_dir : str
+        Directory the CMIP6 tree and the catalog are written to.
+    variables : sequence of str, optional
+        Variables to write, from SYNTHETIC_VARIABLES ('thetao', 'so', 'o2', 'chl', 'tos'). Default is ('thetao',).
+    experiment_id : str, optional
+        CMIP6 experiment. 'ssp*' experiments are written under ScenarioMIP, others under CMIP. Default is 'historical'.
+    n_members : int, optional
+        Number of ensemble members r1i1p1f1 ... r<n_members>i1p1f1. Default is 3.
+    start_year : int, optional
+        First year of the data. Default is 1850.
+    n_years : int, optional
+        Number of years per member. Default is 2.
+    years_per_file : int, optional
+        Number of years in each file. Default is 1.
+    frequency : str, optional
+        'mon' (Omon, monthly means) or 'day' (Oday, daily means). Default is 'mon'.
+    nj, ni, nlev : int, optional
+        Grid size. ACCESS-ESM1.5 ocean is nj=300, ni=360, nlev=50; the defaults are a 10x coarser horizontal grid.
+    chunk_sizes : dict, optional
+        On-disk chunk sizes by dimension name, e.g. {'time': 1, 'lev': 50, 'j': 300, 'i': 360}. Default is None,
+        one time step and the full lev/j/i extent per chunk.
+    version : str, optional
+        Dataset version directory. Default is 'v20191115'.
+
+    Returns
+    -------
+    str
+        Path of the intake-esm catalog JSON, to be opened with `intake.open_esm_datastore`.
+
+    Examples
+    --------
+    >>> catalog_path = make_synthetic_ACCESS_ESM('/tmp/synthetic', variables=['o2', 'thetao'], n_members=4)
+    >>> catalog = intake.open_esm_datastore(catalog_path)
+    >>> ds = ard.load_ACCESS_ESM_ensemble(catalog.search(variable_id='o2'), use_cftime=True)
+    """
+    if frequency not in ('mon', 'day'):
+        raise ValueError("frequency must be 'mon' or 'day'!!!")
+    table_id = 'Omon' if frequency == 'mon' else 'Oday'
+    activity_id = 'ScenarioMIP' if experiment_id.startswith('ssp') else 'CMIP'
+    source_id = 'ACCESS-ESM1-5'
+    lev, lev_bnds = _synthetic_levels(nlev)
+    longitude, latitude, vertices_longitude, vertices_latitude = _synthetic_grid(nj, ni)
+    # bathymetry shoaling towards a continent in the middle of the grid
+    distance = np.hypot((longitude + 100.0) / 60.0, latitude / 40.0)
+    bathymetry = np.clip(5500.0 * (distance - 0.5), 0.0, 5500.0)
+    ocean_3d = lev[:, None, None] < bathymetry[None, :, :]
+    units = 'days since 1850-01-01'
+    calendar = 'proleptic_gregorian'
+    records = []
+    for variable_id in variables:
+        spec = SYNTHETIC_VARIABLES[variable_id]
+        three_d = spec['three_d']
+        for member in range(1, n_members + 1):
+            member_id = f'r{member}i1p1f1'
+            directory = os.path.join(root_dir, 'CMIP6', activity_id, 'CSIRO', source_id, experiment_id, member_id,
+                                     table_id, variable_id, 'gn', version)
+            os.makedirs(directory, exist_ok=True)
+            for file_start in range(start_year, start_year + n_years, years_per_file):
+                file_end = min(file_start + years_per_file, start_year + n_years) - 1
+                if frequency == 'mon':
+                    bounds = [cftime.datetime(year + month // 12, month % 12 + 1, 1, calendar=calendar)
+                              for year in range(file_start, file_end + 1) for month in range(12)]
+                    bounds.append(cftime.datetime(file_end + 1, 1, 1, calendar=calendar))
+                    time_range = f'{file_start}01-{file_end}12'
+                else:
+                    first = cftime.datetime(file_start, 1, 1, calendar=calendar)
+                    n_days = (cftime.datetime(file_end + 1, 1, 1, calendar=calendar) - first).days
+                    bounds = [first + datetime.timedelta(days=day) for day in range(n_days + 1)]
+                    time_range = f'{file_start}0101-{file_end}1231'
+                time_bnds = cftime.date2num(np.array(bounds), units, calendar=calendar)
+                time_bnds = np.column_stack([time_bnds[:-1], time_bnds[1:]])
+                time = time_bnds.mean(axis=1)
+                time_index = time - cftime.date2num(cftime.datetime(start_year, 1, 1, calendar=calendar), units,
+                                                    calendar=calendar)
+                dims = ('time', 'lev', 'j', 'i') if three_d else ('time', 'j', 'i')
+                shape = (time.size, nlev, nj, ni) if three_d else (time.size, nj, ni)
+                disk_chunks = {'time': 1, 'lev': nlev, 'j': nj, 'i': ni}
+                disk_chunks.update(chunk_sizes or {})
+                disk_chunks = tuple(min(disk_chunks[dim], size) for dim, size in zip(dims, shape))
+                data = dsa.map_blocks(
+                    _synthetic_field, dtype=np.float32,
+                    chunks=dsa.core.normalize_chunks((disk_chunks[0],) + shape[1:], shape),
+                    variable_id=variable_id, member_index=member, latitude=latitude,
+                    depth=lev if three_d else None, ocean=ocean_3d if three_d else ocean_3d[0],
+                    time_index=time_index)
+                ds = xr.Dataset(
+                    {variable_id: (dims, data, {'standard_name': spec['standard_name'], 'long_name': spec['long_name'],
+                                                'units': spec['units'], 'cell_methods': 'area: mean where sea time: mean',
+                                                'cell_measures': 'area: areacello volume: volcello' if three_d
+                                                else 'area: areacello'}),
+                     'time_bnds': (('time', 'bnds'), cftime.num2date(time_bnds, units, calendar=calendar)),
+                     'latitude': (('j', 'i'), latitude, {'standard_name': 'latitude', 'long_name': 'latitude',
+                                                         'units': 'degrees_north', 'bounds': 'vertices_latitude'}),
+                     'longitude': (('j', 'i'), longitude, {'standard_name': 'longitude', 'long_name': 'longitude',
+                                                           'units': 'degrees_east', 'bounds': 'vertices_longitude'}),
+                     'vertices_latitude': (('j', 'i', 'vertices'), vertices_latitude, {'units': 'degrees_north'}),
+                     'vertices_longitude': (('j', 'i', 'vertices'), vertices_longitude, {'units': 'degrees_east'})},
+                    coords={'time': ('time', cftime.num2date(time, units, calendar=calendar),
+                                     {'bounds': 'time_bnds', 'axis': 'T', 'standard_name': 'time', 'long_name': 'time'}),
+                            'j': ('j', np.arange(nj, dtype=np.int32), {'long_name': 'cell index along second dimension', 'units': '1'}),
+                            'i': ('i', np.arange(ni, dtype=np.int32), {'long_name': 'cell index along first dimension', 'units': '1'})})
+                if three_d:
+                    ds = ds.assign_coords(lev=('lev', lev, {'bounds': 'lev_bnds', 'units': 'm', 'axis': 'Z',
+                                                            'positive': 'down', 'standard_name': 'depth',
+                                                            'long_name': 'ocean depth coordinate'}))
+                    ds['lev_bnds'] = (('lev', 'bnds'), lev_bnds)
+                ds = ds.set_coords(['latitude', 'longitude'])
+                ds.attrs = {'Conventions': 'CF-1.7 CMIP-6.2', 'activity_id': activity_id, 'institution_id': 'CSIRO',
+                            'source_id': source_id, 'experiment_id': experiment_id, 'variant_label': member_id,
+                            'realization_index': member, 'initialization_index': 1, 'physics_index': 1,
+                            'forcing_index': 1, 'table_id': table_id, 'frequency': frequency,
+                            'realm': spec['realm'], 'grid_label': 'gn', 'variable_id': variable_id,
+                            'title': 'Synthetic ACCESS-ESM1.5 output written by ACDtools.make_data for benchmarking'}
+                encoding = {variable_id: {'zlib': True, 'complevel': 1, 'shuffle': True, 'chunksizes': disk_chunks,
+                                          '_FillValue': np.float32(1e20)},
+                            'time': {'units': units, 'calendar': calendar, 'dtype': 'float64', '_FillValue': None},
+                            'time_bnds': {'units': units, 'calendar': calendar, 'dtype': 'float64', '_FillValue': None}}
+                filename = f'{variable_id}_{table_id}_{source_id}_{experiment_id}_{member_id}_gn_{time_range}.nc'
+                path = os.path.join(directory, filename)
+                ds.to_netcdf(path, format='NETCDF4', engine='netcdf4', encoding=encoding, unlimited_dims=['time'])
+                records.append({'path': path, 'file_type': 'l', 'activity_id': activity_id, 'institution_id': 'CSIRO',
+                                'source_id': source_id, 'experiment_id': experiment_id, 'member_id': member_id,
+                                'frequency': frequency, 'realm': spec['realm'], 'table_id': table_id,
+                                'variable_id': variable_id, 'grid_label': 'gn', 'version': version,
+                                'time_range': time_range, 'derived_variable_id': ''})
+    print(f"Wrote {len(records)} synthetic ACCESS-ESM1.5 files under {root_dir}")
+    return write_intake_esm_catalog(pd.DataFrame.from_records(records, columns=CATALOG_COLUMNS), root_dir)
+
+def write_intake_esm_catalog(df, catalog_dir, name='synthetic_cmip6_ACCESS-ESM1-5', groupby_attrs=None):
+    """
+    Write an intake-esm catalog (CSV table plus JSON description) for a DataFrame of NetCDF files, with the same
+    columns and aggregation (union over variable_id, join along time over time_range) as the NCI CMIP6 datastore.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        One row per file with the CATALOG_COLUMNS columns.
+    catalog_dir : str
+        Directory the catalog files are written to.
+    name : str, optional
+        Catalog id and file name stem. Default is 'synthetic_cmip6_ACCESS-ESM1-5'.
+    groupby_attrs : list of str, optional
+        Columns that define a dataset key. Default is CATALOG_GROUPBY_ATTRS, for which the member_id is the sixth
+        '.'-separated field of the key as `ard.load_ACCESS_ESM_ensemble` expects.
+
+    Returns
+    -------
+    str
+        Path of the catalog JSON.
+
+    Examples
+    --------
+    >>> catalog = intake.open_esm_datastore(write_intake_esm_catalog(df, '/tmp/synthetic'))
+    """
+    os.makedirs(catalog_dir, exist_ok=True)
+    csv_path = os.path.join(catalog_dir, f'{name}.csv')
+    json_path = os.path.join(catalog_dir, f'{name}.json')
+    df.to_csv(csv_path, index=False)
+    esmcat = {
+        'esmcat_version': '0.1.0',
+        'id': name,
+        'description': 'Synthetic CMIP6 ACCESS-ESM1.5 collection written by ACDtools.make_data',
+        'catalog_file': os.path.basename(csv_path),
+        'attributes': [{'column_name': column, 'vocabulary': ''} for column in df.columns if column != 'path'],
+        'assets': {'column_name': 'path', 'format': 'netcdf'},
+        'aggregation_control': {
+            'variable_column_name': 'variable_id',
+            'groupby_attrs': list(groupby_attrs or CATALOG_GROUPBY_ATTRS),
+            'aggregations': [
+                {'type': 'union', 'attribute_name': 'variable_id'},
+                {'type': 'join_existing', 'attribute_name': 'time_range',
+                 'options': {'dim': 'time', 'coords': 'minimal', 'compat': 'override'}}]}}
+    with open(json_path, 'w') as file:
+        json.dump(esmcat, file, indent=2)
+    return json_path
+
+# checkpoint manifest of write_ard_zarr, written next to the Zarr store as <store>.manifest.json
+ZARR_MANIFEST_SUFFIX = '.manifest.json'
+
+def _region_blocks(ds, region_sizes):
+    """
+    Split the region dimensions into blocks of region_sizes, checking that every block boundary is also a dask chunk
+    boundary so that no Zarr chunk is written by two blocks. Returns a list of {dim: slice} regions.
+    """
+    blocks = [{}]
+    for dim, size in region_sizes.items():
+        length = ds.sizes[dim]
+        size = length if size in (None, -1) else size
+        chunk_bounds = set(np.cumsum((0,) + ds.chunksizes[dim])) if dim in ds.chunksizes else {0, length}
+        starts = list(range(0, length, size))
+        if not set(starts).issubset(chunk_bounds):
+            raise ValueError(f"The region size {size} along '{dim}' is not a multiple of the dask chunks {ds.chunksizes.get(dim)}!!! Rechunk ds or change region_sizes.")
+        blocks = [dict(block, **{dim: slice(start, min(start + size, length))}) for block in blocks for start in starts]
+    return blocks
+
+def _region_key(region):
+    """
+    Manifest key of a region, e.g. 'member=0:1,time=0:120'.
+    """
+    return ','.join(f"{dim}={region[dim].start}:{region[dim].stop}" for dim in sorted(region))
+
+def _write_manifest(manifest_path, manifest):
+    """
+    Write the checkpoint manifest atomically (temporary file + rename) so an interrupted job never leaves it corrupt.
+    """
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+def write_ard_zarr(ds, store, region_sizes=None, consolidated=True, resume=True, max_concurrent=None, registry_dir=None):
+    """
+    Write a dask-backed dataset to a Zarr store block by block so a job that hits walltime or loses workers can be
+    rerun and resume where it stopped.
+
+    The store metadata, the in-memory (coordinate) variables and the dask-backed variables without a region dimension
+    (e.g. area, lev_bnds) are written first, then the other dask-backed variables are written with
+    `to_zarr(region=...)` in blocks along region_sizes (e.g. one member x 120 time steps). Completed
+    blocks are recorded in a checkpoint manifest `<store>.manifest.json` next to the store, so a rerun writes only
+    the missing blocks. Blocks are written concurrently - on the dask.distributed cluster when a client is running,
+    otherwise from a local thread pool - and the manifest is updated as each one finishes.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        Dataset to write, chunked as it should be stored and with the encoding removed (`util.remove_encoding`).
+    store : str
+        Path of the Zarr store.
+    region_sizes : dict, optional
+        Block size by dimension, each a multiple of the dask chunks along that dimension (None or -1 for the full
+        dimension). Default is None, one block per member if ds has a 'member' dimension, otherwise per time chunk.
+    consolidated : bool, optional
+        Consolidate the store metadata once every block is written. Default is True.
+    resume : bool, optional
+        Resume from the manifest of an earlier run of the same write. If False the store is overwritten. Default is
+        True.
+    max_concurrent : int, optional
+        Maximum number of blocks written at once without a dask.distributed client. Default is None, the dask thread
+        count.
+    registry_dir : str, optional
+        Register the completed store in the ARD registry of this directory (`ard.register_ard_store`), usually
+        paths.write_dir. The store must then be named as `ard.ard_store_name`. Default is None, not registered.
+
+    Returns
+    -------
+    str
+        Path of the Zarr store.
+
+    Examples
+    --------
+    >>> write_ard_zarr(ds, write_dir + 'ACCESS-ESM1-5.historical.o2.base.v20250101_000000.zarr',
+    ...                region_sizes={'member': 1, 'time': 120})
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    import zarr
+    store = store.rstrip('/')
+    manifest_path = store + ZARR_MANIFEST_SUFFIX
+    if region_sizes is None:
+        if 'member' in ds.dims:
+            region_sizes = {'member': 1}
+        elif 'time' in ds.dims:
+            region_sizes = {'time': ds.chunksizes['time'][0] if 'time' in ds.chunksizes else None}
+        else:
+            raise ValueError("ds has no 'member' or 'time' dimension, please provide region_sizes!!!")
+    missing = [dim for dim in region_sizes if dim not in ds.dims]
+    if missing:
+        raise ValueError(f"The region dimensions {missing} are not dimensions of ds!!!")
+    regions = _region_blocks(ds, region_sizes)
+    # what identifies this write - a manifest from a different dataset or blocking is never resumed
+    fingerprint = {
+        'sizes': {dim: int(size) for dim, size in ds.sizes.items()},
+        'variables': sorted(map(str, ds.variables)),
+        'chunks': {dim: [int(size) for size in sizes] for dim, sizes in ds.chunksizes.items()},
+        'region_sizes': {dim: (None if size is None else int(size)) for dim, size in region_sizes.items()},
+    }
+    manifest = None
+    if resume and os.path.exists(manifest_path) and os.path.exists(store):
+        with open(manifest_path) as file:
+            manifest = json.load(file)
+        if manifest['fingerprint'] != fingerprint:
+            raise ValueError(f"The checkpoint manifest {manifest_path} was written for a different dataset or region_sizes!!! Use resume=False to overwrite the store.")
+        print(f"Resuming the Zarr write to {store}: {len(manifest['completed'])} of {len(regions)} blocks already written")
+    # only the dask-backed variables that overlap the region dimensions are written by region
+    region_vars = [name for name, variable in ds.variables.items()
+                   if variable.chunks is not None and set(variable.dims) & set(region_sizes)]
+    static_vars = [name for name, variable in ds.variables.items() if variable.chunks is not None and name not in region_vars]
+    if manifest is None:
+        # metadata and in-memory variables, then the dask-backed variables outside the regions - the rest of the
+        # dask-backed data are written by region below
+        ds.to_zarr(store, mode='w', compute=False, consolidated=False)
+        if static_vars:
+            ds[static_vars].drop_vars([name for name in ds.coords if name not in static_vars], errors='ignore').to_zarr(
+                store, mode='r+', consolidated=False)
+        manifest = {'store': store, 'fingerprint': fingerprint, 'completed': [], 'complete': False,
+                    'started': datetime.datetime.now().strftime("%Y%m%d_%H%M%S")}
+        _write_manifest(manifest_path, manifest)
+        print(f"Initialised the Zarr store {store} with {len(regions)} blocks to write")
+    completed = set(manifest['completed'])
+    pending = [region for region in regions if _region_key(region) not in completed]
+    def block_write(region):
+        block = ds[region_vars].isel(region).drop_vars([name for name in ds.coords if name not in region_vars], errors='ignore')
+        return block.to_zarr(store, region=region, compute=False, consolidated=False)
+    def block_done(region):
+        manifest['completed'].append(_region_key(region))
+        _write_manifest(manifest_path, manifest)
+    try:
+        from dask.distributed import as_completed as distributed_as_completed, get_client
+        client = get_client()
+    except (ImportError, ValueError):
+        client = None
+    if client is not None:
+        futures = {client.compute(block_write(region)): region for region in pending}
+        for future in distributed_as_completed(futures):
+            future.result()
+            block_done(futures[future])
+    else:
+        with ThreadPoolExecutor(max_workers=max_concurrent or os.cpu_count()) as pool:
+            futures = {pool.submit(lambda region: block_write(region).compute(), region): region for region in pending}
+            for future in as_completed(futures):
+                future.result()
+                block_done(futures[future])
+    if consolidated:
+        zarr.consolidate_metadata(store)
+    manifest['complete'] = True
+    manifest['finished'] = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    _write_manifest(manifest_path, manifest)
+    print(f"Finished the Zarr write to {store}: wrote {len(pending)} blocks")
+    if registry_dir is not None:
+        from .ard import register_ard_store
+        register_ard_store(registry_dir, store)
+    return store
+
+def _consolidate_chunks(shape, chunks, itemsize, max_mem, limits=None):
+    """
+    Grow chunks by whole multiples, dimension by dimension from the first, up to limits (default the full shape)
+    while a chunk stays within max_mem bytes.
+    """
+    chunks = list(chunks)
+    limits = shape if limits is None else limits
+    for axis in range(len(shape)):
+        other_bytes = itemsize * int(np.prod(chunks[:axis] + chunks[axis + 1:]))
+        n_fit = max(max_mem // (other_bytes * chunks[axis]), 1)
+        n_limit = max(-(-min(limits[axis], shape[axis]) // chunks[axis]), 1)
+        chunks[axis] = min(chunks[axis] * min(n_fit, n_limit), shape[axis])
+    return tuple(chunks)
+
+def _chunks_nest(inner, outer, shape):
+    """
+    True when every chunk of the inner chunking lies within a single chunk of the outer chunking.
+    """
+    return all(outer_chunk >= length or outer_chunk % inner_chunk == 0 for inner_chunk, outer_chunk, length in zip(inner, outer, shape))
+
+def _rechunk_plan(shape, source_chunks, target_chunks_list, itemsize, max_mem):
+    """
+    Two-stage rechunking plan (after the rechunker algorithm) for one array and several target chunkings sharing a
+    single read of the source.
+
+    Returns the read chunks, the write chunks of each target, a flag per target that is True when it can be written
+    directly from the read chunks (every write chunk within one read chunk, or every read chunk within one write
+    chunk, so the chunks must divide each other - a write chunk straddling two read chunks would need both in memory)
+    and the chunks of the shared intermediate used by the other targets. Every task then holds at most about two
+    read, intermediate or write chunks, each within max_mem.
+    """
+    write_chunks_list = []
+    for target_chunks in target_chunks_list:
+        if itemsize * int(np.prod(target_chunks)) > max_mem:
+            raise ValueError(f"The target chunks {target_chunks} ({itemsize * int(np.prod(target_chunks))} bytes) are larger than max_mem={max_mem} bytes!!!")
+        write_chunks_list.append(_consolidate_chunks(shape, target_chunks, itemsize, max_mem))
+    if itemsize * int(np.prod(source_chunks)) > max_mem:
+        raise ValueError(f"The source chunks {source_chunks} are larger than max_mem={max_mem} bytes!!!")
+    # grow reads towards the largest write chunks, never beyond the memory cap
+    read_limits = tuple(max([source] + [write[axis] for write in write_chunks_list]) for axis, source in enumerate(source_chunks))
+    read_chunks = _consolidate_chunks(shape, source_chunks, itemsize, max_mem, read_limits)
+    direct = [_chunks_nest(write_chunks, read_chunks, shape) or _chunks_nest(read_chunks, write_chunks, shape)
+              for write_chunks in write_chunks_list]
+    staged = [write for write, is_direct in zip(write_chunks_list, direct) if not is_direct]
+    int_chunks = tuple(min([read] + [write[axis] for write in staged]) for axis, read in enumerate(read_chunks)) if staged else None
+    return read_chunks, write_chunks_list, direct, int_chunks
+
+def rechunk_ard_zarr(source, targets, max_mem='2GB', temp_store=None, consolidated=True, registry_dir=None):
+    """
+    Rechunk an ARD Zarr store into several chunk layouts (e.g. chunk4member, chunk4time and chunk4time4member) from
+    a single read of the source, with bounded memory.
+
+    Each dask-backed variable is planned in the style of the rechunker algorithm: the source is read once in chunks
+    grown up to max_mem; targets whose chunks nest with the read chunks are written directly from those reads, and
+    the others go through one shared intermediate Zarr store (written in the same pass as the direct targets) that
+    is then read to write their layouts. No task holds more than about two chunks of max_mem, unlike
+    `ds.chunk(...).to_zarr(...)` whose all-to-all rechunk can hold the whole array.
+
+    Parameters
+    ----------
+    source : str
+        Path of the source Zarr store, e.g. the base ARD store.
+    targets : dict
+        {target store path: {dim: chunk size}}. -1 is the full dimension and dimensions not given keep the source
+        chunks, as in `Dataset.chunk`.
+    max_mem : int or str, optional
+        Memory cap per task in bytes or as a string such as '2GB'. Default is '2GB'.
+    temp_store : str, optional
+        Path of the intermediate store. Default is None, '<source>.rechunk-tmp.zarr'. It is deleted at the end.
+    consolidated : bool, optional
+        Consolidate the metadata of the target stores. Default is True.
+    registry_dir : str, optional
+        Register the completed target stores in the ARD registry of this directory (`ard.register_ard_store`).
+        Default is None, not registered.
+
+    Returns
+    -------
+    list of str
+        Paths of the target stores.
+
+    Examples
+    --------
+    >>> rechunk_ard_zarr(base_store, {chunk4member_store: {'member': -1, 'time': 1, 'lev': 25},
+    ...                               chunk4time_store: {'time': -1, 'lev': 1, 'i': 150},
+    ...                               chunk4time4member_store: {'time': -1, 'lev': 1, 'member': -1, 'i': 36, 'j': 30}})
+    """
+    import shutil
+    import dask
+    from dask.utils import parse_bytes
+    max_mem = parse_bytes(max_mem) if isinstance(max_mem, str) else int(max_mem)
+    source = source.rstrip('/')
+    temp_store = temp_store or source + '.rechunk-tmp.zarr'
+    ds = xr.open_zarr(source, chunks={}, consolidated=None)
+    target_paths = list(targets)
+    # per target: the dataset written from the source read (stage 1) and the variables staged through the intermediate
+    direct_datasets = [ds.copy() for _ in target_paths]
+    staged_variables = [{} for _ in target_paths]
+    intermediate = xr.Dataset()
+    for name, variable in ds.variables.items():
+        for target_ds in direct_datasets:
+            target_ds[name].encoding = {}
+        if variable.chunks is None or variable.ndim == 0:
+            continue
+        shape = variable.shape
+        source_chunks = tuple(chunks[0] for chunks in variable.chunks)
+        target_chunks_list = [tuple(length if target.get(dim, source_chunk) == -1 else min(target.get(dim, source_chunk), length)
+                                    for dim, source_chunk, length in zip(variable.dims, source_chunks, shape))
+                              for target in targets.values()]
+        read_chunks, write_chunks_list, direct, int_chunks = _rechunk_plan(shape, source_chunks, target_chunks_list,
+                                                                           variable.dtype.itemsize, max_mem)
+        print(f"{name}: source {source_chunks} -> read {read_chunks} -> "
+              + ", ".join(f"{'direct' if is_direct else 'staged'} {write}" for write, is_direct in zip(write_chunks_list, direct)))
+        read = variable.data.rechunk(read_chunks)
+        if int_chunks is not None:
+            intermediate[name] = xr.Variable(variable.dims, read.rechunk(int_chunks), variable.attrs)
+            intermediate[name].encoding = {'chunks': int_chunks}
+        for index, (target_chunks, write_chunks, is_direct) in enumerate(zip(target_chunks_list, write_chunks_list, direct)):
+            if is_direct:
+                direct_datasets[index][name] = direct_datasets[index][name].copy(data=read.rechunk(write_chunks))
+                direct_datasets[index][name].encoding = {'chunks': target_chunks}
+            else:
+                staged_variables[index][name] = (write_chunks, target_chunks)
+    # stage 1 - one read of the source writes the direct variables of every target and the shared intermediate
+    stage1 = [target_ds.drop_vars(list(staged)).to_zarr(path, mode='w', compute=False, consolidated=False)
+              for path, target_ds, staged in zip(target_paths, direct_datasets, staged_variables)]
+    if intermediate.variables:
+        stage1.append(intermediate.to_zarr(temp_store, mode='w', compute=False, consolidated=False))
+    print(f"Stage 1: reading {source} once to write {len(target_paths)} layouts"
+          + (f" and the intermediate store {temp_store}" if intermediate.variables else ""))
+    dask.compute(*stage1)
+    # stage 2 - the staged variables are added to their targets from the intermediate, merging intermediate chunks
+    if intermediate.variables:
+        import zarr
+        staged_ds = xr.open_zarr(temp_store, chunks={}, consolidated=False)
+        # an append replaces the group attributes - keep the dataset attributes and coordinates written in stage 1
+        group_attrs = {path: zarr.open_group(path, mode='r').attrs.asdict() for path in target_paths}
+        stage2 = []
+        for path, staged in zip(target_paths, staged_variables):
+            if not staged:
+                continue
+            target_ds = xr.Dataset()
+            for name, (write_chunks, target_chunks) in staged.items():
+                target_ds[name] = ds[name].variable.copy(data=staged_ds[name].data.rechunk(write_chunks))
+                target_ds[name].encoding = {'chunks': target_chunks}
+            stage2.append(target_ds.to_zarr(path, mode='a', compute=False, consolidated=False))
+        print(f"Stage 2: writing the staged variables of {len(stage2)} layouts from the intermediate store")
+        dask.compute(*stage2)
+        for path, attrs in group_attrs.items():
+            zarr.open_group(path, mode='r+').attrs.update(attrs)
+        shutil.rmtree(temp_store, ignore_errors=True)
+    if consolidated:
+        import zarr
+        for path in target_paths:
+            zarr.consolidate_metadata(path)
+    if registry_dir is not None:
+        from .ard import register_ard_store
+        for path in target_paths:
+            register_ard_store(registry_dir, path)
+    return target_paths
+
+# named codec and precision profiles for ARD Zarr writes, applied with apply_write_profile:
+#   compressor - (Blosc compressor name, level), shuffle - 'shuffle', 'bitshuffle' or None, dtype - floating point data
+#   are downcast to this dtype, inflevel - fraction of the real information content kept by bit-rounding the mantissa,
+#   min_keepbits - floor on the mantissa bits kept for inflevel (7 bits: relative error <= 2**-8, ~0.4%; 10 bits:
+#   <= 2**-11, ~0.05%), as noisy fields carry little real information in the mantissa, keepbits - a fixed number of
+#   mantissa bits kept instead
+WRITE_PROFILES = {
+    'lossless': {'compressor': ('zstd', 3), 'shuffle': 'shuffle', 'dtype': None, 'inflevel': None, 'min_keepbits': None, 'keepbits': None},
+    'float32': {'compressor': ('zstd', 3), 'shuffle': 'shuffle', 'dtype': 'float32', 'inflevel': None, 'min_keepbits': None, 'keepbits': None},
+    'bitround-99.9': {'compressor': ('zstd', 3), 'shuffle': 'bitshuffle', 'dtype': 'float32', 'inflevel': 0.999, 'min_keepbits': 10, 'keepbits': None},
+    'bitround-99': {'compressor': ('zstd', 3), 'shuffle': 'bitshuffle', 'dtype': 'float32', 'inflevel': 0.99, 'min_keepbits': 7, 'keepbits': None},
+    'archive': {'compressor': ('zstd', 9), 'shuffle': 'bitshuffle', 'dtype': 'float32', 'inflevel': 0.99, 'min_keepbits': 7, 'keepbits': None},
+}
+# number of slices, spread over the leading dimensions, sampled to estimate the information content
+_INFORMATION_SAMPLES = 8
+
+# mantissa bits and matching unsigned integer type of the floating point dtypes that can be bit-rounded
+_MANTISSA_BITS = {np.dtype('float32'): (23, np.uint32), np.dtype('float64'): (52, np.uint64)}
+
+def bitround(data, keepbits):
+    """
+    Round the mantissa of floating point data to keepbits bits (round to nearest, ties to even), so the trailing
+    mantissa bits are zero and compress away. Non-finite values are left unchanged.
+    """
+    data = np.asarray(data)
+    n_mantissa, uint = _MANTISSA_BITS[data.dtype]
+    if keepbits >= n_mantissa:
+        return data
+    drop = uint(n_mantissa - keepbits)
+    bits = data.view(uint)
+    half_minus_one = uint((1 << (n_mantissa - keepbits - 1)) - 1)
+    rounded = (bits + half_minus_one + ((bits >> drop) & uint(1))) & ~uint((1 << (n_mantissa - keepbits)) - 1)
+    return np.where(np.isfinite(data), rounded.view(data.dtype), data)
+
+def _bit_information(data):
+    """
+    Real information content of each bit of floating point data (Klöwer et al. 2021, Nat. Comput. Sci.): the mutual
+    information between bit i of neighbouring values along the last axis, set to zero where it is not significant at
+    the 99% level. Returns one value per bit, sign bit first.
+    """
+    n_mantissa, uint = _MANTISSA_BITS[data.dtype]
+    n_bits = 8 * data.dtype.itemsize
+    data = np.asarray(data)
+    pairs = np.isfinite(data[..., :-1]) & np.isfinite(data[..., 1:])
+    a, b = data[..., :-1].view(uint)[pairs], data[..., 1:].view(uint)[pairs]
+    n = a.size
+    information = np.zeros(n_bits)
+    if n == 0:
+        return information
+    # binomial 99% significance threshold of the mutual information for n samples
+    p = min(0.5 + 0.5 * 2.5758 / np.sqrt(n), 1.0)
+    threshold = 1 + p * np.log2(p) + (1 - p) * np.log2(1 - p) if p < 1 else 1.0
+    for position in range(n_bits):
+        shift = uint(n_bits - 1 - position)
+        bit_a, bit_b = (a >> shift) & uint(1), (b >> shift) & uint(1)
+        joint = np.bincount((2 * bit_a + bit_b).astype(np.intp), minlength=4).reshape(2, 2) / n
+        marginal = np.outer(joint.sum(axis=1), joint.sum(axis=0))
+        nonzero = joint > 0
+        mutual = np.sum(joint[nonzero] * np.log2(joint[nonzero] / marginal[nonzero]))
+        information[position] = mutual if mutual > threshold else 0.0
+    return information
+
+def keepbits_for_information(data, inflevel=0.99, min_keepbits=0):
+    """
+    Number of mantissa bits to keep so that bit-rounding preserves the fraction inflevel of the real information
+    content of the mantissa of data (a representative sample, e.g. a few time steps), and at least min_keepbits.
+    When no mantissa bit carries significant information (e.g. too small a sample) nothing is known, and the full
+    mantissa is kept.
+    """
+    data = np.asarray(data)
+    n_mantissa, _ = _MANTISSA_BITS[data.dtype]
+    information = _bit_information(data)[-n_mantissa:]
+    if information.sum() == 0:
+        return n_mantissa
+    cumulative = np.cumsum(information) / information.sum()
+    return int(min(max(np.searchsorted(cumulative, inflevel) + 1, min_keepbits), n_mantissa))
+
+def _information_sample(da, n_samples=_INFORMATION_SAMPLES):
+    """
+    Up to n_samples slices of the last two dimensions of da, spread evenly over its leading dimensions.
+    """
+    leading = da.shape[:-2]
+    if not leading:
+        return da.values
+    positions = np.unique(np.linspace(0, int(np.prod(leading)) - 1, n_samples).round().astype(np.int64))
+    index = np.unravel_index(positions, leading)
+    return da.isel({dim: xr.DataArray(axis_index, dims='sample') for dim, axis_index in zip(da.dims[:-2], index)}).values
+
+def _profile_compressor_encoding(compressor, shuffle):
+    """
+    Zarr encoding for a Blosc compressor - `compressors` for zarr-python 3 (Zarr v3 format), `compressor` for
+    zarr-python 2.
+    """
+    import zarr
+    cname, clevel = compressor
+    if int(zarr.__version__.split('.')[0]) >= 3:
+        from zarr.codecs import BloscCodec
+        return {'compressors': [BloscCodec(cname=cname, clevel=clevel, shuffle=shuffle or 'noshuffle')]}
+    from numcodecs import Blosc
+    shuffles = {'shuffle': Blosc.SHUFFLE, 'bitshuffle': Blosc.BITSHUFFLE, None: Blosc.NOSHUFFLE}
+    return {'compressor': Blosc(cname=cname, clevel=clevel, shuffle=shuffles[shuffle])}
+
+def apply_write_profile(ds, profile='bitround-99', variables=None, sample=None):
+    """
+    Prepare a dataset for `to_zarr` with a named codec and precision profile (see WRITE_PROFILES): downcast floating
+    point data, bit-round the mantissas to keep a stated fraction of their real information content, and set the
+    compressor and shuffle filter in the encoding. Replaces `util.remove_encoding` before an ARD write; the existing
+    encoding other than the chunks is dropped.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        Dataset to write.
+    profile : str or dict, optional
+        A name in WRITE_PROFILES or a profile dict with the same keys. Default is 'bitround-99'.
+    variables : list of str, optional
+        Variables to downcast and bit-round. Default is None, all floating point data variables. Coordinates are
+        only compressed.
+    sample : dict, optional
+        `isel` selection of the sample used to estimate the information content, e.g. {'time': slice(0, 12)}.
+        Default is None, 8 slices of the last two dimensions spread evenly over the other dimensions.
+
+    Returns
+    -------
+    xarray.Dataset
+        The dataset with lazily rounded data and the profile encoding; `attrs['write_profile']` and, per bit-rounded
+        variable, `attrs['keepbits']` (and `attrs['inflevel']` when it was estimated) record what was applied.
+
+    Examples
+    --------
+    >>> write_ard_zarr(apply_write_profile(ds, 'bitround-99'), store)
+    """
+    spec = WRITE_PROFILES[profile] if isinstance(profile, str) else profile
+    ds = ds.copy()
+    variables = [name for name in ds.data_vars if np.issubdtype(ds[name].dtype, np.floating)] if variables is None else variables
+    encoding = _profile_compressor_encoding(spec['compressor'], spec['shuffle'])
+    for name, variable in ds.variables.items():
+        chunks = variable.encoding.get('chunks')
+        variable.encoding = dict(encoding, **({'chunks': chunks} if chunks is not None and variable.chunks is None else {}))
+    for name in variables:
+        da = ds[name]
+        if spec['dtype'] is not None:
+            da = da.astype(spec['dtype'])
+        keepbits = spec['keepbits']
+        if keepbits is None and spec['inflevel'] is not None:
+            values = da.isel(sample).values if sample is not None else _information_sample(da)
+            keepbits = keepbits_for_information(values, spec['inflevel'], spec.get('min_keepbits') or 0)
+            da.attrs['inflevel'] = spec['inflevel']
+        if keepbits is not None:
+            da = xr.apply_ufunc(bitround, da, kwargs={'keepbits': keepbits}, dask='parallelized', output_dtypes=[da.dtype],
+                                keep_attrs=True)
+            da.attrs['keepbits'] = keepbits
+            print(f"{name}: keeping {keepbits} mantissa bits")
+        encoding_chunks = ds[name].encoding
+        ds[name] = da
+        ds[name].encoding = encoding_chunks
+    ds.attrs['write_profile'] = profile if isinstance(profile, str) else json.dumps(profile)
+    return ds
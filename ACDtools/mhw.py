@@ -16,12 +16,749 @@ Author = {"name": "Thomas Moore", "affiliation": "CSIRO", "email": "thomas.moore
 """
 # Standard library imports
 import os
+import json
+import shutil
 import datetime
+import warnings
 
 
 # Third-party imports
+import dask
 import numpy as np
+import pandas as pd
 import xarray as xr
 
 # Local application imports (if needed)
 #from .my_local_module import my_function
+
+# cumulative days before each month in a leap year - Hobday et al. (2016) day-of-year runs 1-366 with Feb 29 = 60
+_LEAP_YEAR_MONTH_OFFSET = np.array([0, 0, 31, 60, 91, 121, 152, 182, 213, 244, 274, 305, 335])
+_FEB29 = 60
+
+def day_of_year(time):
+    """
+    Day of year on the 366-day (leap year) calendar used by Hobday et al. (2016), so that a given calendar date has
+    the same day of year in every year (Feb 29 = 60, Mar 1 = 61 in all years).
+
+    Parameters
+    ----------
+    time : xarray.DataArray
+        Time coordinate with datetime64 or cftime values.
+
+    Returns
+    -------
+    numpy.ndarray
+        Integer day of year in 1-366 for each time step.
+
+    Examples
+    --------
+    >>> doy = day_of_year(ds.time)
+    """
+    month = np.asarray(time.dt.month)
+    day = np.asarray(time.dt.day)
+    return _LEAP_YEAR_MONTH_OFFSET[month] + day
+
+def _nanpercentile_sorted(values, percentile):
+    """
+    Linear-interpolation percentile along the last axis that ignores NaN, without numpy's per-cell
+    apply_along_axis fallback of np.nanpercentile.
+    """
+    values = np.sort(values, axis=-1)  # NaN sorts to the end
+    count = np.sum(~np.isnan(values), axis=-1, keepdims=True)
+    position = percentile / 100.0 * np.maximum(count - 1, 0)
+    lower = np.floor(position).astype(int)
+    upper = np.minimum(lower + 1, np.maximum(count - 1, 0))
+    value_lower = np.take_along_axis(values, lower, axis=-1)
+    value_upper = np.take_along_axis(values, upper, axis=-1)
+    result = value_lower + (position - lower) * (value_upper - value_lower)
+    return np.where(count > 0, result, np.nan)[..., 0]
+
+def _circular_running_mean(values, width):
+    """
+    Centred running mean of odd width along the last (day-of-year) axis, wrapping around the year.
+    """
+    half_width = width // 2
+    extended = np.concatenate([values[..., -half_width:], values, values[..., :half_width]], axis=-1)
+    cumulative = np.cumsum(np.concatenate([np.zeros_like(values[..., :1]), extended], axis=-1), axis=-1)
+    return (cumulative[..., width:] - cumulative[..., :-width]) / width
+
+def _climatology_kernel(temp, doy, window_half_width, percentile, smooth_width):
+    """
+    Seasonal climatology and percentile threshold for every cell of a block, with time as the last axis.
+    """
+    n_time = temp.shape[-1]
+    seas = np.full(temp.shape[:-1] + (366,), np.nan)
+    thresh = np.full(temp.shape[:-1] + (366,), np.nan)
+    offsets = np.arange(-window_half_width, window_half_width + 1)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)  # all-NaN (land) cells
+        for d in range(1, 367):
+            if d == _FEB29:
+                continue
+            # pool every time step within +/- window_half_width days of each occurrence of this day of year
+            window = (np.flatnonzero(doy == d)[:, None] + offsets).ravel()
+            window = window[(window >= 0) & (window < n_time)]
+            if window.size == 0:
+                continue
+            pooled = temp[..., window]
+            seas[..., d - 1] = np.nanmean(pooled, axis=-1)
+            thresh[..., d - 1] = _nanpercentile_sorted(pooled, percentile)
+    return _finalise_climatology(seas, thresh, smooth_width)
+
+def _finalise_climatology(seas, thresh, smooth_width):
+    """
+    Fill Feb 29 and smooth the day-of-year climatology and threshold (day of year as the last axis).
+    """
+    # Feb 29 is the average of Feb 28 and Mar 1, as in the original marineHeatWaves code
+    for clim in (seas, thresh):
+        clim[..., _FEB29 - 1] = 0.5 * clim[..., _FEB29 - 2] + 0.5 * clim[..., _FEB29]
+    if smooth_width:
+        seas = _circular_running_mean(seas, smooth_width)
+        thresh = _circular_running_mean(thresh, smooth_width)
+    return seas, thresh
+
+def climatology(sst, baseline=None, window_half_width=5, percentile=90, smooth_width=31, time_dim='time'):
+    """
+    Day-of-year seasonal climatology and percentile threshold following Hobday et al. (2016).
+
+    For each day of year all values within +/- window_half_width days of that day in every baseline year are pooled,
+    and their mean and percentile are taken; both are then smoothed with a circular running mean of smooth_width days.
+    The calculation runs blockwise over space with `xr.apply_ufunc(dask='parallelized')`: the time dimension is kept
+    in a single chunk and each spatial block is handled as a whole with vectorised numpy, so there is no
+    per-gridpoint Python loop.
+
+    Parameters
+    ----------
+    sst : xarray.DataArray
+        Daily sea surface temperature (or other variable) with a contiguous daily time dimension.
+    baseline : tuple of str, optional
+        (start, end) of the climatology baseline period, e.g. ('1983', '2012'). Default is None, the full record.
+    window_half_width : int, optional
+        Half width in days of the window pooled around each day of year. Default is 5.
+    percentile : float, optional
+        Percentile used for the threshold. Default is 90.
+    smooth_width : int, optional
+        Width in days (odd) of the running mean applied to the climatology and threshold; 0 or None disables it.
+        Default is 31.
+    time_dim : str, optional
+        Name of the time dimension. Default is 'time'.
+
+    Returns
+    -------
+    xarray.Dataset
+        Dataset with `seas` (climatology) and `thresh` (threshold) along a new `doy` dimension (1-366).
+
+    Examples
+    --------
+    >>> clim = climatology(ds.sst, baseline=('1983', '2012'))
+    """
+    if baseline is not None:
+        sst = sst.sel({time_dim: slice(*baseline)})
+    if sst.chunks is not None:
+        sst = sst.chunk({time_dim: -1})
+    doy = xr.DataArray(day_of_year(sst[time_dim]), dims=time_dim)
+    seas, thresh = xr.apply_ufunc(
+        _climatology_kernel, sst, doy,
+        input_core_dims=[[time_dim], [time_dim]],
+        output_core_dims=[['doy'], ['doy']],
+        kwargs={'window_half_width': window_half_width, 'percentile': percentile, 'smooth_width': smooth_width},
+        dask='parallelized',
+        output_dtypes=[np.float64, np.float64],
+        dask_gufunc_kwargs={'output_sizes': {'doy': 366}})
+    clim = xr.Dataset({'seas': seas, 'thresh': thresh}).assign_coords(doy=np.arange(1, 367))
+    clim.attrs['baseline'] = 'full record' if baseline is None else f'{baseline[0]} to {baseline[1]}'
+    clim.attrs['percentile'] = percentile
+    clim.attrs['window_half_width'] = window_half_width
+    clim.attrs['smooth_width'] = smooth_width if smooth_width else 0
+    return clim
+
+def _state_edges_kernel(temp, doy, window_half_width, margin):
+    """
+    Per (cell, day of year) histogram edges: pooled baseline min / max widened by margin.
+    """
+    n_time = temp.shape[-1]
+    lower = np.full(temp.shape[:-1] + (366,), np.nan)
+    upper = np.full(temp.shape[:-1] + (366,), np.nan)
+    offsets = np.arange(-window_half_width, window_half_width + 1)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)  # all-NaN (land) cells
+        for d in range(1, 367):
+            window = (np.flatnonzero(doy == d)[:, None] + offsets).ravel()
+            window = window[(window >= 0) & (window < n_time)]
+            if window.size == 0:
+                continue
+            lower[..., d - 1] = np.nanmin(temp[..., window], axis=-1) - margin
+            upper[..., d - 1] = np.nanmax(temp[..., window], axis=-1) + margin
+    return lower, upper
+
+def _state_increment_kernel(temp, doy, flag, lower, upper, window_half_width, n_bins):
+    """
+    Histogram counts, sums and sample counts of the pooled window values for every (cell, day of year).
+
+    Every (centre day i, sample day t) pair with |i - t| <= window_half_width inside the segment is counted when
+    either day is flagged, so the increments of adjacent or overlapping segments never double count a pair.
+    Feb 29 centres are skipped because the Feb 29 climatology is interpolated.
+    """
+    cells = temp.reshape(-1, temp.shape[-1])
+    lower = lower.reshape(-1, 366)
+    width = upper.reshape(-1, 366) - lower
+    n_cells, n_time = cells.shape
+    cell_index = np.arange(n_cells)[:, None]
+    count = np.zeros(n_cells * 366 * n_bins, dtype=np.int64)
+    total = np.zeros(n_cells * 366)
+    n = np.zeros(n_cells * 366, dtype=np.int64)
+    for offset in range(-window_half_width, window_half_width + 1):
+        centre = np.arange(max(0, -offset), n_time - max(0, offset))
+        centre = centre[(flag[centre] | flag[centre + offset]) & (doy[centre] != _FEB29)]
+        if centre.size == 0:
+            continue
+        d = doy[centre] - 1
+        values = cells[:, centre + offset]
+        edge_lower = lower[:, d]
+        edge_width = width[:, d]
+        valid = ~np.isnan(values) & ~np.isnan(edge_lower)
+        with np.errstate(invalid='ignore'):
+            bins = np.clip(np.floor((values - edge_lower) / edge_width * n_bins), 0, n_bins - 1)
+        cell_doy = (cell_index * 366 + d)[valid]
+        count += np.bincount(cell_doy * n_bins + bins[valid].astype(np.int64), minlength=count.size)
+        total += np.bincount(cell_doy, weights=values[valid], minlength=total.size)
+        n += np.bincount(cell_doy, minlength=n.size)
+    shape = temp.shape[:-1] + (366,)
+    return count.reshape(shape + (n_bins,)), total.reshape(shape), n.reshape(shape)
+
+def _state_increment(sst, flag, lower, upper, window_half_width, n_bins, time_dim):
+    """
+    Lazy (count, sum, n) increment of a climatology state from one time segment of sst.
+    """
+    if sst.chunks is not None:
+        sst = sst.chunk({time_dim: -1})
+    doy = xr.DataArray(day_of_year(sst[time_dim]), dims=time_dim)
+    flag = xr.DataArray(np.asarray(flag, dtype=bool), dims=time_dim)
+    return xr.apply_ufunc(
+        _state_increment_kernel, sst, doy, flag, lower, upper,
+        input_core_dims=[[time_dim], [time_dim], [time_dim], ['doy'], ['doy']],
+        output_core_dims=[['doy', 'bin'], ['doy'], ['doy']],
+        kwargs={'window_half_width': window_half_width, 'n_bins': n_bins},
+        dask='parallelized',
+        output_dtypes=[np.int64, np.float64, np.int64],
+        dask_gufunc_kwargs={'output_sizes': {'doy': 366, 'bin': n_bins}})
+
+def _baseline_index(sst, baseline, time_dim):
+    """
+    Integer (start, stop) positions of a (start, end) baseline along the time index of sst.
+    """
+    index = sst.indexes[time_dim].slice_indexer(*baseline)
+    return index.start or 0, index.stop if index.stop is not None else sst.sizes[time_dim]
+
+def climatology_state(sst, baseline, window_half_width=5, n_bins=128, margin=2.0, edges=None, time_dim='time'):
+    """
+    Build a mergeable climatology / threshold state for incremental MHW baselines.
+
+    The state holds the sufficient statistics of the pooled window values of every (cell, day of year): their sum and
+    number for the seasonal climatology, and a fixed-edge histogram (a mergeable quantile sketch) for the percentile
+    threshold.  Because the histogram counts are integers, years can later be added to or removed from the baseline
+    with `update_climatology_state` and the counts are identical to those of a full recompute over the new baseline
+    with the same bin edges, `climatology_state(sst, new_baseline, edges=state)`.  Thresholds for any percentile are
+    read from the state with `climatology_from_state`.
+
+    The threshold is approximate: it is interpolated within the histogram bin holding the percentile rank, as if the
+    samples were evenly spread in it, while `climatology` interpolates between the two samples either side of the
+    rank.  Where the pooled samples are dense the two agree to within a bin width, (upper - lower) / n_bins; where
+    they are sparse (short baselines) they can differ by up to the gap between those two samples.  For SST with a
+    decadal or longer baseline and the defaults, the smoothed thresholds typically differ by ~0.01-0.02 degC.  The
+    seasonal climatology is exact.  Raise n_bins (or lower margin) for a closer threshold.
+
+    Parameters
+    ----------
+    sst : xarray.DataArray
+        Daily sea surface temperature (or other variable) with a contiguous daily time dimension.
+    baseline : tuple of str
+        (start, end) of the climatology baseline period, e.g. ('1983', '2012').
+    window_half_width : int, optional
+        Half width in days of the window pooled around each day of year. Default is 5.
+    n_bins : int, optional
+        Number of histogram bins per (cell, day of year). Default is 128.
+    margin : float, optional
+        Headroom (in the units of sst) added below the pooled minimum and above the pooled maximum of the initial
+        baseline when fixing the bin edges, so later (e.g. warmer) years still fall inside the histogram. Values
+        outside the edges are counted in the end bins. Default is 2.0.
+    edges : xarray.Dataset, optional
+        Histogram edges `lower` and `upper` (doy) to use instead of computing them from the baseline, e.g. an
+        existing state; margin is then ignored. Default is None.
+    time_dim : str, optional
+        Name of the time dimension. Default is 'time'.
+
+    Returns
+    -------
+    xarray.Dataset
+        State with `count` (doy, bin), `sum`, `n`, `lower` and `upper` (doy) and the baseline recorded in the attrs.
+
+    Examples
+    --------
+    >>> state = climatology_state(ds.sst, baseline=('1983', '2012'))
+    >>> write_climatology_state(state, '/scratch/es60/ard/mhw/sst_clim_state.zarr')
+    """
+    start, stop = _baseline_index(sst, baseline, time_dim)
+    sst = sst.isel({time_dim: slice(start, stop)})
+    if sst.chunks is not None:
+        sst = sst.chunk({time_dim: -1})
+    if edges is not None:
+        lower, upper = edges['lower'].drop_vars('doy', errors='ignore'), edges['upper'].drop_vars('doy', errors='ignore')
+        margin = edges.attrs.get('margin', margin)
+    else:
+        doy = xr.DataArray(day_of_year(sst[time_dim]), dims=time_dim)
+        lower, upper = xr.apply_ufunc(
+            _state_edges_kernel, sst, doy,
+            input_core_dims=[[time_dim], [time_dim]],
+            output_core_dims=[['doy'], ['doy']],
+            kwargs={'window_half_width': window_half_width, 'margin': margin},
+            dask='parallelized',
+            output_dtypes=[np.float64, np.float64],
+            dask_gufunc_kwargs={'output_sizes': {'doy': 366}})
+    count, total, n = _state_increment(sst, np.ones(sst.sizes[time_dim], dtype=bool), lower, upper,
+                                       window_half_width, n_bins, time_dim)
+    state = xr.Dataset({'count': count, 'sum': total, 'n': n, 'lower': lower, 'upper': upper})
+    state = state.assign_coords(doy=np.arange(1, 367))
+    state.attrs['baseline_start'] = str(baseline[0])
+    state.attrs['baseline_end'] = str(baseline[1])
+    state.attrs['window_half_width'] = window_half_width
+    state.attrs['n_bins'] = n_bins
+    state.attrs['margin'] = margin
+    return state
+
+def write_climatology_state(state, path):
+    """
+    Write a climatology state to a Zarr store (replacing any existing store at path).
+
+    Parameters
+    ----------
+    state : xarray.Dataset
+        Output of `climatology_state` or `update_climatology_state`.
+    path : str
+        Path of the Zarr store.
+    """
+    state.to_zarr(path, mode='w', consolidated=True)
+
+def open_climatology_state(path):
+    """
+    Open a climatology state from its Zarr store.
+
+    Parameters
+    ----------
+    path : str
+        Path of the Zarr store.
+
+    Returns
+    -------
+    xarray.Dataset
+        The (lazily loaded) climatology state.
+    """
+    return xr.open_zarr(path, consolidated=True)
+
+def update_climatology_state(path, sst, baseline, time_dim='time'):
+    """
+    Fold new years into, and drop old years from, a stored climatology state, e.g. to roll the baseline forward.
+
+    Only the years entering or leaving the baseline (plus window_half_width days either side) are read from sst;
+    their contributions are added to / subtracted from the stored counts and sums, and the store is replaced.  The
+    histogram edges of the original state are kept, so the result matches `climatology_state(sst, baseline,
+    edges=state)` (counts exactly, sums to floating point rounding).  The new state is written next to the store and
+    swapped in by renames; if the swap is interrupted, the previous state is left at `<path>.bak` and restored by the
+    next update.
+
+    Parameters
+    ----------
+    path : str
+        Path of the Zarr store written by `write_climatology_state`.
+    sst : xarray.DataArray
+        Daily data covering both the stored and the new baseline periods (e.g. the full lazily opened archive).
+    baseline : tuple of str
+        (start, end) of the new baseline period.
+    time_dim : str, optional
+        Name of the time dimension. Default is 'time'.
+
+    Returns
+    -------
+    xarray.Dataset
+        The updated climatology state, reopened from path.
+
+    Examples
+    --------
+    >>> state = update_climatology_state('/scratch/es60/ard/mhw/sst_clim_state.zarr', ds.sst, baseline=('1984', '2013'))
+    >>> clim = climatology_from_state(state)
+    """
+    backup = path + '.bak'
+    if not os.path.exists(path) and os.path.exists(backup):
+        # an earlier swap was interrupted between its two renames
+        os.rename(backup, path)
+    state = open_climatology_state(path)
+    window_half_width = int(state.attrs['window_half_width'])
+    n_bins = int(state.attrs['n_bins'])
+    old_start, old_stop = _baseline_index(sst, (state.attrs['baseline_start'], state.attrs['baseline_end']), time_dim)
+    new_start, new_stop = _baseline_index(sst, baseline, time_dim)
+    if new_start >= old_stop or old_start >= new_stop:
+        raise ValueError("The new baseline must overlap the stored baseline - build a new state with climatology_state!!!")
+    # (segment start, segment stop, changed start, changed stop, sign): years leaving the old baseline are removed
+    # with their neighbours from the old baseline, years entering are added with their neighbours from the new one
+    changes = [(old_start, old_stop, old_start, new_start, -1), (old_start, old_stop, new_stop, old_stop, -1),
+               (new_start, new_stop, new_start, old_start, 1), (new_start, new_stop, old_stop, new_stop, 1)]
+    count, total, n = state['count'], state['sum'], state['n']
+    for bound_start, bound_stop, changed_start, changed_stop, sign in changes:
+        if changed_stop <= changed_start:
+            continue
+        start = max(bound_start, changed_start - window_half_width)
+        stop = min(bound_stop, changed_stop + window_half_width)
+        position = np.arange(start, stop)
+        flag = (position >= changed_start) & (position < changed_stop)
+        d_count, d_total, d_n = _state_increment(sst.isel({time_dim: slice(start, stop)}), flag,
+                                                 state['lower'], state['upper'], window_half_width, n_bins, time_dim)
+        count, total, n = count + sign * d_count, total + sign * d_total, n + sign * d_n
+    updated = state.assign(count=count, sum=total, n=n)
+    updated.attrs['baseline_start'] = str(baseline[0])
+    updated.attrs['baseline_end'] = str(baseline[1])
+    # write alongside, then swap by renames, so an interrupted update never loses the state at path
+    for var in updated.variables:
+        updated[var].encoding = {}
+    write_climatology_state(updated, path + '.tmp')
+    if os.path.exists(backup):
+        shutil.rmtree(backup)
+    os.rename(path, backup)
+    os.rename(path + '.tmp', path)
+    shutil.rmtree(backup)
+    return open_climatology_state(path)
+
+def _state_climatology_kernel(count, total, n, lower, upper, percentile, smooth_width):
+    """
+    Seasonal climatology and percentile threshold from histogram state arrays (doy, bin as the last axes).
+    """
+    n_bins = count.shape[-1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        seas = np.where(n > 0, total / n, np.nan)
+        cumulative = np.cumsum(count, axis=-1)
+        rank = percentile / 100.0 * (cumulative[..., -1:] - 1)
+        k = np.argmax(cumulative > rank, axis=-1)[..., None]
+        in_bin = np.take_along_axis(count, k, axis=-1)
+        before = np.take_along_axis(cumulative, k, axis=-1) - in_bin
+        # linear interpolation within the bin holding the rank, assuming its samples are evenly spread
+        position = (k + (rank - before + 0.5) / in_bin)[..., 0]
+        thresh = np.where(n > 0, lower + position * (upper - lower) / n_bins, np.nan)
+    return _finalise_climatology(seas, thresh, smooth_width)
+
+def climatology_from_state(state, percentile=90, smooth_width=31):
+    """
+    Day-of-year climatology and percentile threshold from a climatology state, in the format of `climatology`.  The
+    threshold is interpolated within a histogram bin, so it approximates the exact `climatology` threshold (see
+    `climatology_state` for the error).
+
+    Parameters
+    ----------
+    state : xarray.Dataset
+        Output of `climatology_state`, `open_climatology_state` or `update_climatology_state`.
+    percentile : float, optional
+        Percentile used for the threshold. Default is 90.
+    smooth_width : int, optional
+        Width in days (odd) of the running mean applied to the climatology and threshold; 0 or None disables it.
+        Default is 31.
+
+    Returns
+    -------
+    xarray.Dataset
+        Dataset with `seas` and `thresh` along `doy`, ready for `detect`.
+
+    Examples
+    --------
+    >>> clim = climatology_from_state(open_climatology_state('/scratch/es60/ard/mhw/sst_clim_state.zarr'))
+    >>> mhw = detect(ds.sst, clim)
+    """
+    if state.chunks:
+        state = state.chunk({'doy': -1, 'bin': -1})
+    seas, thresh = xr.apply_ufunc(
+        _state_climatology_kernel, state['count'], state['sum'], state['n'], state['lower'], state['upper'],
+        input_core_dims=[['doy', 'bin'], ['doy'], ['doy'], ['doy'], ['doy']],
+        output_core_dims=[['doy'], ['doy']],
+        kwargs={'percentile': percentile, 'smooth_width': smooth_width},
+        dask='parallelized',
+        output_dtypes=[np.float64, np.float64])
+    clim = xr.Dataset({'seas': seas, 'thresh': thresh}).assign_coords(doy=state['doy'])
+    clim.attrs['baseline'] = f"{state.attrs['baseline_start']} to {state.attrs['baseline_end']}"
+    clim.attrs['percentile'] = percentile
+    clim.attrs['window_half_width'] = state.attrs['window_half_width']
+    clim.attrs['smooth_width'] = smooth_width if smooth_width else 0
+    return clim
+
+def _run_bounds(mask):
+    """
+    Vectorised run-length encoding of True runs along the last axis.
+
+    Returns the flat (row-major) index of the leading cell, and the start and (exclusive) end time index of every run,
+    ordered by cell and then time.
+    """
+    mask = mask.reshape(-1, mask.shape[-1])
+    padded = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=-1)
+    cell, start = np.nonzero(edges == 1)
+    _, end = np.nonzero(edges == -1)
+    return cell, start, end
+
+def _runs_to_mask(shape, cell, start, end):
+    """
+    Inverse of _run_bounds - rebuild a boolean mask of the given shape from run bounds.
+    """
+    n_time = shape[-1]
+    counter = np.zeros((int(np.prod(shape[:-1])), n_time + 1), dtype=np.int32)
+    np.add.at(counter, (cell, start), 1)
+    np.add.at(counter, (cell, end), -1)
+    return (np.cumsum(counter[:, :-1], axis=-1) > 0).reshape(shape)
+
+def _event_runs(exceed, min_duration, max_gap):
+    """
+    Event bounds from exceedances: drop runs shorter than min_duration, then join events separated by max_gap days
+    or fewer.
+    """
+    cell, start, end = _run_bounds(exceed)
+    keep = (end - start) >= min_duration
+    cell, start, end = cell[keep], start[keep], end[keep]
+    if max_gap and start.size > 1:
+        join = (cell[1:] == cell[:-1]) & (start[1:] - end[:-1] <= max_gap)
+        # an event that joins the next one loses its end, the next one loses its start
+        keep_start = np.concatenate([[True], ~join])
+        keep_end = np.concatenate([~join, [True]])
+        cell, start, end = cell[keep_start], start[keep_start], end[keep_end]
+    return cell, start, end
+
+def _detect_kernel(temp, seas, thresh, doy, min_duration, max_gap):
+    """
+    MHW days and anomalies for every cell of a block, with time as the last axis.
+    """
+    seas_t = seas[..., doy - 1]
+    exceed = temp > thresh[..., doy - 1]  # NaN never exceeds
+    cell, start, end = _event_runs(exceed, min_duration, max_gap)
+    return _runs_to_mask(temp.shape, cell, start, end), temp - seas_t
+
+def detect(sst, clim, min_duration=5, max_gap=2, time_dim='time'):
+    """
+    Detect marine heatwave (MHW) days following Hobday et al. (2016).
+
+    A MHW is a run of at least min_duration days above the day-of-year threshold, and events separated by gaps of
+    max_gap days or fewer are joined.  Detection runs blockwise over space with `xr.apply_ufunc(dask='parallelized')`,
+    keeping time contiguous within each chunk and using vectorised run-length encoding across all cells of a block.
+
+    Parameters
+    ----------
+    sst : xarray.DataArray
+        Daily sea surface temperature (or other variable) with a contiguous daily time dimension.
+    clim : xarray.Dataset
+        Output of `climatology`, with `seas` and `thresh` along `doy`.
+    min_duration : int, optional
+        Minimum duration in days of an event. Default is 5.
+    max_gap : int, optional
+        Maximum gap in days across which events are joined; 0 disables joining. Default is 2.
+    time_dim : str, optional
+        Name of the time dimension. Default is 'time'.
+
+    Returns
+    -------
+    xarray.Dataset
+        Dataset with `is_mhw` (True on MHW days) and `anomaly` (sst minus the seasonal climatology).
+
+    Examples
+    --------
+    >>> clim = climatology(ds.sst, baseline=('1983', '2012'))
+    >>> mhw = detect(ds.sst, clim)
+    >>> mhw_days_per_year = mhw.is_mhw.resample(time='YS').sum()
+    """
+    if sst.chunks is not None:
+        sst = sst.chunk({time_dim: -1})
+    if clim.chunks:
+        clim = clim.chunk({'doy': -1})
+    doy = xr.DataArray(day_of_year(sst[time_dim]), dims=time_dim)
+    is_mhw, anomaly = xr.apply_ufunc(
+        _detect_kernel, sst, clim['seas'], clim['thresh'], doy,
+        input_core_dims=[[time_dim], ['doy'], ['doy'], [time_dim]],
+        output_core_dims=[[time_dim], [time_dim]],
+        kwargs={'min_duration': min_duration, 'max_gap': max_gap},
+        dask='parallelized',
+        output_dtypes=[bool, np.float64])
+    mhw = xr.Dataset({'is_mhw': is_mhw.transpose(*sst.dims), 'anomaly': anomaly.transpose(*sst.dims)})
+    mhw.attrs['min_duration'] = min_duration
+    mhw.attrs['max_gap'] = max_gap
+    return mhw
+
+# Hobday et al. (2018) categories, indexed by category number - 1
+CATEGORIES = ['Moderate', 'Strong', 'Severe', 'Extreme']
+
+def _segment_reduce(ufunc, flat, start, end):
+    """
+    Reduce flat[start:end] with ufunc for every (start, end) segment at once using ufunc.reduceat.
+    """
+    padded = np.append(flat, flat[:1])  # so an end equal to len(flat) is a valid reduceat index
+    return ufunc.reduceat(padded, np.ravel(np.column_stack([start, end])))[::2]
+
+def _event_table(temp, seas, thresh, doy, min_duration, max_gap, severity_filter, min_severity, min_delta):
+    """
+    Columns of the event table for one block of cells (time as the last axis), built without a per-cell loop.
+
+    Events come from the vectorised run-length encoding of the exceedances; event metrics are segment reductions
+    (reduceat / prefix sums) over the flattened block.
+    """
+    cells = temp.reshape(-1, temp.shape[-1])
+    n_time = cells.shape[1]
+    seas_t = seas.reshape(-1, 366)[:, doy - 1]
+    thresh_t = thresh.reshape(-1, 366)[:, doy - 1]
+    cell, start, end = _event_runs(cells > thresh_t, min_duration, max_gap)
+    anomaly = (cells - seas_t).ravel()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        severity = anomaly / np.maximum(thresh_t - seas_t, min_delta).ravel()
+    flat_start, flat_end = cell * n_time + start, cell * n_time + end
+    valid_anomaly = np.where(np.isnan(anomaly), 0.0, anomaly)
+    intensity_max = _segment_reduce(np.fmax, anomaly, flat_start, flat_end)
+    intensity_cumulative = _segment_reduce(np.add, valid_anomaly, flat_start, flat_end)
+    severity_max = _segment_reduce(np.fmax, severity, flat_start, flat_end)
+    # first day of each event on which the peak anomaly is reached
+    label = np.zeros(anomaly.size + 1, dtype=np.int64)
+    np.add.at(label, flat_start, np.arange(1, start.size + 1))
+    np.add.at(label, flat_end, -np.arange(1, start.size + 1))
+    label = np.cumsum(label[:-1])
+    at_peak = np.flatnonzero(label > 0)
+    at_peak = at_peak[anomaly[at_peak] == intensity_max[label[at_peak] - 1]]
+    event, first = np.unique(label[at_peak], return_index=True)
+    flat_peak = np.zeros(start.size, dtype=np.int64)
+    flat_peak[event - 1] = at_peak[first]
+    ratio = intensity_max / (thresh_t.ravel() - seas_t.ravel())[flat_peak]
+    with np.errstate(invalid='ignore'):
+        category = np.clip(np.floor(np.nan_to_num(ratio, nan=1.0)), 1, len(CATEGORIES)).astype(np.int8)
+    table = {'cell_in_block': cell, 'start_index': start, 'end_index': end - 1,
+             'peak_index': flat_peak - cell * n_time, 'duration': end - start,
+             'intensity_max': intensity_max, 'intensity_mean': intensity_cumulative / (end - start),
+             'intensity_cumulative': intensity_cumulative, 'severity_max': severity_max, 'category': category}
+    if severity_filter:
+        keep = severity_max >= min_severity
+        table = {key: value[keep] for key, value in table.items()}
+    return table
+
+def _event_table_block(temp, seas, thresh, doy, times, offsets, spatial_shape, spatial_dims, file_path, **kwargs):
+    """
+    Build the event table of one spatial block and write it as a Parquet file.
+    """
+    table = _event_table(temp, seas, thresh, doy, **kwargs)
+    local = np.unravel_index(table.pop('cell_in_block'), temp.shape[:-1])
+    index = [position + offset for position, offset in zip(local, offsets)]
+    events = pd.DataFrame({'cell': np.ravel_multi_index(index, spatial_shape) if index else 0})
+    for dim, position in zip(spatial_dims, index):
+        events[dim + '_index'] = position.astype(np.int32)
+    for key in ('start', 'end', 'peak'):
+        events['time_' + key] = times[table[key + '_index']]
+    for key, value in table.items():
+        events[key] = value
+    events['category_name'] = pd.Categorical.from_codes(events['category'] - 1, CATEGORIES)
+    events.to_parquet(file_path, index=False)
+    return len(events)
+
+def event_catalogue(sst, clim, path, min_duration=5, max_gap=2, severity_filter=False, min_severity=1.0,
+                    min_delta=0.1, time_dim='time'):
+    """
+    Build a columnar marine heatwave event catalogue (one row per event) and write it as a Parquet dataset.
+
+    Events follow Hobday et al. (2016): runs of at least min_duration days above the threshold, with events separated
+    by max_gap days or fewer joined.  Each spatial block of sst (time kept contiguous) is processed by one dask task
+    with vectorised run-length encoding and segment reductions, and writes one Parquet file, so no ragged per-cell
+    Python objects are ever held in memory.  Rows are keyed by `cell`, the flat (C-order) index over the spatial
+    dimensions, with one `<dim>_index` column per spatial dimension.
+
+    Columns: cell, <dim>_index, time_start, time_end, time_peak, start_index, end_index, peak_index, duration,
+    intensity_max, intensity_mean, intensity_cumulative (anomalies relative to the seasonal climatology),
+    severity_max, category (1-4) and category_name (Hobday et al. 2018: Moderate, Strong, Severe, Extreme).
+
+    Parameters
+    ----------
+    sst : xarray.DataArray
+        Daily sea surface temperature (or other variable) with a contiguous daily time dimension.
+    clim : xarray.Dataset
+        Output of `climatology` or `climatology_from_state`, with `seas` and `thresh` along `doy`.
+    path : str
+        Directory of the Parquet dataset (created, existing part files are replaced). The parameters of the
+        catalogue are recorded in `_catalogue.json` in the same directory.
+    min_duration : int, optional
+        Minimum duration in days of an event. Default is 5.
+    max_gap : int, optional
+        Maximum gap in days across which events are joined; 0 disables joining. Default is 2.
+    severity_filter : bool, optional
+        Apply the severity filter of Richaud et al. (2024): drop events whose peak severity (anomaly divided by the
+        threshold - climatology difference, floored at min_delta) is below min_severity. Default is False.
+    min_severity : float, optional
+        Minimum peak severity of an event kept by the severity filter. Default is 1.0.
+    min_delta : float, optional
+        Floor applied to the threshold - climatology difference in the severity index, which keeps the index finite
+        where the threshold collapses onto the climatology (e.g. under sea ice). Default is 0.1.
+    time_dim : str, optional
+        Name of the time dimension. Default is 'time'.
+
+    Returns
+    -------
+    int
+        The number of events written, also recorded as `n_events` in `_catalogue.json`.
+
+    Examples
+    --------
+    >>> clim = climatology(ds.sst, baseline=('1983', '2012'))
+    >>> n_events = event_catalogue(ds.sst, clim, '/scratch/es60/ard/mhw/sst_events.parquet')
+    >>> events = open_event_catalogue('/scratch/es60/ard/mhw/sst_events.parquet', filters=[('category', '>=', 3)])
+    """
+    spatial_dims = [dim for dim in sst.dims if dim != time_dim]
+    sst = sst.transpose(*spatial_dims, time_dim).chunk({time_dim: -1})
+    clim = clim.transpose(*spatial_dims, 'doy').chunk({**{dim: sst.chunksizes[dim] for dim in spatial_dims}, 'doy': -1})
+    doy = day_of_year(sst[time_dim])
+    times = sst.indexes[time_dim]
+    if hasattr(times, 'to_datetimeindex'):
+        try:
+            times = times.to_datetimeindex()
+        except ValueError:  # non-standard calendar - keep ISO strings
+            times = pd.Index(times.map(lambda time: time.isoformat()))
+    times = np.asarray(times)
+    os.makedirs(path, exist_ok=True)
+    for old_file in os.listdir(path):
+        if old_file.startswith('part-') and old_file.endswith('.parquet'):
+            os.remove(os.path.join(path, old_file))
+    kwargs = {'min_duration': min_duration, 'max_gap': max_gap, 'severity_filter': severity_filter,
+              'min_severity': min_severity, 'min_delta': min_delta}
+    spatial_shape = tuple(sst.sizes[dim] for dim in spatial_dims)
+    tasks = []
+    for block, block_index in enumerate(np.ndindex(*[len(sst.chunksizes[dim]) for dim in spatial_dims])):
+        offsets = [int(np.sum(sst.chunksizes[dim][:k])) for dim, k in zip(spatial_dims, block_index)]
+        slices = {dim: slice(offset, offset + sst.chunksizes[dim][k])
+                  for dim, offset, k in zip(spatial_dims, offsets, block_index)}
+        tasks.append(dask.delayed(_event_table_block)(
+            sst.isel(slices).data, clim['seas'].isel(slices).data, clim['thresh'].isel(slices).data, doy, times,
+            offsets, spatial_shape, spatial_dims, os.path.join(path, f'part-{block:05d}.parquet'), **kwargs))
+    n_events = sum(dask.compute(*tasks))
+    with open(os.path.join(path, '_catalogue.json'), 'w') as file:
+        json.dump({'spatial_dims': spatial_dims, 'spatial_shape': spatial_shape, 'n_events': int(n_events),
+                   'baseline': clim.attrs.get('baseline'), 'percentile': clim.attrs.get('percentile'), **kwargs},
+                  file, indent=2)
+    return int(n_events)
+
+def open_event_catalogue(path, columns=None, filters=None):
+    """
+    Read a marine heatwave event catalogue written by `event_catalogue`.
+
+    Parameters
+    ----------
+    path : str
+        Directory of the Parquet dataset.
+    columns : list of str, optional
+        Only read these columns. Default is None, all columns.
+    filters : list of tuple, optional
+        Row filters pushed down to the Parquet reader, e.g. [('duration', '>', 30)]. Default is None.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per event.
+
+    Examples
+    --------
+    >>> events = open_event_catalogue(path, columns=['cell', 'duration', 'intensity_max'])
+    >>> events.groupby('cell').duration.sum()
+    """
+    return pd.read_parquet(path, columns=columns, filters=filters)
@@ -12,10 +12,116 @@ import datetime
 # Third-party imports
 import numpy as np
 import xarray as xr
+try:
+    import numba
+except ImportError:  # numba is optional - the depth-crossing kernel falls back to numpy.vectorize
+    numba = None
 
 # Local application imports (if needed)
 #from .my_local_module import my_function
 
+def _depth_crossing_column(values, depths, targets, first_depth, interpolated_depth, crossing_count):
+    """
+    Single pass down one water column for the depth-crossing kernel, for every target at once.
+
+    A level is "below" a target where values <= target (NaN is never below).  The first crossing depth is the
+    shallowest level that is below the target, the crossing count is the number of above -> below transitions and the
+    interpolated depth is the linear interpolation across the shallowest above -> below transition.  The values
+    bounding a transition satisfy value_A > target >= value_B, so the interpolation never divides by zero; it is
+    NaN when the level above is NaN.  Outputs are written in place so the same code serves as the body of the numba
+    gufunc and of the numpy fallback.
+    """
+    for t in range(targets.shape[0]):
+        first_depth[t] = np.nan
+        interpolated_depth[t] = np.nan
+        crossing_count[t] = 0
+    for k in range(values.shape[0]):
+        for t in range(targets.shape[0]):
+            below = values[k] <= targets[t]
+            if below and np.isnan(first_depth[t]):
+                first_depth[t] = depths[k]
+            if below and k > 0 and not values[k - 1] <= targets[t]:
+                crossing_count[t] += 1
+                if crossing_count[t] == 1:
+                    value_A = values[k - 1]
+                    value_B = values[k]
+                    if not np.isnan(value_A):
+                        interpolated_depth[t] = depths[k - 1] + ((targets[t] - value_A) / (value_B - value_A)) * (depths[k] - depths[k - 1])
+
+if numba is not None:
+    _depth_crossing_gufunc = numba.guvectorize(
+        ['void(float32[:], float64[:], float64[:], float64[:], float64[:], int64[:])',
+         'void(float64[:], float64[:], float64[:], float64[:], float64[:], int64[:])'],
+        '(n),(n),(m)->(m),(m),(m)', nopython=True, cache=True)(_depth_crossing_column)
+else:
+    def _depth_crossing_numpy(values, depths, targets):
+        m = targets.shape[0]
+        outputs = (np.empty(m), np.empty(m), np.zeros(m, dtype=np.int64))
+        _depth_crossing_column(values, depths, targets, *outputs)
+        return outputs
+    _depth_crossing_gufunc = np.vectorize(_depth_crossing_numpy, signature='(n),(n),(m)->(m),(m),(m)')
+
+def depth_crossings(da, target, depth_coord='pres'):
+    """
+    Find the first crossing depth, the interpolated crossing depth and the number of crossings of one or more target
+    values in every water column of a gridded oceanographic data array, in a single pass over the depth axis.
+
+    The work is done by one compiled kernel (numba when it is installed) applied per water column with
+    `xr.apply_ufunc(dask='parallelized')`, so every chunk is read once and the dask graph is one task per chunk.
+    The depth dimension is the core dimension of the kernel and is rechunked to a single chunk if needed.
+    Passing several targets (e.g. the 14/20/26 degC isotherms) computes all of them in the same traversal, so the
+    data are read once rather than once per target.
+
+    Parameters
+    ----------
+    da : xarray.DataArray
+        Gridded oceanographic data array (e.g. ACCESS-ESM1.5 `thetao` or `o2`) with a depth dimension.
+    target : float or array-like
+        Target / threshold value(s).  A level is counted as below a target where `da <= target`.
+        An array-like of targets adds a `target` dimension to every output variable.
+    depth_coord : str, optional
+        The name of the depth coordinate in the DataArray. Default is 'pres'.
+
+    Returns
+    -------
+    xarray.Dataset
+        Dataset with variables (with a trailing `target` dimension when several targets are given)
+        - `first_depth`: shallowest depth where `da <= target` (NaN if never reached)
+        - `interpolated_depth`: linearly interpolated depth of the shallowest downward crossing of the target
+          (NaN if there is none, or if the level above it is NaN)
+        - `crossing_count`: number of times the water column drops below the target
+
+    Examples
+    --------
+    >>> crossings = depth_crossings(ds.o2, target=90, depth_coord='lev')
+    >>> crossings.interpolated_depth.mean('member')
+    >>> isotherms = depth_crossings(ds.thetao, target=[14, 20, 26], depth_coord='lev').interpolated_depth
+
+    Notes
+    -----
+    - The function assumes that the depth coordinate is monotonic and increasing.
+    """
+    if depth_coord not in da.dims:
+        raise ValueError(f"'{depth_coord}' is not a dimension of the DataArray!!!")
+    if da.chunks is not None:
+        da = da.chunk({depth_coord: -1})
+    depths = da[depth_coord].astype('float64')
+    scalar_target = np.ndim(target) == 0
+    targets = xr.DataArray(np.atleast_1d(np.asarray(target, dtype='float64')), dims='target')
+    targets = targets.assign_coords(target=targets.values)
+    first_depth, interpolated_depth, crossing_count = xr.apply_ufunc(
+        _depth_crossing_gufunc, da, depths, targets,
+        input_core_dims=[[depth_coord], [depth_coord], ['target']],
+        output_core_dims=[['target'], ['target'], ['target']],
+        dask='parallelized',
+        output_dtypes=[np.float64, np.float64, np.int64])
+    crossings = xr.Dataset({'first_depth': first_depth,
+                            'interpolated_depth': interpolated_depth,
+                            'crossing_count': crossing_count})
+    if scalar_target:
+        crossings = crossings.squeeze('target', drop=True)
+    return crossings
+
 def threshold_depth(da,chosen_threshold=90,depth_name='pres'):
     """
     Given a gridded oceanographic data array (da) with some x,y, and z dimensions and a threshold value (threshold)
@@ -40,33 +146,65 @@ def threshold_depth(da,chosen_threshold=90,depth_name='pres'):
     Examples:
         >>> [first_depth_below_threshold, count_drops_below_threshold] = threshold_depth(my_da,chosen_threshold=20,depth_name='depth')
     """
-    threshold = chosen_threshold
-    # Create a mask for where oxygen falls below the threshold
-    mask = da <= threshold
-    # find grid point depth of first threshold value
-    depths_where_below_threshold = da[depth_name].where(mask)
-    first_depth_below_threshold = depths_where_below_threshold.min(dim=depth_name)
-    first_depth_below_threshold = first_depth_below_threshold.where(mask.any(dim=depth_name), np.nan)
-    # count crossings
-    drops_below_threshold = mask.astype(int).diff(dim=depth_name) == 1
-    count_drops_below_threshold = drops_below_threshold.sum(dim=depth_name)
+    crossings = depth_crossings(da, chosen_threshold, depth_coord=depth_name)
+    first_depth_below_threshold = crossings['first_depth']
+    count_drops_below_threshold = crossings['crossing_count']
     return first_depth_below_threshold,count_drops_below_threshold
 
-def layer_statistics(da,var_name,layer_depth = 300,depth_name = 'pres'):
+def _layer_statistics_kernel(values, depths, thickness, layer_index):
+    """
+    Running (surface-down) statistics along the last axis of values, read off at the last level of each layer.
+
+    One pass of cumulative sums / running extrema serves every layer, so several layer depths cost no more than the
+    deepest one.  layer_index holds the index of the deepest level in each layer (-1 for an empty layer).
+    """
+    values = values.astype(np.float64)
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+    count = np.cumsum(valid, axis=-1)
+    total = np.cumsum(filled, axis=-1)
+    running_min = np.fmin.accumulate(values, axis=-1)
+    running_max = np.fmax.accumulate(values, axis=-1)
+    sum_integral = np.cumsum(filled * thickness, axis=-1)
+    trapezoid = 0.5 * (values[..., 1:] + values[..., :-1]) * np.diff(depths)
+    trapezoid_integral = np.cumsum(np.concatenate([np.zeros_like(values[..., :1]), trapezoid], axis=-1), axis=-1)
+    index = np.clip(layer_index, 0, None)
+    empty = layer_index < 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        layer_mean = total[..., index] / count[..., index]
+    layer_min = running_min[..., index]
+    layer_max = running_max[..., index]
+    layer_sum_integral = sum_integral[..., index]
+    layer_sum_integral = np.where(layer_sum_integral != 0, layer_sum_integral, np.nan)
+    layer_trapezoidal_integral = trapezoid_integral[..., index]
+    return tuple(np.where(empty, np.nan, stat) for stat in
+                 (layer_mean, layer_min, layer_max, layer_sum_integral, layer_trapezoidal_integral))
+
+def layer_statistics(da,var_name,layer_depth = 300,depth_name = 'pres',depth_bnds = None):
     """
     Given a gridded oceanographic data array (da) with some x,y, and z dimensions and a depth value (layer_depth)
     will calculate statistics and integrated values from the surface to the chosen depth level
 
+    The layer is sliced by index (levels with depth <= layer_depth) and the mean, min, max, sum integral and trapezoidal
+    integral are computed together in one fused reduction over the depth axis, applied per chunk with
+    `xr.apply_ufunc(dask='parallelized')`.  Several layer depths can be computed at once from the same pass.
+
     Parameters
     ----------
     da : DataArray
         A gridded oceanographic data array xarray object with some x,y, and z dimensions.
-    layer_depth : float
+    layer_depth : float or array-like
         Chosen value for depth of the layer. Default is 300.
+        An array-like of depths (e.g. [100, 300, 700]) returns every statistic along a new `layer` dimension.
     depth_name : str
         Name of the depth dimension in the da.  Default is 'pres'.
     var_name :  str
         Name of the variable
+    depth_bnds : DataArray, optional
+        Level bounds with dimensions (depth_name, bnds), e.g. ACCESS `lev_bnds`; any other dimensions (time, member)
+        are taken at their first index. When given, the cell thickness
+        (upper - lower bound) is used as the weight of every level in the sum integral. Default is None, which
+        weights each level by the spacing to the level above (the surface level gets no weight).
         
     Returns
     -------
@@ -74,21 +212,43 @@ def layer_statistics(da,var_name,layer_depth = 300,depth_name = 'pres'):
     
     Examples:
         >>> layer_stats_ds = layer_statistics(da,var_name='oxy',layer_depth = 300,depth_name = 'pres')
+        >>> layer_stats_ds = layer_statistics(ds.o2,var_name='o2',layer_depth = [100, 300, 700],depth_name = 'lev',depth_bnds = ds.lev_bnds)
     """
-    layer = da.where(da[depth_name]<=layer_depth,drop=True)
-    # stats
-    layer_stats = [layer.mean(depth_name).rename(var_name+'_mean'),layer.min('pres').rename(var_name+'_min'),layer.max('pres').rename(var_name+'_max')]
+    depths = da[depth_name].values
+    layer_depths = np.atleast_1d(np.asarray(layer_depth, dtype='float64'))
+    # index of the deepest level in each layer - assumes the depth coordinate is monotonic and increasing
+    layer_index = np.searchsorted(depths, layer_depths, side='right') - 1
+    n_levels = max(int(layer_index.max()) + 1, 1)
+    layer = da.isel({depth_name: slice(0, n_levels)})
+    if layer.chunks is not None:
+        layer = layer.chunk({depth_name: -1})
+    if depth_bnds is not None:
+        # the bounds dimension is the trailing one (CF); other dimensions, e.g. the time and member of lev_bnds from
+        # the loaders, repeat the same bounds and are reduced to their first index
+        bnds_dim = depth_bnds.dims[-1]
+        if depth_name not in depth_bnds.dims or bnds_dim == depth_name or depth_bnds.sizes[bnds_dim] != 2:
+            raise ValueError(f"depth_bnds must have the dimension '{depth_name}' and a trailing bounds dimension of size 2, not {dict(depth_bnds.sizes)}!!!")
+        depth_bnds = depth_bnds.isel({dim: 0 for dim in depth_bnds.dims if dim not in (depth_name, bnds_dim)}, drop=True).reset_coords(drop=True)
+        thickness = abs(depth_bnds.isel({bnds_dim: 1}) - depth_bnds.isel({bnds_dim: 0})).isel({depth_name: slice(0, n_levels)})
+        if thickness.chunks is not None:
+            thickness = thickness.chunk({depth_name: -1})
+        thickness = thickness.astype('float64')
+    else:
+        thickness = xr.DataArray(np.concatenate([[0.0], np.diff(depths[:n_levels])]).astype('float64'), dims=depth_name)
+    stats = xr.apply_ufunc(
+        _layer_statistics_kernel, layer,
+        xr.DataArray(depths[:n_levels].astype('float64'), dims=depth_name),
+        thickness,
+        xr.DataArray(layer_index, dims='layer', coords={'layer': layer_depths}),
+        input_core_dims=[[depth_name], [depth_name], [depth_name], ['layer']],
+        output_core_dims=[['layer']] * 5,
+        dask='parallelized',
+        output_dtypes=[np.float64] * 5)
+    names = ['_mean', '_min', '_max', '_layer_sum_integral', '_layer_trapezoidal_integral']
     # Create Dataset dynamically
-    layer_stats_ds = xr.Dataset()
-    for da in layer_stats:
-        layer_stats_ds[da.name] = da  # Use the DataArray's name as the variable name
-    # integral
-    dz = layer[depth_name].diff(depth_name)
-    layer_sum_integral = (layer*dz).sum(dim=depth_name)
-    layer_sum_integral = layer_sum_integral.where(layer_sum_integral != 0)
-    layer_trapezoidal_integral = layer.integrate(depth_name)
-    layer_stats_ds[var_name+'_layer_sum_integral'] = layer_sum_integral
-    layer_stats_ds[var_name+'_layer_trapezoidal_integral'] = layer_trapezoidal_integral
+    layer_stats_ds = xr.Dataset({var_name + name: stat for name, stat in zip(names, stats)})
+    if np.ndim(layer_depth) == 0:
+        layer_stats_ds = layer_stats_ds.squeeze('layer', drop=True)
     return layer_stats_ds
 
 def interpolate_oxygen_target_depth(da, target=90.0, depth_coord='pres'):
@@ -98,30 +258,29 @@ def interpolate_oxygen_target_depth(da, target=90.0, depth_coord='pres'):
 
     This function identifies the shallowest crossing of the target value
     and performs linear interpolation to determine the precise depth where 
-    the target value is reached. If the values bounding the target are 
-    identical, an error is raised to prevent division by zero.
+    the target value is reached, in a single lazy pass over the depth axis
+    (see depth_crossings). The value above a crossing is always greater than
+    the target and the value below it is not, so the interpolation never
+    divides by zero.
 
     Parameters
     ----------
     da : xarray.DataArray
         The input DataArray containing oxygen concentration values, indexed 
         by the depth coordinate.
-    target : float, optional
+    target : float or array-like, optional
         The target oxygen concentration value for which to find the depth.
-        Default is 90.0.
+        An array-like of targets (e.g. [60, 90, 120]) is computed in one pass
+        and returned along a new `target` dimension. Default is 90.0.
     depth_coord : str, optional
         The name of the depth coordinate in the DataArray. Default is 'pres'.
 
     Returns
     -------
-    float
-        The interpolated depth at which the target oxygen value occurs.
-
-    Raises
-    ------
-    ValueError
-        If the values bounding the target oxygen value (value_A and value_B) 
-        are identical, which would result in a division by zero.
+    float or xarray.DataArray
+        The interpolated depth at which the target oxygen value occurs,
+        with a `target` dimension when several targets are given. NaN where
+        the column never crosses the target.
 
     Examples
     --------
@@ -132,6 +291,7 @@ def interpolate_oxygen_target_depth(da, target=90.0, depth_coord='pres'):
     >>> da = xr.DataArray(oxygen, coords={"pres": depth}, dims=["pres"])
     >>> interpolate_oxygen_target_depth(da, target=90)
     500.0
+    >>> oxyclines = interpolate_oxygen_target_depth(da, target=[60, 90, 120])
 
     Notes
     -----
@@ -139,22 +299,7 @@ def interpolate_oxygen_target_depth(da, target=90.0, depth_coord='pres'):
     - If there are multiple crossings of the target value, the function returns
       the shallowest crossing.
     """
-    mask = da <= target
-    just_below_target = mask * ~(mask.shift({depth_coord: 1}, fill_value=False))
-    just_above_target = ~mask * (mask.shift({depth_coord: -1}, fill_value=False))
-    # depths for shallowest target value crossing
-    depth_A = just_above_target[depth_coord].where(just_above_target).min(depth_coord)
-    depth_B = just_below_target[depth_coord].where(just_below_target).min(depth_coord)
-    # Get the values corresponding to the bounds for shallowest target value crossing
-    value_A = da.where(just_above_target).min(depth_coord)
-    value_B = da.where(just_below_target).min(depth_coord)
-    # test that values are not the same anywhere
-    equal_mask = value_A == value_B
-    if equal_mask.any():
-        raise ValueError("Cannot interpolate with identical values (value_A == value_B).")
-    # Linear interpolation formula
-    interpolated_depth = depth_A + ((target - value_A) / (value_B - value_A)) * (depth_B - depth_A)
-    return interpolated_depth
+    return depth_crossings(da, target, depth_coord=depth_coord)['interpolated_depth']
 
 def surface_isotherm(ocean_SST_da,threshold = 28.5):
     r"""calculate warm pool metrics based on a threshold
@@ -200,30 +345,29 @@ def interpolate_isotherm_depth(da, target=20.0, depth_coord='pres'):
 
     This function identifies the shallowest crossing of the target value
     and performs linear interpolation to determine the precise depth where 
-    the target value is reached. If the values bounding the target are 
-    identical, an error is raised to prevent division by zero.
+    the target value is reached, in a single lazy pass over the depth axis
+    (see depth_crossings). The value above a crossing is always greater than
+    the target and the value below it is not, so the interpolation never
+    divides by zero.
 
     Parameters
     ----------
     da : xarray.DataArray
         The input DataArray containing temperature values, indexed 
         by the depth coordinate.
-    target : float, optional
+    target : float or array-like, optional
         The target temperature value for which to find the depth.
-        Default is 20.0.
+        An array-like of targets (e.g. [14, 20, 26]) is computed in one pass
+        and returned along a new `target` dimension. Default is 20.0.
     depth_coord : str, optional
         The name of the depth coordinate in the DataArray. Default is 'pres'.
 
     Returns
     -------
-    float
-        The interpolated depth at which the target temperature value occurs.
-
-    Raises
-    ------
-    ValueError
-        If the values bounding the target temperature value (value_A and value_B) 
-        are identical, which would result in a division by zero.
+    float or xarray.DataArray
+        The interpolated depth at which the target temperature value occurs,
+        with a `target` dimension when several targets are given. NaN where
+        the column never crosses the target.
 
     Examples
     --------
@@ -231,6 +375,7 @@ def interpolate_isotherm_depth(da, target=20.0, depth_coord='pres'):
     >>> import numpy as np
     >>> da = xr.DataArray(oxygen, coords={"pres": depth}, dims=["pres"])
     >>> interpolate_isotherm_depth(da, target=20)
+    >>> isotherms = interpolate_isotherm_depth(da, target=[14, 20, 26])
 
 
     Notes
@@ -239,20 +384,5 @@ def interpolate_isotherm_depth(da, target=20.0, depth_coord='pres'):
     - If there are multiple crossings of the target value, the function returns
       the shallowest crossing.
     """
-    mask = da <= target
-    just_below_target = mask * ~(mask.shift({depth_coord: 1}, fill_value=False))
-    just_above_target = ~mask * (mask.shift({depth_coord: -1}, fill_value=False))
-    # depths for shallowest target value crossing
-    depth_A = just_above_target[depth_coord].where(just_above_target).min(depth_coord)
-    depth_B = just_below_target[depth_coord].where(just_below_target).min(depth_coord)
-    # Get the values corresponding to the bounds for shallowest target value crossing
-    value_A = da.where(just_above_target).min(depth_coord)
-    value_B = da.where(just_below_target).min(depth_coord)
-    # test that values are not the same anywhere
-    equal_mask = value_A == value_B
-    if equal_mask.any():
-        raise ValueError("Cannot interpolate with identical values (value_A == value_B).")
-    # Linear interpolation formula
-    interpolated_depth = depth_A + ((target - value_A) / (value_B - value_A)) * (depth_B - depth_A)
-    return interpolated_depth
+    return depth_crossings(da, target, depth_coord=depth_coord)['interpolated_depth']
 
@@ -6,11 +6,16 @@ Author = {"name": "Thomas Moore", "affiliation": "CSIRO", "email": "thomas.moore
 """
 # Standard library imports
 import os
+import re
+import json
 import socket
+import datetime
+import functools
 import yaml
 
 # Third-party imports
-#import numpy as np
+import numpy as np
+import pandas as pd
 from dask.distributed import Client, LocalCluster
 from tabulate import tabulate
 import xarray as xr
@@ -185,7 +190,228 @@ def report_esm_unique(esm_datastore_object, drop_list=['path','time_range','memb
 
 
 
-def var_name_info(catalog_object, var_name, return_results=False):
+class ESMDatastoreIndex:
+    """
+    Search index over the DataFrame of an intake-esm datastore for repeated searches and unique-value summaries.
+
+    Each column is factorised once into integer codes plus a row list per value (an inverted index). A search picks
+    the rows of the most selective column from its inverted index and filters them by the codes of the other
+    columns, so it touches only candidate rows rather than scanning the whole catalog. Search results are memoised
+    in an LRU cache. Searches give the same datastores as `esm_datastore.search` (exact values, lists of values,
+    regular-expression patterns and NaN), and an empty search gives the whole catalog; searches with `require_all_on`
+    or on catalogs with derived variables are passed through to `esm_datastore.search`.
+
+    Parameters
+    ----------
+    datastore : intake_esm.core.esm_datastore
+        The datastore to index.
+    cache_size : int, optional
+        Number of searches kept in the LRU cache. Default is 256.
+
+    Examples
+    --------
+    >>> index = ESMDatastoreIndex(load_cmip6_fs38_datastore())
+    >>> search = index.search(source_id='ACCESS-ESM1-5', experiment_id='historical', variable_id='o2')
+    >>> report_esm_unique(index)
+    """
+
+    def __init__(self, datastore, cache_size=256):
+        self.datastore = datastore
+        self.df = datastore.df
+        self.columns_with_iterables = set(datastore.esmcat.columns_with_iterables)
+        self._codes, self._categories, self._rows = {}, {}, {}
+        for column in self.df.columns:
+            if column in self.columns_with_iterables:
+                continue
+            codes, categories = pd.factorize(self.df[column], use_na_sentinel=True)
+            # rows of each value, ordered by row number, from one stable sort of the codes (NaN rows last)
+            slots = np.where(codes < 0, len(categories), codes)
+            order = np.argsort(slots, kind='stable')
+            bounds = np.concatenate([[0], np.cumsum(np.bincount(slots, minlength=len(categories) + 1))])
+            self._codes[column] = codes
+            self._categories[column] = pd.Index(categories)
+            self._rows[column] = (order, bounds)
+        self._cached_rows = functools.lru_cache(maxsize=cache_size)(self._search_rows)
+
+    def _value_codes(self, column, values):
+        """
+        Codes of the values of a query on one column - patterns are matched against the distinct values only. NaN
+        is the code -1.
+        """
+        from intake_esm._search import is_pattern
+        categories = self._categories[column]
+        codes = set()
+        for value in values:
+            if isinstance(value, str) and is_pattern(value) or isinstance(value, re.Pattern):
+                codes.update(np.flatnonzero(categories.astype(str).str.contains(value, regex=True, case=True, flags=0)).tolist())
+            elif pd.isna(value):
+                codes.add(-1)
+            elif value in categories:
+                codes.add(int(categories.get_loc(value)))
+        return np.array(sorted(codes), dtype=np.intp)
+
+    def _slots(self, column, codes):
+        """
+        Positions of codes in the inverted index of a column, where NaN rows are stored last.
+        """
+        return np.where(codes < 0, len(self._categories[column]), codes)
+
+    def _code_rows(self, column, codes):
+        """
+        Rows holding any of the codes of a column, from the inverted index.
+        """
+        order, bounds = self._rows[column]
+        slots = self._slots(column, codes)
+        return np.sort(np.concatenate([order[bounds[slot]:bounds[slot + 1]] for slot in slots])) if len(slots) else np.array([], dtype=np.intp)
+
+    def _search_rows(self, query):
+        """
+        Row numbers matching a normalised query ((column, (values, ...)), ...).
+        """
+        if not query:
+            rows = np.arange(len(self.df))
+            rows.flags.writeable = False
+            return rows
+        value_codes = {column: self._value_codes(column, values) for column, values in query}
+        # start from the column with the fewest candidate rows
+        sizes = {column: int(np.diff(self._rows[column][1])[self._slots(column, codes)].sum()) for column, codes in value_codes.items()}
+        first = min(sizes, key=sizes.get)
+        rows = self._code_rows(first, value_codes[first])
+        for column, codes in value_codes.items():
+            if column != first and len(rows):
+                rows = rows[np.isin(self._codes[column][rows], codes)]
+        rows.flags.writeable = False
+        return rows
+
+    def _normalise_query(self, query):
+        """
+        Hashable form of a query, with every value a tuple of values as in `esm_datastore.search`.
+        """
+        unknown = [column for column in query if column not in self.df.columns]
+        if unknown:
+            raise ValueError(f"The query columns {unknown} are not columns of the catalog!!!")
+        return tuple(sorted((column, tuple(values) if isinstance(values, (list, tuple, set)) else (values,))
+                            for column, values in query.items()))
+
+    def search(self, require_all_on=None, **query):
+        """
+        Search the datastore, as `esm_datastore.search(require_all_on=None, **query)`. An empty query returns the
+        whole catalog.
+        """
+        if require_all_on is not None or len(self.datastore.derivedcat.keys()) or set(query) & self.columns_with_iterables:
+            return self.datastore.search(require_all_on=require_all_on, **query)
+        rows = self._cached_rows(self._normalise_query(query))
+        esmcat = self.datastore.esmcat
+        cat = self.datastore.__class__({'esmcat': esmcat.model_dump(), 'df': self.df.iloc[rows].reset_index(drop=True)})
+        cat.esmcat.catalog_file = None
+        variable_column = esmcat.aggregation_control.variable_column_name if esmcat.aggregation_control else None
+        if esmcat.has_multiple_variable_assets and variable_column in query:
+            variables = query[variable_column]
+            cat._requested_variables = [variables] if isinstance(variables, str) else list(variables)
+        return cat
+
+    def unique(self, columns=None, **query):
+        """
+        Unique values of each column (or of the given columns) over the whole catalog or the rows matching a query,
+        as a pandas Series of lists like `esm_datastore.unique()`, from the index without rescanning the catalog.
+        """
+        columns = list(self.df.columns) if columns is None else ([columns] if isinstance(columns, str) else list(columns))
+        rows = self._cached_rows(self._normalise_query(query)) if query else None
+        unique = {}
+        for column in columns:
+            if column in self.columns_with_iterables:
+                values = self.df[column] if rows is None else self.df[column].iloc[rows]
+                unique[column] = sorted({item for items in values for item in items})
+            elif rows is None:
+                unique[column] = self._categories[column].tolist()
+            else:
+                codes = np.unique(self._codes[column][rows])
+                unique[column] = self._categories[column][codes[codes >= 0]].tolist()
+        return pd.Series(unique)
+
+    def cache_info(self):
+        """
+        Hits, misses and size of the search cache.
+        """
+        return self._cached_rows.cache_info()
+
+def _json_attr(value):
+    """
+    JSON-serialisable form of a NetCDF attribute value.
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return value
+
+def _read_variable_header(path, var_name):
+    """
+    Attributes, dims, shape and dtype of one variable, read from the header of one NetCDF file (no data are read).
+    """
+    with xr.open_dataset(path, chunks=None, cache=False) as ds:
+        variable = ds[var_name].variable
+        return {'path': path, 'attrs': {key: _json_attr(value) for key, value in variable.attrs.items()},
+                'dims': tuple(variable.dims), 'shape': tuple(variable.shape), 'dtype': str(variable.dtype)}
+
+def build_variable_index(catalog_object, name=None, group_columns=('source_id', 'table_id', 'variable_id'), max_workers=16,
+                         executor='process', index_dir=None, refresh=False):
+    """
+    Build a metadata index of every variable in an intake-esm catalog by reading the header of one representative
+    file per group (by default per model, table and variable), in parallel.
+
+    Parameters
+    ----------
+    catalog_object : intake_esm.core.esm_datastore object
+        The catalog (or a search of it) to index.
+    name : str, optional
+        Cache the index as '<name>.variables.parquet' in index_dir and reuse it on later calls. Default is None, not
+        cached.
+    group_columns : sequence of str, optional
+        Catalog columns that define one indexed variable. Default is ('source_id', 'table_id', 'variable_id').
+    max_workers : int, optional
+        Number of headers read at once. Default is 16.
+    executor : str, optional
+        'process' (default) or 'thread'. The netCDF-C library is not thread-safe, so threads are serialised.
+    index_dir : str, optional
+        Directory of the cached index. Default is None, CATALOG_SNAPSHOT_DIR.
+    refresh : bool, optional
+        Rebuild a cached index. Default is False.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per group with the group columns, the representative path, units, long_name, standard_name, dims,
+        shape (of the representative file), dtype and all attrs (as JSON).
+    """
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+    if executor not in ('thread', 'process'):
+        raise ValueError("executor must be 'thread' or 'process'!!!")
+    index_path = os.path.join(index_dir or CATALOG_SNAPSHOT_DIR, f"{name}.variables.parquet") if name else None
+    if index_path and os.path.exists(index_path) and not refresh:
+        return pd.read_parquet(index_path)
+    df = catalog_object.df
+    group_columns = list(group_columns)
+    variable_column = catalog_object.esmcat.aggregation_control.variable_column_name if catalog_object.esmcat.aggregation_control else 'variable_id'
+    representatives = df.drop_duplicates(group_columns)[group_columns + ['path']].reset_index(drop=True)
+    pool = ThreadPoolExecutor if executor == 'thread' else ProcessPoolExecutor
+    with pool(max_workers=max_workers) as workers:
+        headers = list(workers.map(_read_variable_header, representatives['path'], representatives[variable_column]))
+    index = representatives.copy()
+    for key in ('units', 'long_name', 'standard_name'):
+        index[key] = [str(header['attrs'].get(key, '')) for header in headers]
+    index['dims'] = [' '.join(header['dims']) for header in headers]
+    index['shape'] = [' '.join(map(str, header['shape'])) for header in headers]
+    index['dtype'] = [header['dtype'] for header in headers]
+    index['attrs'] = [json.dumps(header['attrs'], default=str) for header in headers]
+    if index_path:
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        index.to_parquet(index_path + '.tmp', index=False)
+        os.replace(index_path + '.tmp', index_path)
+    print(f"Indexed {len(index)} variables of {len(df)} catalog entries")
+    return index
+
+def var_name_info(catalog_object, var_name, return_results=False, variable_index=None):
     """
     Extracts information about a variable from an intake-esm catalog object.
 
@@ -197,15 +423,20 @@ def var_name_info(catalog_object, var_name, return_results=False):
         The name of the variable to extract information for.
     return_results : bool, optional
         Whether to return the variable information (default is False).
+    variable_index : pandas.DataFrame, optional
+        A variable metadata index from build_variable_index; the attributes are then looked up without opening any
+        file (default is None, the header of one file of the variable is read).
 
     Returns
     -------
     var_info : dict or None
         A dictionary containing the variable information (returned only if `return_results=True`).
     """
-    var_ds = xr.open_mfdataset((catalog_object.search(
-                    variable_id=var_name).unique().path)[0], chunks={})
-    var_info = var_ds[var_name].attrs
+    # attributes from the cached index if it has the variable, otherwise from the header of one file
+    if variable_index is not None and var_name in set(variable_index['variable_id']):
+        var_info = json.loads(variable_index.loc[variable_index['variable_id'] == var_name, 'attrs'].iloc[0])
+    else:
+        var_info = _read_variable_header(catalog_object.search(variable_id=var_name).df['path'].iloc[0], var_name)['attrs']
     # turn the dictionary into a table for easy reading - adding a header that reports the variable name and name of the catalog object
     print(f"*** Variable: \033[1m{var_name}\033[0m from catalog: {catalog_object} ***")
     table_data = []
@@ -263,32 +494,146 @@ def list_catalog_query_kwargs(esmds):
     print(tabulate([[kw] for kw in query_kwargs], headers=["Possible query kwargs"], tablefmt="fancy_grid"))
     return query_kwargs
 
-def load_cmip6_fs38_datastore():
+# default directory of the local intake-esm catalog snapshots written by load_esm_datastore_snapshot
+CATALOG_SNAPSHOT_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'ACDtools', 'catalogs')
+
+def _file_fingerprint(path, check_hash=False):
+    """
+    Fingerprint of a catalog file: modification time and size, plus the SHA-256 of the contents if check_hash.
+    """
+    stat = os.stat(path)
+    fingerprint = {'path': os.path.abspath(path), 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+    if check_hash:
+        import hashlib
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+        fingerprint['sha256'] = digest.hexdigest()
+    return fingerprint
+
+def load_esm_datastore_snapshot(name, source=None, snapshot_dir=None, refresh=False, check_hash=False):
+    """
+    Load an intake-esm datastore from a local columnar snapshot, (re)building the snapshot from the source catalog
+    when it is missing or out of date.
+
+    The snapshot is a Parquet file of the catalog DataFrame, with the string columns stored as categoricals, plus a
+    JSON file with the catalog description and the fingerprint (mtime and size, optionally SHA-256) of the source
+    catalog files. It loads in a fraction of the time of the source catalog. When the source catalog files cannot be
+    reached (e.g. offline, away from /g/data) the snapshot is used as it is.
+
+    Parameters
+    ----------
+    name : str
+        Name of the snapshot, e.g. 'cmip6_fs38'.
+    source : str, intake_esm.core.esm_datastore or callable, optional
+        The source catalog: the path of an intake-esm JSON catalog, a datastore, or a function returning one (so the
+        slow source is only loaded when the snapshot has to be rebuilt). Needed to build or refresh the snapshot.
+    snapshot_dir : str, optional
+        Directory of the snapshots. Default is None, CATALOG_SNAPSHOT_DIR (~/.cache/ACDtools/catalogs).
+    refresh : bool, optional
+        Rebuild the snapshot from the source. Default is False.
+    check_hash : bool, optional
+        Also compare the SHA-256 of the source catalog files, not only their mtime and size. Default is False.
+
+    Returns
+    -------
+    intake_esm.core.esm_datastore
+        The datastore.
+
+    Examples
+    --------
+    >>> datastore = load_esm_datastore_snapshot('synthetic', '/tmp/synthetic/synthetic_cmip6_ACCESS-ESM1-5.json')
+    """
+    snapshot_dir = snapshot_dir or CATALOG_SNAPSHOT_DIR
+    parquet_path = os.path.join(snapshot_dir, f"{name}.parquet")
+    meta_path = os.path.join(snapshot_dir, f"{name}.json")
+    if not refresh and os.path.exists(meta_path) and os.path.exists(parquet_path):
+        with open(meta_path) as file:
+            meta = json.load(file)
+        try:
+            current = [_file_fingerprint(fingerprint['path'], check_hash) for fingerprint in meta['source_files']]
+            # a hash is compared only if the snapshot recorded one
+            stale = any({key: value for key, value in new.items() if key in old} != old
+                        for new, old in zip(current, meta['source_files']))
+        except OSError:
+            print(f"WARNING: The source catalog files of the snapshot '{name}' cannot be reached, using the snapshot from {meta['created']}!!!")
+            stale = False
+        if not stale:
+            return intake.open_esm_datastore({'esmcat': meta['esmcat'], 'df': pd.read_parquet(parquet_path)})
+        print(f"The source catalog of the snapshot '{name}' has changed, rebuilding the snapshot")
+    if source is None:
+        raise ValueError(f"There is no up to date snapshot '{name}' in {snapshot_dir}, please provide source!!!")
+    source_files = []
+    if isinstance(source, str):
+        source_files.append(source)
+        datastore = intake.open_esm_datastore(source)
+    else:
+        datastore = source() if callable(source) else source
+    if datastore.esmcat.catalog_file is not None and os.path.exists(datastore.esmcat.catalog_file):
+        source_files.append(datastore.esmcat.catalog_file)
+    df = datastore.df.copy()
+    iterable_columns = datastore.esmcat.columns_with_iterables
+    for column in df.columns:
+        if column not in iterable_columns and (df[column].dtype == object or pd.api.types.is_string_dtype(df[column].dtype)):
+            df[column] = df[column].astype('category')
+    esmcat = {key: value for key, value in datastore.esmcat.model_dump(mode='json').items()
+              if key not in ('catalog_file', 'catalog_dict', 'last_updated')}
+    os.makedirs(snapshot_dir, exist_ok=True)
+    # write to temporary files and rename so a concurrent job never reads a partial snapshot
+    df.to_parquet(parquet_path + '.tmp', index=False)
+    with open(meta_path + '.tmp', 'w') as file:
+        json.dump({'esmcat': esmcat, 'created': datetime.datetime.now().isoformat(timespec='seconds'),
+                   'source_files': [_file_fingerprint(path, check_hash) for path in source_files]}, file, indent=2)
+    os.replace(parquet_path + '.tmp', parquet_path)
+    os.replace(meta_path + '.tmp', meta_path)
+    print(f"Wrote the catalog snapshot '{name}' ({len(df)} rows) to {parquet_path}")
+    return intake.open_esm_datastore({'esmcat': esmcat, 'df': pd.read_parquet(parquet_path)})
+
+def load_cmip6_fs38_datastore(snapshot=False, snapshot_dir=None, refresh=False):
     """
     Load the CMIP6 FS38 data catalog as an intake-esm datastore object.
-    
+
+    Parameters:
+    snapshot (bool): Load from a local Parquet snapshot (see load_esm_datastore_snapshot), rebuilt when the catalog changes. Default is False.
+    snapshot_dir (str): Directory of the snapshot. Default is None, CATALOG_SNAPSHOT_DIR.
+    refresh (bool): Rebuild the snapshot. Default is False.
+
     Returns:
     intake_esm.core.esm_datastore: The CMIP6 FS3.8 data catalog as an intake-esm datastore object.
     """
     
-    # Load the CMIP6 FS38 data catalog
-    nri_catalog = intake.cat.access_nri
-    cmip6_fs38_datastore = nri_catalog.search(name='cmip6_fs38').to_source()
+    def source():
+        # Load the CMIP6 FS38 data catalog
+        nri_catalog = intake.cat.access_nri
+        return nri_catalog.search(name='cmip6_fs38').to_source()
+    if snapshot:
+        return load_esm_datastore_snapshot('cmip6_fs38', source, snapshot_dir=snapshot_dir, refresh=refresh)
+    cmip6_fs38_datastore = source()
     return cmip6_fs38_datastore
 
-def load_cmip6_CLEX_datastore():
+def load_cmip6_CLEX_datastore(snapshot=False, snapshot_dir=None, refresh=False):
     """
     Load the CMIP6 FS38 data catalog as an intake-esm datastore object using the frozen CLEX NCI catalog.
     Using the 'cmip6' entry of the 'esgf' sub-catalog of the CLEX "nci" catalog provides access to only the latest CMIP6 data.
     See: https://github.com/Thomas-Moore-Creative/ACDtools/issues/2#issuecomment-2510304106
+
+    Parameters:
+    snapshot (bool): Load from a local Parquet snapshot (see load_esm_datastore_snapshot), rebuilt when the catalog changes. Default is False.
+    snapshot_dir (str): Directory of the snapshot. Default is None, CATALOG_SNAPSHOT_DIR.
+    refresh (bool): Rebuild the snapshot. Default is False.
     
     Returns:
     intake_esm.core.esm_datastore: The CMIP6 FS3.8 CLEX data catalog as an intake-esm datastore object.
     """
     
-    # Load the CMIP6 CLEX FS38 data catalog
-    clex_esgf_cat = intake.cat.nci['esgf']
-    clex_cmip6_cat = clex_esgf_cat['cmip6']
+    def source():
+        # Load the CMIP6 CLEX FS38 data catalog
+        clex_esgf_cat = intake.cat.nci['esgf']
+        return clex_esgf_cat['cmip6']
+    if snapshot:
+        return load_esm_datastore_snapshot('cmip6_CLEX', source, snapshot_dir=snapshot_dir, refresh=refresh)
+    clex_cmip6_cat = source()
     return clex_cmip6_cat
 
 def show_methods(your_object):
@@ -316,7 +661,59 @@ def remove_encoding(DS):
         DS[coord].encoding = {}
     return DS
 
-def align_lon(ds,lon_name_list):
+def _cyclic_offset(lon):
+    """
+    The index offset that makes a 1D longitude, a cyclic rotation of an increasing sequence, increasing - or None
+    when it is not one.
+    """
+    if np.isnan(lon).any():
+        return None
+    descents = np.flatnonzero(np.diff(lon) < 0)
+    if len(descents) == 0:
+        return 0
+    if len(descents) == 1 and lon[-1] < lon[0]:
+        return int(descents[0]) + 1
+    return None
+
+def _rotate_longitude(ds, lon_name, lon_min, x_dim=None):
+    """
+    Wrap ds[lon_name] into [lon_min, lon_min + 360) and rotate ds so the longitude starts at lon_min.
+
+    A cyclic longitude only needs a rotation, which is done with one index offset: the two slices either side of
+    it are swapped, so dask blocks are re-ordered rather than shuffled or rechunked. A 2D (curvilinear) longitude, e.g. ACCESS
+    longitude(j, i), is rotated along x_dim by the offset shared by its rows, and its values are only wrapped, so the
+    rows that are not monotonic (e.g. at the tripolar fold) stay as they are. A 1D longitude that is not cyclic
+    falls back to sortby.
+    """
+    lon = ds[lon_name]
+    attrs = lon.attrs
+    wrapped = (lon - lon_min) % 360 + lon_min
+    if lon.ndim == 1:
+        x_dim = lon.dims[0]
+        offset = _cyclic_offset(np.asarray(wrapped.values))
+        if offset is None:
+            ds = ds.assign_coords({lon_name: wrapped}).sortby(lon_name)
+            ds[lon_name].attrs = attrs
+            return ds
+    else:
+        x_dim = x_dim or lon.dims[-1]
+        if x_dim not in lon.dims:
+            raise ValueError(f"'{x_dim}' is not a dimension of '{lon_name}'!!!")
+        rows = np.asarray(wrapped.transpose(..., x_dim).values).reshape(-1, lon.sizes[x_dim])
+        offsets = [offset for offset in map(_cyclic_offset, rows) if offset is not None]
+        if not offsets:
+            raise ValueError(f"No row of '{lon_name}' is a cyclic longitude along '{x_dim}'!!!")
+        offset = int(np.bincount(offsets).argmax())
+    ds = ds.assign_coords({lon_name: wrapped})
+    if offset:
+        # the two slices are views of the original dask blocks - only the block holding the seam is split
+        concat_kwargs = {'data_vars': 'minimal'} if isinstance(ds, xr.Dataset) else {}
+        ds = xr.concat([ds.isel({x_dim: slice(offset, None)}), ds.isel({x_dim: slice(None, offset)})], dim=x_dim,
+                       coords='minimal', compat='override', join='override', combine_attrs='override', **concat_kwargs)
+    ds[lon_name].attrs = attrs
+    return ds
+
+def align_lon(ds,lon_name_list,x_dim=None):
     """
     align_lon
     Returns: ds
@@ -327,12 +724,13 @@ def align_lon(ds,lon_name_list):
     Assumptions:
     Dataset = ds
     Use: ds_aligned = align_lon(ds,lon_name_list)
+    Longitudes are wrapped to 0-360 and, when cyclic, rotated by a single index offset rather than sorted, so dask
+    chunks are not shuffled. 2D (curvilinear) longitudes, e.g. ACCESS longitude(j, i), are rotated along x_dim
+    (default: the last dimension of the longitude).
     Limitations:
     """
     for lon_name in lon_name_list:
-        ds_attrs = ds[lon_name].attrs
-        ds = ds.assign_coords({lon_name: (ds[lon_name] + 360)  % 360}).sortby(lon_name)
-        ds[lon_name].attrs = ds_attrs
+        ds = _rotate_longitude(ds, lon_name, 0, x_dim=x_dim)
     return ds
 
 def replace_zero_w_nan(data_w_zero):
@@ -341,22 +739,26 @@ def replace_zero_w_nan(data_w_zero):
     return data_w_nan
 
 
-def convert_longitude_360_2_180(da, lon_name='longitude'):
+def convert_longitude_360_2_180(da, lon_name='longitude', x_dim=None):
     """
     Convert longitude values from 0-360 to -180 to 180.
 
+    A cyclic longitude is rotated by a single index offset rather than sorted, so dask chunks are not shuffled.
+
     Parameters:
     - da: xarray.DataArray or xarray.Dataset
         Input data with longitude values in the range 0-360.
     - lon_name: str
         Name of the longitude coordinate.
+    - x_dim: str
+        For a 2D (curvilinear) longitude, e.g. ACCESS longitude(j, i), the dimension rotated. Default is the last
+        dimension of the longitude.
 
     Returns:
     - xarray.DataArray or xarray.Dataset
         Data with longitude values converted to -180 to 180.
     """
-    da = da.assign_coords(**{lon_name: ((da[lon_name] + 180) % 360) - 180})
-    return da.sortby(lon_name)
+    return _rotate_longitude(da, lon_name, -180, x_dim=x_dim)
         
 
 
@@ -0,0 +1,93 @@
+"""
+Benchmarks for ACDtools.ard: ensemble loading and chunk inspection on synthetic ACCESS-ESM1.5 catalogs.
+"""
+# Standard library imports
+from contextlib import redirect_stdout
+import io
+import tempfile
+
+# Local application imports
+from ACDtools import ard
+from .common import CHUNKINGS, SIZES, bytes_read, make_catalogs, open_search, task_count
+
+
+class LoadEnsemble:
+    # 'auto' plans the chunks from the storage layout with ard.plan_chunks
+    params = (list(SIZES), list(CHUNKINGS) + ['auto'])
+    param_names = ['size', 'chunking']
+    timeout = 600
+
+    def setup_cache(self):
+        return make_catalogs()
+
+    def setup(self, catalogs, size, chunking):
+        self.search = open_search(catalogs[size])
+
+    def _load(self, chunking):
+        with redirect_stdout(io.StringIO()):
+            if chunking == 'auto':
+                return ard.load_ACCESS_ESM_ensemble(self.search, use_cftime=True, chunking_key='auto')
+            return ard.load_ACCESS_ESM_ensemble(self.search, use_cftime=True, chunking_settings=dict(CHUNKINGS[chunking]))
+
+    def time_load(self, catalogs, size, chunking):
+        self._load(chunking)
+
+    def peakmem_load(self, catalogs, size, chunking):
+        self._load(chunking)
+
+    def track_task_count(self, catalogs, size, chunking):
+        return task_count(self._load(chunking))
+    track_task_count.unit = 'tasks'
+
+    def track_bytes_read(self, catalogs, size, chunking):
+        start = bytes_read()
+        self._load(chunking)
+        return bytes_read() - start
+    track_bytes_read.unit = 'bytes'
+
+
+class LoadReferenceIndex:
+    # opening the ensemble from a warm virtual reference index, and building the index from scratch
+    params = list(SIZES)
+    param_names = ['size']
+    timeout = 600
+
+    def setup_cache(self):
+        return make_catalogs()
+
+    def setup(self, catalogs, size):
+        self.search = open_search(catalogs[size])
+        self.index_dir = tempfile.mkdtemp()
+        with redirect_stdout(io.StringIO()):
+            ard.build_reference_index(self.search, index_dir=self.index_dir)
+
+    def time_load(self, catalogs, size):
+        with redirect_stdout(io.StringIO()):
+            ard.load_ACCESS_ESM_ensemble(self.search, use_cftime=True, reference_index=True, index_dir=self.index_dir)
+
+    def time_build(self, catalogs, size):
+        with redirect_stdout(io.StringIO()):
+            ard.build_reference_index(self.search, index_dir=self.index_dir, refresh=True)
+
+    def track_bytes_read(self, catalogs, size):
+        start = bytes_read()
+        with redirect_stdout(io.StringIO()):
+            ard.load_ACCESS_ESM_ensemble(self.search, use_cftime=True, reference_index=True, index_dir=self.index_dir)
+        return bytes_read() - start
+    track_bytes_read.unit = 'bytes'
+
+
+class FindChunkingInfo:
+    params = list(SIZES)
+    param_names = ['size']
+    timeout = 300
+
+    def setup_cache(self):
+        return make_catalogs()
+
+    def setup(self, catalogs, size):
+        self.search = open_search(catalogs[size])
+
+    def time_find_chunking_info(self, catalogs, size):
+        with redirect_stdout(io.StringIO()):
+            ard.find_chunking_info(self.search, 'thetao')
@@ -0,0 +1,67 @@
+"""
+common.py
+
+Shared synthetic data and measurement helpers for the ACDtools asv benchmarks.
+"""
+# Standard library imports
+import os
+
+# Third-party imports
+import dask
+import intake
+try:
+    import psutil
+except ImportError:  # bytes read are then reported as 0
+    psutil = None
+
+# Local application imports
+from ACDtools.make_data import make_synthetic_ACCESS_ESM
+
+# data sizes of the synthetic ACCESS-ESM1.5 ensembles - ACCESS-ESM1.5 ocean is nj=300, ni=360, nlev=50
+SIZES = {
+    'small': {'nj': 30, 'ni': 36, 'nlev': 50, 'n_members': 3, 'n_years': 2},
+    'medium': {'nj': 150, 'ni': 180, 'nlev': 50, 'n_members': 4, 'n_years': 2},
+}
+
+# dask chunking on open, by name - 'config_3D' is the ACCESS_ESM15_3D entry of config.yaml
+CHUNKINGS = {
+    'file': {},
+    'time1': {'chunks': {'time': 1}},
+    'config_3D': {'chunks': {'member': 1, 'time': 12, 'lev': -1, 'i': -1, 'j': -1}},
+}
+
+WORKERS = [1, 4]
+
+def make_catalogs(root='synthetic', variables=('thetao', 'o2')):
+    """
+    Write one synthetic ensemble and intake-esm catalog per entry of SIZES, returning {size: catalog path}.
+    """
+    return {size: make_synthetic_ACCESS_ESM(os.path.abspath(os.path.join(root, size)), variables=variables, **kwargs)
+            for size, kwargs in SIZES.items()}
+
+def open_search(catalog_path, variable_id='thetao'):
+    """
+    Catalog search for one variable of a synthetic ensemble.
+    """
+    return intake.open_esm_datastore(catalog_path).search(variable_id=variable_id)
+
+def compute(obj, workers):
+    """
+    Compute a dask-backed object on the threaded scheduler with a fixed number of workers.
+    """
+    with dask.config.set(scheduler='threads', num_workers=workers):
+        return dask.compute(obj)[0]
+
+def task_count(obj):
+    """
+    Number of tasks in the dask graph of an xarray object.
+    """
+    return len(obj.__dask_graph__())
+
+def bytes_read():
+    """
+    Bytes read so far by this process (Linux /proc io counters).
+    """
+    if psutil is None:
+        return 0
+    return psutil.Process().io_counters().read_chars
@@ -0,0 +1,82 @@
+"""
+Benchmarks for the ARD Zarr write profiles of ACDtools.make_data: compression ratio, write throughput and read
+throughput of each profile on a sample of a synthetic ACCESS-ESM1.5 ensemble.
+"""
+# Standard library imports
+from contextlib import redirect_stdout
+import io
+import os
+import shutil
+import tempfile
+import time
+
+# Third-party imports
+import dask
+import xarray as xr
+
+# Local application imports
+from ACDtools import ard, make_data, util
+from .common import CHUNKINGS, SIZES, make_catalogs, open_search
+
+# 'none' is the current remove_encoding + to_zarr default
+PROFILES = ['none'] + list(make_data.WRITE_PROFILES)
+
+def _store_bytes(path):
+    """
+    Bytes on disk of a Zarr store.
+    """
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+class WriteProfiles:
+    params = (list(SIZES), PROFILES)
+    param_names = ['size', 'profile']
+    timeout = 600
+
+    def setup_cache(self):
+        return make_catalogs()
+
+    def setup(self, catalogs, size, profile):
+        with redirect_stdout(io.StringIO()):
+            ds = ard.load_ACCESS_ESM_ensemble(open_search(catalogs[size]), use_cftime=True,
+                                              chunking_settings=dict(CHUNKINGS['config_3D']))
+            ds = util.remove_encoding(ds.drop_vars(['latitude', 'longitude'], errors='ignore'))
+            # sample: the first year of every member
+            self.ds = ds.isel(time=slice(0, 12)).persist()
+            self.profiled = self.ds if profile == 'none' else make_data.apply_write_profile(self.ds, profile)
+        self.write_dir = tempfile.mkdtemp()
+        self.store = os.path.join(self.write_dir, f'{profile}.zarr')
+        self.profiled.to_zarr(self.store, mode='w', consolidated=True)
+        self.raw_bytes = self.ds['thetao'].nbytes
+
+    def teardown(self, catalogs, size, profile):
+        shutil.rmtree(self.write_dir, ignore_errors=True)
+
+    def time_write(self, catalogs, size, profile):
+        self.profiled.to_zarr(os.path.join(self.write_dir, 'write.zarr'), mode='w', consolidated=True)
+
+    def time_read(self, catalogs, size, profile):
+        with dask.config.set(scheduler='threads'):
+            xr.open_zarr(self.store, consolidated=True)['thetao'].load()
+
+    def track_compression_ratio(self, catalogs, size, profile):
+        return self.raw_bytes / _store_bytes(self.store)
+    track_compression_ratio.unit = 'ratio'
+
+    def track_write_throughput(self, catalogs, size, profile):
+        start = time.perf_counter()
+        self.profiled.to_zarr(os.path.join(self.write_dir, 'write.zarr'), mode='w', consolidated=True)
+        return self.raw_bytes / 1e6 / (time.perf_counter() - start)
+    track_write_throughput.unit = 'MB/s'
+
+    def track_read_throughput(self, catalogs, size, profile):
+        start = time.perf_counter()
+        with dask.config.set(scheduler='threads'):
+            xr.open_zarr(self.store, consolidated=True)['thetao'].load()
+        return self.raw_bytes / 1e6 / (time.perf_counter() - start)
+    track_read_throughput.unit = 'MB/s'
+
+    def track_max_relative_error(self, catalogs, size, profile):
+        stored = xr.open_zarr(self.store, consolidated=True)['thetao']
+        return float(abs(stored - self.ds['thetao']).max() / abs(self.ds['thetao']).max())
+    track_max_relative_error.unit = 'relative error'
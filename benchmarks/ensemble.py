@@ -0,0 +1,48 @@
+"""
+Benchmarks for ACDtools.ensemble: one-pass ensemble statistics against separate xarray reductions.
+"""
+# Standard library imports
+from contextlib import redirect_stdout
+import io
+
+# Third-party imports
+import xarray as xr
+
+# Local application imports
+from ACDtools import ard, ensemble
+from .common import CHUNKINGS, SIZES, WORKERS, compute, make_catalogs, open_search, task_count
+
+QUANTILES = [0.05, 0.5, 0.95]
+
+
+class EnsembleStatistics:
+    # 'xarray' is mean, std, min, max and quantile as separate reductions, with member rechunked to one chunk
+    params = (list(SIZES), ['streaming', 'xarray'], WORKERS)
+    param_names = ['size', 'method', 'workers']
+    timeout = 600
+
+    def setup_cache(self):
+        return make_catalogs()
+
+    def setup(self, catalogs, size, method, workers):
+        with redirect_stdout(io.StringIO()):
+            ds = ard.load_ACCESS_ESM_ensemble(open_search(catalogs[size]), use_cftime=True,
+                                              chunking_settings=dict(CHUNKINGS['config_3D']))
+        self.da = ds['thetao']
+
+    def result(self, method):
+        if method == 'streaming':
+            return ensemble.ensemble_statistics(self.da, quantiles=QUANTILES)
+        return xr.Dataset({'mean': self.da.mean('member'), 'std': self.da.std('member', ddof=1),
+                           'min': self.da.min('member'), 'max': self.da.max('member'),
+                           'quantiles': self.da.chunk({'member': -1}).quantile(QUANTILES, 'member')})
+
+    def time_compute(self, catalogs, size, method, workers):
+        compute(self.result(method), workers)
+
+    def peakmem_compute(self, catalogs, size, method, workers):
+        compute(self.result(method), workers)
+
+    def track_task_count(self, catalogs, size, method, workers):
+        return task_count(self.result(method))
+    track_task_count.unit = 'tasks'
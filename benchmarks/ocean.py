@@ -0,0 +1,67 @@
+"""
+Benchmarks for the ACDtools.ocean water-column kernels on synthetic ACCESS-ESM1.5 ensembles.
+"""
+# Standard library imports
+from contextlib import redirect_stdout
+import io
+
+# Local application imports
+from ACDtools import ard, ocean
+from .common import CHUNKINGS, SIZES, WORKERS, bytes_read, compute, make_catalogs, open_search, task_count
+
+# ocean kernels need the full depth axis in one chunk
+COLUMN_CHUNKINGS = ['file', 'config_3D']
+
+
+class _OceanKernel:
+    params = (list(SIZES), COLUMN_CHUNKINGS, WORKERS)
+    param_names = ['size', 'chunking', 'workers']
+    timeout = 600
+    variable_id = 'o2'
+
+    def setup_cache(self):
+        return make_catalogs()
+
+    def setup(self, catalogs, size, chunking, workers):
+        with redirect_stdout(io.StringIO()):
+            ds = ard.load_ACCESS_ESM_ensemble(open_search(catalogs[size], self.variable_id), use_cftime=True,
+                                              chunking_settings=dict(CHUNKINGS[chunking]))
+        self.da = ds[self.variable_id]
+
+    def time_compute(self, catalogs, size, chunking, workers):
+        compute(self.result(), workers)
+
+    def peakmem_compute(self, catalogs, size, chunking, workers):
+        compute(self.result(), workers)
+
+    def track_task_count(self, catalogs, size, chunking, workers):
+        return task_count(self.result())
+    track_task_count.unit = 'tasks'
+
+    def track_bytes_read(self, catalogs, size, chunking, workers):
+        start = bytes_read()
+        compute(self.result(), workers)
+        return bytes_read() - start
+    track_bytes_read.unit = 'bytes'
+
+
+class ThresholdDepth(_OceanKernel):
+    def result(self):
+        return ocean.threshold_depth(self.da, chosen_threshold=0.15, depth_name='lev')[0]
+
+
+class InterpolateOxygenTargetDepth(_OceanKernel):
+    def result(self):
+        return ocean.interpolate_oxygen_target_depth(self.da, target=[0.1, 0.15, 0.2], depth_coord='lev')
+
+
+class InterpolateIsothermDepth(_OceanKernel):
+    variable_id = 'thetao'
+
+    def result(self):
+        return ocean.interpolate_isotherm_depth(self.da, target=20.0, depth_coord='lev')
+
+
+class LayerStatistics(_OceanKernel):
+    def result(self):
+        return ocean.layer_statistics(self.da, 'o2', layer_depth=[100, 300, 700], depth_name='lev').to_array()
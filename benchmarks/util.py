@@ -0,0 +1,51 @@
+"""
+Benchmarks for the ACDtools.util longitude helpers on dask-backed regular grids.
+"""
+# Third-party imports
+import dask.array as dsa
+import numpy as np
+import xarray as xr
+
+# Local application imports
+from ACDtools import util
+from .common import WORKERS, compute, task_count
+
+# (time, lat, lon) sizes and the lon chunk size of the regular grids
+GRIDS = {'1deg': (120, 180, 360), 'quarter_deg': (24, 720, 1440)}
+LON_CHUNKS = [-1, 90]
+
+
+class _Longitude:
+    params = (list(GRIDS), LON_CHUNKS, WORKERS)
+    param_names = ['grid', 'lon_chunk', 'workers']
+    timeout = 300
+    lon_start = 0.0
+
+    def setup(self, grid, lon_chunk, workers):
+        n_time, n_lat, n_lon = GRIDS[grid]
+        lon = self.lon_start + (np.arange(n_lon) + 0.5) * 360.0 / n_lon
+        lat = -90.0 + (np.arange(n_lat) + 0.5) * 180.0 / n_lat
+        data = dsa.random.random((n_time, n_lat, n_lon), chunks=(12, -1, lon_chunk if lon_chunk > 0 else n_lon))
+        self.da = xr.DataArray(data, dims=['time', 'lat', 'lon'], coords={'lat': lat, 'lon': lon}, name='sst')
+
+    def time_compute(self, grid, lon_chunk, workers):
+        compute(self.result(), workers)
+
+    def peakmem_compute(self, grid, lon_chunk, workers):
+        compute(self.result(), workers)
+
+    def track_task_count(self, grid, lon_chunk, workers):
+        return task_count(self.result())
+    track_task_count.unit = 'tasks'
+
+
+class AlignLon(_Longitude):
+    lon_start = -180.0
+
+    def result(self):
+        return util.align_lon(self.da.to_dataset(), ['lon'])['sst']
+
+
+class ConvertLongitude360To180(_Longitude):
+    def result(self):
+        return util.convert_longitude_360_2_180(self.da, lon_name='lon')
@@ -0,0 +1,117 @@
+"""
+Benchmarks for NetCDF -> Zarr ARD writes of synthetic ACCESS-ESM1.5 ensembles.
+"""
+# Standard library imports
+from contextlib import redirect_stdout
+import io
+import os
+import shutil
+import tempfile
+
+# Third-party imports
+import dask
+import xarray as xr
+
+# Local application imports
+from ACDtools import ard, make_data, util
+from .common import CHUNKINGS, SIZES, WORKERS, bytes_read, make_catalogs, open_search, task_count
+
+
+class NetCDFToZarr:
+    params = (list(SIZES), ['file', 'config_3D'], WORKERS)
+    param_names = ['size', 'chunking', 'workers']
+    timeout = 900
+
+    def setup_cache(self):
+        return make_catalogs()
+
+    def setup(self, catalogs, size, chunking, workers):
+        with redirect_stdout(io.StringIO()):
+            ds = ard.load_ACCESS_ESM_ensemble(open_search(catalogs[size]), use_cftime=True,
+                                              chunking_settings=dict(CHUNKINGS[chunking]))
+        self.ds = util.remove_encoding(ds)
+        self.write_dir = tempfile.mkdtemp()
+
+    def teardown(self, catalogs, size, chunking, workers):
+        shutil.rmtree(self.write_dir, ignore_errors=True)
+
+    def _write(self, workers):
+        with dask.config.set(scheduler='threads', num_workers=workers):
+            self.ds.to_zarr(os.path.join(self.write_dir, 'ensemble.zarr'), mode='w', consolidated=True)
+
+    def _write_regions(self, workers):
+        with dask.config.set(scheduler='threads', num_workers=workers), redirect_stdout(io.StringIO()):
+            make_data.write_ard_zarr(self.ds, os.path.join(self.write_dir, 'ensemble_regions.zarr'), resume=False,
+                                     max_concurrent=workers)
+
+    def time_to_zarr(self, catalogs, size, chunking, workers):
+        self._write(workers)
+
+    def time_write_ard_zarr(self, catalogs, size, chunking, workers):
+        self._write_regions(workers)
+
+    def peakmem_to_zarr(self, catalogs, size, chunking, workers):
+        self._write(workers)
+
+    def track_task_count(self, catalogs, size, chunking, workers):
+        return task_count(self.ds)
+    track_task_count.unit = 'tasks'
+
+    def track_bytes_read(self, catalogs, size, chunking, workers):
+        start = bytes_read()
+        self._write(workers)
+        return bytes_read() - start
+    track_bytes_read.unit = 'bytes'
+
+
+# the chunk4member / chunk4time / chunk4time4member layouts of the ARD rechunk notebook, scaled to the synthetic grids
+RECHUNK_LAYOUTS = {
+    'chunk4member': {'member': -1, 'time': 1, 'lev': 25},
+    'chunk4time': {'time': -1, 'lev': 1, 'i': 18},
+    'chunk4time4member': {'time': -1, 'lev': 1, 'member': -1, 'i': 6, 'j': 5},
+}
+
+class RechunkZarr:
+    params = (list(SIZES), WORKERS)
+    param_names = ['size', 'workers']
+    timeout = 900
+
+    def setup_cache(self):
+        return make_catalogs()
+
+    def setup(self, catalogs, size, workers):
+        self.write_dir = tempfile.mkdtemp()
+        self.base = os.path.join(self.write_dir, 'base.zarr')
+        with redirect_stdout(io.StringIO()):
+            ds = ard.load_ACCESS_ESM_ensemble(open_search(catalogs[size]), use_cftime=True,
+                                              chunking_settings=dict(CHUNKINGS['config_3D']))
+        ds = util.remove_encoding(ds.drop_vars(['latitude', 'longitude'], errors='ignore'))
+        with dask.config.set(scheduler='threads', num_workers=workers):
+            ds.to_zarr(self.base, mode='w', consolidated=True)
+        self.targets = {os.path.join(self.write_dir, f'{layout}.zarr'): chunks for layout, chunks in RECHUNK_LAYOUTS.items()}
+
+    def teardown(self, catalogs, size, workers):
+        shutil.rmtree(self.write_dir, ignore_errors=True)
+
+    def _rechunk_ard_zarr(self, workers):
+        with dask.config.set(scheduler='threads', num_workers=workers), redirect_stdout(io.StringIO()):
+            make_data.rechunk_ard_zarr(self.base, self.targets, max_mem='256MB')
+
+    def _rechunk_sequential(self, workers):
+        # one .chunk().to_zarr() pass over the base store per layout, as in the rechunk notebook
+        with dask.config.set(scheduler='threads', num_workers=workers):
+            for path, chunks in self.targets.items():
+                base = util.remove_encoding(xr.open_zarr(self.base, consolidated=True))
+                base.chunk(chunks).to_zarr(path, mode='w', consolidated=True)
+
+    def time_rechunk_ard_zarr(self, catalogs, size, workers):
+        self._rechunk_ard_zarr(workers)
+
+    def time_rechunk_sequential(self, catalogs, size, workers):
+        self._rechunk_sequential(workers)
+
+    def peakmem_rechunk_ard_zarr(self, catalogs, size, workers):
+        self._rechunk_ard_zarr(workers)
+
+    def peakmem_rechunk_sequential(self, catalogs, size, workers):
+        self._rechunk_sequential(workers)
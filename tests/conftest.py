@@ -0,0 +1,14 @@
+# tests/conftest.py
+
+import intake
+import pytest
+
+from ACDtools.make_data import make_synthetic_ACCESS_ESM
+
+
+@pytest.fixture(scope="session")
+def synthetic_catalog(tmp_path_factory):
+    # 11 members, so string-sorted member labels (r1, r10, r11, r2, ...) differ from the parsed order
+    catalog_path = make_synthetic_ACCESS_ESM(str(tmp_path_factory.mktemp("synthetic")), variables=("thetao", "o2"),
+                                             n_members=11, n_years=2, nj=6, ni=8, nlev=8)
+    return intake.open_esm_datastore(catalog_path)
@@ -0,0 +1,117 @@
+# tests/test_ard.py
+
+import os
+
+import intake
+import numpy as np
+import xarray as xr
+
+from ACDtools import ard, make_data
+
+
+def _open_file(catalog, member_id):
+    path = catalog.df.query("variable_id == 'thetao' and member_id == @member_id").sort_values("time_range")["path"]
+    return xr.open_mfdataset(list(path), combine="nested", concat_dim="time", data_vars="minimal", coords="minimal",
+                             compat="override", use_cftime=True)
+
+
+def test_load_ensemble_member_order(synthetic_catalog):
+    ds = ard.load_ACCESS_ESM_ensemble(synthetic_catalog.search(variable_id="thetao"), use_cftime=True)
+    assert list(ds["realization"].values) == list(range(1, 12))
+    assert list(ds["member"].values) == [f"r{n}i1p1f1" for n in range(1, 12)]
+    assert "time_bnds" not in ds.variables
+    for member_id in ("r1i1p1f1", "r2i1p1f1", "r10i1p1f1"):
+        with _open_file(synthetic_catalog, member_id) as expected:
+            np.testing.assert_array_equal(ds["thetao"].sel(member=member_id).values, expected["thetao"].values)
+
+
+def test_reference_index_member_labels(synthetic_catalog, tmp_path):
+    search = synthetic_catalog.search(variable_id="thetao")
+    ds = ard.load_ACCESS_ESM_ensemble(search, use_cftime=True, reference_index=True, index_dir=str(tmp_path))
+    assert list(ds["member"].values) == [f"r{n}i1p1f1" for n in range(1, 12)]
+    # the integer levels are attached to the right members
+    assert all(ard.member_index([member_id])["realization"].iloc[0] == realization
+               for member_id, realization in zip(ds["member"].values, ds["realization"].values))
+    first = ard.select_members(ds, realization=1)
+    assert list(first["member"].values) == ["r1i1p1f1"]
+    with _open_file(synthetic_catalog, "r1i1p1f1") as expected:
+        np.testing.assert_array_equal(first["thetao"].isel(member=0).values, expected["thetao"].values)
+    baseline = ard.load_ACCESS_ESM_ensemble(search, use_cftime=True)
+    xr.testing.assert_equal(ds["thetao"].load(), baseline["thetao"].load())
+
+
+def test_ard_registry_lookup(tmp_path):
+    write_dir = str(tmp_path)
+    # a lookup never creates the registry
+    assert ard.find_ard_store(write_dir, "ACCESS-ESM1-5", "historical", "o2") is None
+    assert not (tmp_path / ard.ARD_REGISTRY_NAME).exists()
+    for version in ("v20250101_000000", "v20250201_000000"):
+        store = tmp_path / ard.ard_store_name("ACCESS-ESM1-5", "historical", "o2", version=version)
+        xr.Dataset({"o2": ("x", np.arange(3.0))}).to_zarr(str(store), consolidated=True)
+    (tmp_path / (store.name + make_data.ZARR_MANIFEST_SUFFIX)).write_text('{"complete": false}')
+    # the store with an incomplete manifest is skipped
+    assert [os.path.basename(path) for path in ard.rebuild_ard_registry(write_dir)] == [
+        "ACCESS-ESM1-5.historical.o2.base.v20250101_000000.zarr"]
+    assert ard.find_ard_store(write_dir, "ACCESS-ESM1-5", "historical", "o2").endswith("v20250101_000000.zarr")
+    ard.register_ard_store(write_dir, str(store))
+    assert ard.find_ard_store(write_dir, "ACCESS-ESM1-5", "historical", "o2") == str(store)
+    assert ard.find_ard_store(write_dir, "ACCESS-ESM1-5", "historical", "o2", layout="chunk4time") is None
+
+
+def test_find_chunking_info(synthetic_catalog, tmp_path):
+    layout = ard.find_chunking_info(synthetic_catalog.search(variable_id="thetao"), var_name="thetao", return_results=True)
+    assert len(layout) == len(synthetic_catalog.search(variable_id="thetao").df)
+    assert set(layout["chunk_sizes"]) == {(1, 8, 6, 8)}
+    assert set(layout["compression"]) == {"gzip"} and set(layout["compression_level"]) == {1} and layout["shuffle"].all()
+    assert not layout["heterogeneous"].any()
+    # the netCDF4 fallback reads the same layout as h5py
+    path = layout["path"].iloc[0]
+    by_variable = lambda records: sorted(records, key=lambda record: record["variable"])
+    assert by_variable(ard._read_chunk_layout_netcdf4(path)) == by_variable(ard._read_chunk_layout(path))
+    # a layout change part way through a run is flagged
+    catalog = intake.open_esm_datastore(make_data.make_synthetic_ACCESS_ESM(str(tmp_path), n_members=2, nj=4, ni=5, nlev=3))
+    path = catalog.df.sort_values("time_range")["path"].iloc[-1]
+    with xr.open_dataset(path) as ds:
+        ds = ds.load()
+    ds.to_netcdf(path, encoding={"thetao": {"zlib": True, "chunksizes": (12, 1, 4, 5)}})
+    layout = ard.find_chunking_info(catalog, var_name="thetao", return_results=True)
+    assert layout["heterogeneous"].all()
+    assert set(layout["chunk_sizes"]) == {(1, 3, 4, 5), (12, 1, 4, 5)}
+
+
+def test_trim_catalog_time(synthetic_catalog):
+    search = synthetic_catalog.search(variable_id="thetao")
+    # the window cuts through the 1850 files and misses the 1851 files
+    trimmed = ard.trim_catalog_time(search, "1850-07-01", "1850-09-30")
+    assert set(trimmed.df["path"]) == set(search.df.loc[search.df["time_range"] == "185001-185012", "path"])
+    # the extent read from the files when there is no time_range column gives the same files
+    no_time_range = search.__class__({"esmcat": search.esmcat.model_dump(), "df": search.df.drop(columns="time_range")})
+    assert set(ard.trim_catalog_time(no_time_range, "1850-07-01", "1850-09-30").df["path"]) == set(trimmed.df["path"])
+    assert len(ard.trim_catalog_time(search, "1850-12-31", "1851-01-01").df) == len(search.df)
+    members = {"realization": slice(1, 2)}
+    ds = ard.load_ACCESS_ESM_ensemble(search, use_cftime=True, members=members,
+                                      time_trim={"enabled": True, "start": "1850-07-01", "end": "1850-09-30"})
+    full = ard.load_ACCESS_ESM_ensemble(search, use_cftime=True, members=members)
+    expected = full.sel(time=slice("1850-07-01", "1850-09-30"))
+    assert ds.sizes["time"] == 3
+    np.testing.assert_array_equal(ds["time"].values, expected["time"].values)
+    np.testing.assert_array_equal(ds["thetao"].values, expected["thetao"].values)
+
+
+def test_grid_store_round_trip(synthetic_catalog, tmp_path):
+    grid_names = ["latitude", "longitude", "vertices_latitude", "vertices_longitude"]
+    paths = [synthetic_catalog.df.query("variable_id == @variable_id")["path"].iloc[0] for variable_id in ("thetao", "o2")]
+    datasets = [xr.open_dataset(path, use_cftime=True) for path in paths]
+    dropped = [ard.save_n_drop_multidim_lat_lon(ds, str(tmp_path), variable_name=variable_id)
+               for ds, variable_id in zip(datasets, ("thetao", "o2"))]
+    # the same grid is stored once with one stable ID, whatever variable it came from
+    assert os.listdir(tmp_path) == [os.path.basename(dropped[0].attrs["coords_filename"])]
+    assert dropped[0].attrs["grid_id"] == dropped[1].attrs["grid_id"]
+    assert dropped[0].attrs["grid_id"] == ard.grid_id(xr.Dataset({name: datasets[0][name].variable for name in grid_names}))
+    assert not set(grid_names) & set(dropped[0].variables)
+    for ds, ds_dropped in zip(datasets, dropped):
+        attached = ard.attach_grid(ds_dropped, save_coords_dir=str(tmp_path))
+        for name in grid_names:
+            xr.testing.assert_identical(attached[name].variable, ds[name].variable)
+        xr.testing.assert_identical(ard.attach_grid(ds_dropped)["latitude"].variable, ds["latitude"].variable)
+        ds.close()
@@ -0,0 +1,35 @@
+# tests/test_ensemble.py
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from ACDtools import ard, ensemble
+
+
+@pytest.fixture(scope="module")
+def thetao(synthetic_catalog):
+    ds = ard.load_ACCESS_ESM_ensemble(synthetic_catalog.search(variable_id="thetao"), use_cftime=True)
+    return ds["thetao"].isel(time=slice(0, 3)).chunk({"member": 3})
+
+
+def test_ensemble_statistics_match_xarray(thetao):
+    stats = ensemble.ensemble_statistics(thetao, quantiles=[0.05, 0.5, 0.95]).compute()
+    assert stats["count"].dtype.kind == "i"
+    np.testing.assert_array_equal(stats["count"].values, thetao.notnull().sum("member").values)
+    xr.testing.assert_allclose(stats["mean"], thetao.mean("member").compute(), rtol=1e-5)
+    xr.testing.assert_allclose(stats["var"], thetao.var("member", ddof=1).compute(), rtol=1e-4, atol=1e-6)
+    xr.testing.assert_allclose(stats["min"], thetao.min("member").compute())
+    xr.testing.assert_allclose(stats["max"], thetao.max("member").compute())
+    # exact while the ensemble has no more than n_centroids members
+    expected = thetao.chunk({"member": -1}).quantile([0.05, 0.5, 0.95], "member").compute()
+    np.testing.assert_allclose(stats["quantiles"].transpose(*expected.dims).values, expected.values, rtol=1e-5, equal_nan=True)
+
+
+def test_ensemble_statistics_sketch_bounds(thetao):
+    stats = ensemble.ensemble_statistics(thetao, quantiles=[0.0, 0.5, 1.0], n_centroids=4).compute()
+    quantiles = stats["quantiles"]
+    np.testing.assert_allclose(quantiles.sel(quantile=0.0), stats["min"])
+    np.testing.assert_allclose(quantiles.sel(quantile=1.0), stats["max"])
+    median = quantiles.sel(quantile=0.5)
+    assert bool(((median >= stats["min"]) & (median <= stats["max"])).where(stats["count"] > 0, True).all())
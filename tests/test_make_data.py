@@ -0,0 +1,73 @@
+# tests/test_make_data.py
+
+import json
+import os
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from ACDtools import ard, make_data, util
+
+
+def test_write_ard_zarr_round_trip(synthetic_catalog, tmp_path):
+    ds = ard.load_ACCESS_ESM_ensemble(synthetic_catalog.search(variable_id="thetao"), use_cftime=True,
+                                      members={"realization": slice(1, 3)})
+    # dask-backed variables without a region dimension
+    ds["area"] = (("j", "i"), np.cos(np.deg2rad(ds["latitude"].values)))
+    ds = util.remove_encoding(ds.chunk({"member": 1, "time": 6, "lev": -1, "j": -1, "i": -1, "bnds": -1}))
+    assert ds["area"].chunks is not None and ds["lev_bnds"].chunks is not None
+    store = make_data.write_ard_zarr(ds, str(tmp_path / "ensemble.zarr"), region_sizes={"member": 1, "time": 12})
+    with open(store + make_data.ZARR_MANIFEST_SUFFIX) as file:
+        assert json.load(file)["complete"]
+    written = xr.open_zarr(store, use_cftime=True)
+    assert set(written.variables) == set(ds.variables)
+    for name in ds.variables:
+        xr.testing.assert_identical(written[name].load(), ds[name].load())
+
+
+def test_apply_write_profile_keepbits(synthetic_catalog):
+    ds = ard.load_ACCESS_ESM_ensemble(synthetic_catalog.search(variable_id="thetao"), use_cftime=True,
+                                      members={"realization": slice(1, 2)})
+    for profile in ("bitround-99", "bitround-99.9"):
+        profiled = make_data.apply_write_profile(ds, profile)
+        spec = make_data.WRITE_PROFILES[profile]
+        keepbits = profiled["thetao"].attrs["keepbits"]
+        assert keepbits >= spec["min_keepbits"] and profiled["thetao"].attrs["inflevel"] == spec["inflevel"]
+        error = abs(profiled["thetao"] - ds["thetao"]) / abs(ds["thetao"])
+        assert float(error.max()) <= 2.0 ** -(keepbits + 1)
+    # nothing significant in too small a sample - keep the full mantissa
+    assert make_data.keepbits_for_information(np.random.default_rng(0).random((2, 3)).astype("float32")) == 23
+
+
+def test_rechunk_ard_zarr_round_trip(synthetic_catalog, tmp_path):
+    ds = ard.load_ACCESS_ESM_ensemble(synthetic_catalog.search(variable_id="thetao"), use_cftime=True,
+                                      members={"realization": slice(1, 3)})
+    ds["area"] = (("j", "i"), np.cos(np.deg2rad(ds["latitude"].values)))
+    ds = util.remove_encoding(ds.chunk({"member": 1, "time": 1, "lev": -1, "j": -1, "i": -1, "bnds": -1}))
+    source = make_data.write_ard_zarr(ds, str(tmp_path / "base.zarr"), region_sizes={"member": 1, "time": 12})
+    targets = {str(tmp_path / "chunk4member.zarr"): {"member": -1, "time": 1, "lev": 4},
+               str(tmp_path / "chunk4time.zarr"): {"time": -1, "lev": 1, "member": 1},
+               str(tmp_path / "chunk4time4member.zarr"): {"time": -1, "member": -1, "lev": 1, "j": 3}}
+    # 20 kB is several source chunks of one member and time step (1.5 kB) but far below the 110 kB array
+    assert make_data.rechunk_ard_zarr(source, targets, max_mem=20_000) == list(targets)
+    assert not os.path.exists(source + ".rechunk-tmp.zarr")
+    for path, target in targets.items():
+        written = xr.open_zarr(path, use_cftime=True)
+        assert set(written.variables) == set(ds.variables)
+        expected_chunks = tuple(ds.sizes[dim] if target.get(dim, 1 if dim in ("member", "time") else -1) == -1
+                                else target.get(dim, 1) for dim in ds["thetao"].dims)
+        assert written["thetao"].encoding["chunks"] == expected_chunks
+        for name in ds.variables:
+            xr.testing.assert_identical(written[name].load(), ds[name].load())
+    with pytest.raises(ValueError, match="target chunks"):
+        make_data.rechunk_ard_zarr(source, {str(tmp_path / "too_big.zarr"): {"time": -1, "member": -1}}, max_mem=20_000)
+    with pytest.raises(ValueError, match="source chunks"):
+        make_data.rechunk_ard_zarr(source, {str(tmp_path / "small.zarr"): {"lev": 1}}, max_mem=1_000)
+
+
+def test_rechunk_plan_direct_only_when_chunks_nest():
+    # a write chunk of 4 straddles read chunks of 6, so it is staged through the intermediate
+    read_chunks, write_chunks_list, direct, int_chunks = make_data._rechunk_plan((24, 10), (6, 10), [(4, 10), (3, 10), (2, 10)], 4, 240)
+    assert read_chunks == (6, 10) and direct == [False, True, True]
+    assert int_chunks == (4, 10)
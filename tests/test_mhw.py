@@ -0,0 +1,180 @@
+# tests/test_mhw.py
+
+import os
+
+import intake
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from ACDtools import mhw
+from ACDtools.make_data import make_synthetic_ACCESS_ESM
+
+
+@pytest.fixture(scope="module")
+def sst(tmp_path_factory):
+    catalog_path = make_synthetic_ACCESS_ESM(str(tmp_path_factory.mktemp("daily")), variables=("tos",), n_members=1,
+                                             start_year=1980, n_years=12, frequency="day", nj=4, ni=5)
+    paths = intake.open_esm_datastore(catalog_path).df.sort_values("time_range")["path"]
+    with xr.open_mfdataset(list(paths), use_cftime=True) as ds:
+        return ds["tos"].load()
+
+
+def test_climatology_from_state_matches_climatology(sst):
+    state = mhw.climatology_state(sst, baseline=("1980", "1989")).compute()
+    clim = mhw.climatology(sst, baseline=("1980", "1989"))
+    from_state = mhw.climatology_from_state(state)
+    xr.testing.assert_allclose(from_state["seas"], clim["seas"], rtol=1e-6)
+    # with a decadal baseline the smoothed histogram threshold is within a bin width of the exact percentile
+    bin_width = (state["upper"] - state["lower"]) / state.attrs["n_bins"]
+    assert bool(((abs(from_state["thresh"] - clim["thresh"]) < bin_width) | clim["thresh"].isnull()).all())
+
+
+def test_update_climatology_state(sst, tmp_path):
+    path = str(tmp_path / "state.zarr")
+    state = mhw.climatology_state(sst, baseline=("1980", "1989"))
+    mhw.write_climatology_state(state, path)
+    # an interrupted swap leaves the previous state at <path>.bak
+    os.rename(path, path + ".bak")
+    updated = mhw.update_climatology_state(path, sst, baseline=("1981", "1990"))
+    assert not os.path.exists(path + ".bak") and not os.path.exists(path + ".tmp")
+    expected = mhw.climatology_state(sst, baseline=("1981", "1990"), edges=mhw.open_climatology_state(path)).compute()
+    np.testing.assert_array_equal(updated["count"].values, expected["count"].values)
+    np.testing.assert_array_equal(updated["n"].values, expected["n"].values)
+    np.testing.assert_allclose(updated["sum"].values, expected["sum"].values, rtol=1e-9)
+    assert (updated.attrs["baseline_start"], updated.attrs["baseline_end"]) == ("1981", "1990")
+
+
+@pytest.fixture(scope="module")
+def ar1_sst():
+    # seasonal cycle plus AR(1) noise, 3 years including a leap year
+    time = pd.date_range("2000-01-01", "2002-12-31", freq="D")
+    rng = np.random.default_rng(5)
+    noise = np.zeros((2, 3, time.size))
+    for t in range(1, time.size):
+        noise[..., t] = 0.9 * noise[..., t - 1] + rng.normal(0.0, 0.5, (2, 3))
+    seasonal = 15.0 + 3.0 * np.sin(2 * np.pi * np.asarray(time.dayofyear) / 365.25)
+    return xr.DataArray(seasonal + noise, dims=("j", "i", "time"), coords={"time": time}, name="sst")
+
+
+def _reference_events(exceed, min_duration, max_gap):
+    # the per-cell loop of the original marineHeatWaves code: runs of min_duration or more, then join across gaps
+    events, t = [], 0
+    while t < exceed.size:
+        if not exceed[t]:
+            t += 1
+            continue
+        start = t
+        while t < exceed.size and exceed[t]:
+            t += 1
+        if t - start >= min_duration:
+            events.append([start, t])
+    joined = []
+    for start, end in events:
+        if joined and max_gap and start - joined[-1][1] <= max_gap:
+            joined[-1][1] = end
+        else:
+            joined.append([start, end])
+    return joined
+
+
+def test_climatology_percentile_matches_pooled_window(ar1_sst):
+    clim = mhw.climatology(ar1_sst, window_half_width=5, percentile=90, smooth_width=0)
+    doy = mhw.day_of_year(ar1_sst.time)
+    values = ar1_sst.values
+    for d in (1, 59, 61, 200, 365, 366):
+        window = (np.flatnonzero(doy == d)[:, None] + np.arange(-5, 6)).ravel()
+        window = window[(window >= 0) & (window < doy.size)]
+        np.testing.assert_allclose(clim["thresh"].sel(doy=d).values, np.percentile(values[..., window], 90, axis=-1))
+        np.testing.assert_allclose(clim["seas"].sel(doy=d).values, values[..., window].mean(axis=-1))
+    # Feb 29 is the average of Feb 28 and Mar 1
+    np.testing.assert_allclose(clim["thresh"].sel(doy=60).values, clim["thresh"].sel(doy=[59, 61]).mean("doy").values)
+
+
+@pytest.mark.parametrize("min_duration, max_gap", [(5, 2), (3, 0), (2, 3)])
+def test_detect_matches_per_cell_loop(ar1_sst, min_duration, max_gap):
+    clim = mhw.climatology(ar1_sst, percentile=80)
+    result = mhw.detect(ar1_sst.chunk({"j": 1}), clim, min_duration=min_duration, max_gap=max_gap).compute()
+    doy = mhw.day_of_year(ar1_sst.time)
+    n_events = 0
+    for j in range(ar1_sst.sizes["j"]):
+        for i in range(ar1_sst.sizes["i"]):
+            temp = ar1_sst.values[j, i]
+            seas, thresh = clim["seas"].values[j, i, doy - 1], clim["thresh"].values[j, i, doy - 1]
+            expected = np.zeros(temp.size, dtype=bool)
+            for start, end in _reference_events(temp > thresh, min_duration, max_gap):
+                expected[start:end] = True
+            np.testing.assert_array_equal(result["is_mhw"].values[j, i], expected)
+            np.testing.assert_allclose(result["anomaly"].values[j, i], temp - seas)
+            n_events += len(_reference_events(temp > thresh, min_duration, max_gap))
+    assert n_events > 0
+
+
+def test_event_bounds_and_category_match_per_cell_loop(ar1_sst):
+    clim = mhw.climatology(ar1_sst, percentile=80)
+    doy = mhw.day_of_year(ar1_sst.time)
+    table = mhw._event_table(ar1_sst.values, clim["seas"].values, clim["thresh"].values, doy, min_duration=5, max_gap=2,
+                             severity_filter=False, min_severity=1.0, min_delta=0.1)
+    rows = []
+    for cell, (j, i) in enumerate(np.ndindex(2, 3)):
+        temp = ar1_sst.values[j, i]
+        seas, thresh = clim["seas"].values[j, i, doy - 1], clim["thresh"].values[j, i, doy - 1]
+        for start, end in _reference_events(temp > thresh, 5, 2):
+            peak = start + np.argmax(temp[start:end] - seas[start:end])
+            category = int(np.clip(np.floor((temp[peak] - seas[peak]) / (thresh[peak] - seas[peak])), 1, 4))
+            rows.append((cell, start, end - 1, end - start, peak, category))
+    assert rows
+    assert list(zip(table["cell_in_block"], table["start_index"], table["end_index"], table["duration"],
+                    table["peak_index"], table["category"])) == rows
+
+
+def test_detect_joins_events_across_max_gap():
+    # two 5-day runs above a threshold of 1, separated by gaps of 2 and then 3 days
+    temp = np.zeros(40)
+    temp[[*range(5, 10), *range(12, 17), *range(20, 25)]] = 2.0
+    sst = xr.DataArray(temp[None, :], dims=("i", "time"), coords={"time": pd.date_range("2001-01-01", periods=40)})
+    clim = xr.Dataset({"seas": (("i", "doy"), np.zeros((1, 366))), "thresh": (("i", "doy"), np.ones((1, 366)))},
+                      coords={"doy": np.arange(1, 367)})
+    is_mhw = mhw.detect(sst, clim, min_duration=5, max_gap=2)["is_mhw"].values[0]
+    assert np.flatnonzero(is_mhw).tolist() == [*range(5, 17), *range(20, 25)]
+    is_mhw = mhw.detect(sst, clim, min_duration=5, max_gap=0)["is_mhw"].values[0]
+    assert np.flatnonzero(is_mhw).tolist() == [*range(5, 10), *range(12, 17), *range(20, 25)]
+
+
+def _count_runs(mask):
+    return int(np.sum(np.diff(mask.astype(np.int8), axis=-1, prepend=0) == 1))
+
+
+def test_event_catalogue_round_trip(ar1_sst, tmp_path):
+    clim = mhw.climatology(ar1_sst, percentile=80)
+    path = str(tmp_path / "events.parquet")
+    n_events = mhw.event_catalogue(ar1_sst.chunk({"j": 1}), clim, path, min_duration=5, max_gap=2)
+    events = mhw.open_event_catalogue(path)
+    is_mhw = mhw.detect(ar1_sst, clim, min_duration=5, max_gap=2)["is_mhw"].values
+    assert len(events) == n_events == _count_runs(is_mhw) > 0
+    assert events["duration"].sum() == is_mhw.sum()
+    for row in events.itertuples():
+        assert is_mhw[row.j_index, row.i_index, row.start_index:row.end_index + 1].all()
+        assert ar1_sst.time.values[row.start_index] == row.time_start
+    # the severity filter keeps exactly the events at or above min_severity
+    n_severe = mhw.event_catalogue(ar1_sst, clim, path, severity_filter=True, min_severity=1.5)
+    severe = mhw.open_event_catalogue(path)
+    assert len(severe) == n_severe == (events["severity_max"] >= 1.5).sum()
+    assert (severe["severity_max"] >= 1.5).all()
+
+
+def test_event_catalogue_all_nan_and_empty_blocks(ar1_sst, tmp_path):
+    clim = mhw.climatology(ar1_sst, percentile=80)
+    sst = ar1_sst.copy()
+    sst[0] = np.nan  # a land row
+    sst[1, 0] = clim["seas"].values[1, 0, mhw.day_of_year(sst.time) - 1]  # a cell that never exceeds its threshold
+    path = str(tmp_path / "events.parquet")
+    n_events = mhw.event_catalogue(sst.chunk({"j": 1, "i": 1}), clim, path)
+    events = mhw.open_event_catalogue(path)
+    assert len(events) == n_events > 0
+    assert set(zip(events["j_index"], events["i_index"])) <= {(1, 1), (1, 2)}
+    # no events at all still gives a readable, typed catalogue
+    assert mhw.event_catalogue(sst.isel(j=[0]), clim.isel(j=[0]), path) == 0
+    empty = mhw.open_event_catalogue(path)
+    assert len(empty) == 0 and "category_name" in empty.columns
@@ -0,0 +1,113 @@
+# tests/test_ocean.py
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from ACDtools import ard, ocean
+
+
+def _baseline_interpolate_target_depth(da, target, depth_coord):
+    # interpolate_oxygen_target_depth before the single-pass kernel
+    mask = da <= target
+    just_below_target = mask * ~(mask.shift({depth_coord: 1}, fill_value=False))
+    just_above_target = ~mask * (mask.shift({depth_coord: -1}, fill_value=False))
+    depth_A = just_above_target[depth_coord].where(just_above_target).min(depth_coord)
+    depth_B = just_below_target[depth_coord].where(just_below_target).min(depth_coord)
+    value_A = da.where(just_above_target).min(depth_coord)
+    value_B = da.where(just_below_target).min(depth_coord)
+    return depth_A + ((target - value_A) / (value_B - value_A)) * (depth_B - depth_A)
+
+
+@pytest.fixture(scope="module")
+def ensemble(synthetic_catalog):
+    # o2 and thetao are in different realms, so they are loaded separately
+    o2 = ard.load_ACCESS_ESM_ensemble(synthetic_catalog.search(variable_id="o2"), use_cftime=True)
+    thetao = ard.load_ACCESS_ESM_ensemble(synthetic_catalog.search(variable_id="thetao"), use_cftime=True)
+    return xr.Dataset({"o2": o2["o2"], "thetao": thetao["thetao"], "lev_bnds": thetao["lev_bnds"]}).isel(
+        member=slice(0, 3), time=slice(0, 4))
+
+
+@pytest.mark.parametrize("variable_id, interpolate", [("o2", ocean.interpolate_oxygen_target_depth),
+                                                      ("thetao", ocean.interpolate_isotherm_depth)])
+def test_interpolate_target_depth_matches_baseline(ensemble, variable_id, interpolate):
+    da = ensemble[variable_id]
+    target = float(np.nanmedian(da.values))
+    result = interpolate(da, target=target, depth_coord="lev")
+    # lazy - nothing is computed until asked for
+    assert result.chunks is not None
+    expected = _baseline_interpolate_target_depth(da, target, "lev")
+    # the baseline takes the bounding values over every crossing and counts a column that starts below the target
+    # as crossing at the surface, so compare the columns that start above the target and cross it once
+    single = (ocean.depth_crossings(da, target, depth_coord="lev")["crossing_count"] == 1) & (da.isel(lev=0) > target)
+    assert bool(single.any())
+    xr.testing.assert_allclose(result.where(single).compute(), expected.where(single).compute())
+
+
+def _baseline_layer_statistics(da, var_name, layer_depth=300, depth_name='pres'):
+    # layer_statistics before the fused pass
+    layer = da.where(da[depth_name] <= layer_depth, drop=True)
+    layer_stats_ds = xr.Dataset({var_name + '_mean': layer.mean(depth_name), var_name + '_min': layer.min(depth_name),
+                                 var_name + '_max': layer.max(depth_name)})
+    dz = layer[depth_name].diff(depth_name)
+    layer_sum_integral = (layer * dz).sum(dim=depth_name)
+    layer_stats_ds[var_name + '_layer_sum_integral'] = layer_sum_integral.where(layer_sum_integral != 0)
+    layer_stats_ds[var_name + '_layer_trapezoidal_integral'] = layer.integrate(depth_name)
+    return layer_stats_ds
+
+
+def test_layer_statistics_matches_baseline(ensemble):
+    da = ensemble["o2"].rename(lev="pres")
+    stats = ocean.layer_statistics(da, "o2", layer_depth=[100, 300, 700]).compute()
+    for layer_depth in (100, 300, 700):
+        expected = _baseline_layer_statistics(da, "o2", layer_depth=layer_depth).compute()
+        xr.testing.assert_allclose(stats.sel(layer=layer_depth, drop=True), expected)
+    xr.testing.assert_allclose(ocean.layer_statistics(da, "o2").compute(), _baseline_layer_statistics(da, "o2").compute())
+
+
+def test_layer_statistics_depth_bnds(ensemble):
+    da = ensemble["o2"]
+    # lev_bnds as the loaders can return it, repeated along time and member
+    lev_bnds = ensemble["lev_bnds"].expand_dims(member=da["member"], time=da["time"]).transpose("time", "member", "lev", "bnds")
+    stats = ocean.layer_statistics(da, "o2", layer_depth=300, depth_name="lev", depth_bnds=lev_bnds.chunk()).compute()
+    assert set(stats.dims) == set(da.dims) - {"lev"}
+    layer = da.where(da["lev"] <= 300, drop=True)
+    thickness = (ensemble["lev_bnds"].isel(bnds=1) - ensemble["lev_bnds"].isel(bnds=0)).sel(lev=layer["lev"])
+    expected = (layer * thickness).sum("lev")
+    xr.testing.assert_allclose(stats["o2_layer_sum_integral"], expected.where(expected != 0).compute())
+    with pytest.raises(ValueError):
+        ocean.layer_statistics(da, "o2", depth_name="lev", depth_bnds=ensemble["lev_bnds"].transpose("bnds", "lev"))
+
+
+def _baseline_threshold_depth(da, chosen_threshold=90, depth_name='pres'):
+    # threshold_depth before the single-pass kernel
+    mask = da <= chosen_threshold
+    first_depth_below_threshold = da[depth_name].where(mask).min(dim=depth_name)
+    first_depth_below_threshold = first_depth_below_threshold.where(mask.any(dim=depth_name), np.nan)
+    count_drops_below_threshold = (mask.astype(int).diff(dim=depth_name) == 1).sum(dim=depth_name)
+    return first_depth_below_threshold, count_drops_below_threshold
+
+
+@pytest.mark.parametrize("variable_id", ["o2", "thetao"])
+def test_threshold_depth_matches_baseline(ensemble, variable_id):
+    da = ensemble[variable_id]
+    threshold = float(np.nanmedian(da.values))
+    first_depth, count = ocean.threshold_depth(da, chosen_threshold=threshold, depth_name="lev")
+    expected_first_depth, expected_count = _baseline_threshold_depth(da, chosen_threshold=threshold, depth_name="lev")
+    xr.testing.assert_allclose(first_depth.compute(), expected_first_depth.compute())
+    np.testing.assert_array_equal(count.values, expected_count.transpose(*count.dims).values)
+
+
+def test_depth_crossings_several_targets(ensemble):
+    da = ensemble["thetao"]
+    targets = [float(value) for value in np.nanquantile(da.values, [0.25, 0.5, 0.75])]
+    crossings = ocean.depth_crossings(da, targets, depth_coord="lev").compute()
+    assert list(crossings["target"].values) == targets
+    for target in targets:
+        # each target of the single traversal matches the baseline one target at a time
+        first_depth, count = _baseline_threshold_depth(da, chosen_threshold=target, depth_name="lev")
+        selected = crossings.sel(target=target, drop=True)
+        xr.testing.assert_allclose(selected["first_depth"], first_depth.compute())
+        np.testing.assert_array_equal(selected["crossing_count"].values, count.transpose(*selected["crossing_count"].dims).values)
+        xr.testing.assert_allclose(selected["interpolated_depth"],
+                                   ocean.interpolate_isotherm_depth(da, target=target, depth_coord="lev").compute())
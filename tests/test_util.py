@@ -0,0 +1,119 @@
+# tests/test_util.py
+
+import os
+
+import intake
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from ACDtools import util
+
+
+def _baseline_align_lon(ds, lon_name_list):
+    # align_lon before the rotation change
+    for lon_name in lon_name_list:
+        ds_attrs = ds[lon_name].attrs
+        ds = ds.assign_coords({lon_name: (ds[lon_name] + 360) % 360}).sortby(lon_name)
+        ds[lon_name].attrs = ds_attrs
+    return ds
+
+
+def _baseline_convert_longitude_360_2_180(da, lon_name="longitude"):
+    # convert_longitude_360_2_180 before the rotation change
+    da = da.assign_coords(**{lon_name: ((da[lon_name] + 180) % 360) - 180})
+    return da.sortby(lon_name)
+
+
+def _regular_grid(lon):
+    rng = np.random.default_rng(0)
+    return xr.Dataset({"sst": (("time", "lon"), rng.random((3, lon.size)))},
+                      coords={"lon": ("lon", lon, {"units": "degrees_east"})}).chunk({"lon": 24})
+
+
+@pytest.mark.parametrize("lon", [np.arange(0.0, 360.0, 2.5), np.arange(-180.0, 180.0, 2.5), np.arange(-100.0, 260.0, 2.5)])
+def test_rotate_longitude_matches_sortby(lon):
+    ds = _regular_grid(lon)
+    for rotated, baseline in ((util.convert_longitude_360_2_180(ds, "lon"), _baseline_convert_longitude_360_2_180(ds, "lon")),
+                              (util.align_lon(ds, ["lon"]), _baseline_align_lon(ds, ["lon"]))):
+        xr.testing.assert_allclose(rotated, baseline)
+        assert rotated["lon"].attrs == ds["lon"].attrs
+        # a rotation splits at most the one block holding the seam
+        assert len(rotated["sst"].chunks[1]) <= len(ds["sst"].chunks[1]) + 1
+
+
+def test_no_rotation_in_range():
+    ds = _regular_grid(np.arange(-180.0, 180.0, 2.5))
+    converted = util.convert_longitude_360_2_180(ds, "lon")
+    xr.testing.assert_identical(converted, ds)
+    assert converted["sst"].chunks == ds["sst"].chunks
+
+
+def test_rotate_curvilinear_longitude_matches_sortby():
+    # a curvilinear grid with the x dimension named nlon, every row a cyclic longitude
+    nlat, nlon = 4, 36
+    row = np.arange(80.0, 440.0, 10.0)
+    lon = (row[None, :] + np.linspace(0.0, 3.0, nlat)[:, None]) % 360
+    lat = np.broadcast_to(np.linspace(-60.0, 60.0, nlat)[:, None], (nlat, nlon))
+    rng = np.random.default_rng(1)
+    ds = xr.Dataset({"sst": (("nlat", "nlon"), rng.random((nlat, nlon)))},
+                    coords={"longitude": (("nlat", "nlon"), lon), "latitude": (("nlat", "nlon"), lat)}).chunk({"nlon": 12})
+    for lon_min, rotate in ((-180, lambda ds: util.convert_longitude_360_2_180(ds, x_dim="nlon")),
+                            (0, lambda ds: util.align_lon(ds, ["longitude"], x_dim="nlon"))):
+        rotated = rotate(ds)
+        # the baseline sort, along nlon by the longitude of one row
+        wrapped = (ds["longitude"] - lon_min) % 360 + lon_min
+        baseline = ds.assign_coords(longitude=wrapped, key=("nlon", wrapped.values[0])).sortby("key").drop_vars("key")
+        xr.testing.assert_allclose(rotated, baseline)
+        assert rotated["longitude"].min() >= lon_min and rotated["longitude"].max() < lon_min + 360
+    with pytest.raises(ValueError):
+        util.convert_longitude_360_2_180(ds, x_dim="x")
+
+
+@pytest.mark.parametrize("query", [{"variable_id": "thetao"}, {"variable_id": ["thetao", "o2"], "member_id": "r1i1p1f1"},
+                                   {"member_id": "r1.*", "time_range": "1851.*"}, {"member_id": "r99i1p1f1"},
+                                   {"variable_id": "o2", "realm": "ocean"}])
+def test_esm_datastore_index_matches_search(synthetic_catalog, query):
+    index = util.ESMDatastoreIndex(synthetic_catalog)
+    expected = synthetic_catalog.search(**query)
+    result = index.search(**query)
+    assert result.df.equals(expected.df)
+    assert result._requested_variables == expected._requested_variables
+    assert sorted(index.unique("member_id")["member_id"]) == sorted(synthetic_catalog.df["member_id"].unique())
+
+
+def test_esm_datastore_index_empty_search(synthetic_catalog):
+    result = util.ESMDatastoreIndex(synthetic_catalog).search()
+    assert result.df.equals(synthetic_catalog.df)
+
+
+def _plain(df):
+    # the snapshot stores strings as categoricals and missing values as NaN
+    df = df.astype(object)
+    return df.where(df.notna(), None)
+
+
+def test_esm_datastore_snapshot(tmp_path, monkeypatch):
+    from ACDtools.make_data import make_synthetic_ACCESS_ESM
+    catalog_path = make_synthetic_ACCESS_ESM(str(tmp_path / "synthetic"), variables=("thetao", "o2"), n_members=2,
+                                             nj=4, ni=5, nlev=3)
+    source = intake.open_esm_datastore(catalog_path)
+    snapshot_dir = str(tmp_path / "snapshots")
+    built = util.load_esm_datastore_snapshot("synthetic", catalog_path, snapshot_dir=snapshot_dir)
+    pd.testing.assert_frame_equal(_plain(built.df), _plain(source.df))
+    # a reload reads the snapshot, never the source JSON catalog
+    open_esm_datastore = intake.open_esm_datastore
+    def open_snapshot_only(obj, *args, **kwargs):
+        assert not isinstance(obj, str), f"the source catalog {obj} was read"
+        return open_esm_datastore(obj, *args, **kwargs)
+    monkeypatch.setattr(util.intake, "open_esm_datastore", open_snapshot_only)
+    reloaded = util.load_esm_datastore_snapshot("synthetic", snapshot_dir=snapshot_dir)
+    pd.testing.assert_frame_equal(_plain(reloaded.df), _plain(source.df))
+    assert reloaded.esmcat.aggregation_control == source.esmcat.aggregation_control
+    assert reloaded.search(variable_id="thetao", member_id="r1i1p1f1").df["path"].tolist() == \
+        source.search(variable_id="thetao", member_id="r1i1p1f1").df["path"].tolist()
+    # an unreachable source catalog still loads the snapshot
+    os.rename(catalog_path, catalog_path + ".moved")
+    pd.testing.assert_frame_equal(_plain(util.load_esm_datastore_snapshot("synthetic", snapshot_dir=snapshot_dir).df),
+                                  _plain(source.df))